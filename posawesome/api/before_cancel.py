@@ -6,6 +6,7 @@ Minimal custom logic - relies on ERPNext's built-in cancellation workflow.
 from __future__ import unicode_literals
 import frappe
 from frappe import _
+from posawesome.api.sales_invoice import update_returned_balances
 
 
 def before_cancel(doc, method):
@@ -14,9 +15,15 @@ def before_cancel(doc, method):
     ERPNext handles most cancellation validations and business logic.
     """
     # Only run for POS invoices
-    if not getattr(doc, 'is_pos', False):
-        return
+    if getattr(doc, 'is_pos', False):
+        _validate_shift_open(doc)
 
+    # Release the returned balances booked on the original invoice (all returns, POS or not)
+    update_returned_balances(doc, sign=-1)
+
+
+def _validate_shift_open(doc):
+    """Block cancellation of POS invoices from a closed shift."""
     # Only essential POS-specific check
     if doc.get('posa_pos_opening_shift'):
         shift_status = frappe.get_cached_value(
@@ -18,6 +18,7 @@ import json
 import frappe
 from frappe import _
 from frappe.utils import flt
+from posawesome.api import search_backend
 
 
 # =============================================================================
@@ -339,7 +340,7 @@ def get_many_customers(pos_profile=None, search_term=None, limit=50, offset=0):
             # Use SQL query for OR search conditions
             # Build WHERE conditions
             where_conditions = ["disabled = 0"]
-            where_params = []
+            where_params = {}
 
             # Add customer group filter if exists
             if "customer_group" in filters:
@@ -347,16 +348,23 @@ def get_many_customers(pos_profile=None, search_term=None, limit=50, offset=0):
                     operator = filters["customer_group"][0]
                     values = filters["customer_group"][1]
                     if operator == "in" and isinstance(values, list):
-                        placeholders = ", ".join(["%s"] * len(values))
+                        placeholders = ", ".join(
+                            [f"%(customer_group_{i})s" for i in range(len(values))])
                         where_conditions.append(f"customer_group IN ({placeholders})")
-                        where_params.extend(values)
-
-            # Add OR search conditions
-            search_pattern = f"%{search_term}%"
-            where_conditions.append(
-                "(customer_name LIKE %s OR name LIKE %s OR mobile_no LIKE %s)"
-            )
-            where_params.extend([search_pattern, search_pattern, search_pattern])
+                        for i, value in enumerate(values):
+                            where_params[f"customer_group_{i}"] = value
+
+            # Search through the configured backend (FULLTEXT / ngram index, search_backend.py)
+            # Falls back to OR LIKE conditions when the backend cannot answer
+            search_condition = search_backend.get_search_condition(
+                "Customer", search_term, where_params)
+            if search_condition:
+                where_conditions.append(search_condition)
+            else:
+                where_conditions.append(
+                    "(customer_name LIKE %(search)s OR name LIKE %(search)s OR mobile_no LIKE %(search)s)"
+                )
+                where_params["search"] = f"%{search_term}%"
 
             where_clause = " AND ".join(where_conditions)
 
@@ -379,7 +387,7 @@ def get_many_customers(pos_profile=None, search_term=None, limit=50, offset=0):
                 ORDER BY customer_name ASC
                 LIMIT {limit_int} OFFSET {offset_int}
                 """,
-                tuple(where_params),
+                where_params,
                 as_dict=True
             )
         else:
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Customer Attribute Cache
+
+Customer attributes used by offer matching (customer_group, territory,
+loyalty program / tier), resolved once per evaluation instead of one
+frappe.get_value per offer:
+- Distinct customers are fetched in one IN query
+- Resolved attributes are kept in a process-local LRU (per site, generation_lru.py)
+- Invalidation: Customer on_update (when an attribute changed) / on_trash /
+  after_rename bump a Redis generation counter after commit; every worker
+  drops its LRU when the generation it sees changes
+"""
+
+from __future__ import unicode_literals
+import frappe
+from posawesome.api.generation_lru import GenerationLRU
+
+
+GENERATION_KEY = "posa_customer_attributes_generation"
+
+# Customer fields exposed to offer matching
+CUSTOMER_ATTRIBUTES = ["customer_group", "territory", "loyalty_program", "loyalty_program_tier"]
+
+# Max customers kept per site in each worker process
+LRU_SIZE = 4096
+
+# customer -> {attribute: value}
+_attributes = GenerationLRU(GENERATION_KEY, LRU_SIZE)
+
+
+# =============================================================================
+# RESOLVER
+# =============================================================================
+
+def get_customer_attributes(customer):
+    """
+    Offer attributes of one customer.
+
+    Returns:
+        frappe._dict: CUSTOMER_ATTRIBUTES values (all None for unknown customers)
+    """
+    if not customer:
+        return frappe._dict.fromkeys(CUSTOMER_ATTRIBUTES)
+    return get_customers_attributes([customer])[customer]
+
+
+def get_customers_attributes(customers):
+    """
+    Offer attributes of several customers in one query.
+
+    Args:
+        customers: iterable of Customer names (empty values are ignored)
+
+    Returns:
+        dict: {customer: frappe._dict of CUSTOMER_ATTRIBUTES}, keyed by the requested names
+    """
+    wanted = {customer for customer in customers if customer}
+    cached = _attributes.get_many(wanted, _load_customer_attributes)
+
+    # Deleted / unknown customers have no attributes (not cached)
+    return {
+        customer: frappe._dict(cached[customer]) if customer in cached
+        else frappe._dict.fromkeys(CUSTOMER_ATTRIBUTES)
+        for customer in wanted
+    }
+
+
+def _load_customer_attributes(customers):
+    return {
+        row.name: {field: row.get(field) for field in CUSTOMER_ATTRIBUTES}
+        for row in frappe.db.sql("""
+            SELECT name, {fields}
+            FROM `tabCustomer`
+            WHERE name IN %(names)s
+        """.format(fields=", ".join("`{0}`".format(field) for field in CUSTOMER_ATTRIBUTES)),
+            {"names": tuple(customers)}, as_dict=1)
+    }
+
+
+# =============================================================================
+# INVALIDATION (Customer doc_events)
+# =============================================================================
+
+def on_customer_change(doc, method=None):
+    """Customer on_update / on_trash: invalidate when an attribute changed or the row is gone."""
+    if method == "on_update" and not any(
+            doc.has_value_changed(field) for field in CUSTOMER_ATTRIBUTES):
+        return
+
+    invalidate()
+
+
+def on_rename(doc, method=None, old_name=None, new_name=None, merge=False):
+    """Customer after_rename: the old id no longer resolves."""
+    invalidate()
+
+
+def invalidate():
+    """Bump the generation once the transaction is committed (all workers drop their LRU)."""
+    _attributes.invalidate()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Customer Name Resolver
+
+Resolves Customer.customer_name for a whole list of invoices at once
+(print list, settlement list, closing shift transactions):
+- Distinct customers are fetched in one IN query, never one query per row
+- Resolved names are kept in a process-local LRU (per site, generation_lru.py)
+- Invalidation: Customer on_update / on_trash / after_rename bump a Redis
+  generation counter after commit; every worker drops its LRU when the
+  generation it sees changes (one Redis GET per resolve call)
+"""
+
+from __future__ import unicode_literals
+import frappe
+from posawesome.api.generation_lru import GenerationLRU
+
+
+GENERATION_KEY = "posa_customer_names_generation"
+
+# Max customers kept per site in each worker process
+LRU_SIZE = 4096
+
+# customer -> customer_name
+_names = GenerationLRU(GENERATION_KEY, LRU_SIZE)
+
+
+# =============================================================================
+# RESOLVER
+# =============================================================================
+
+def get_customer_names(customers):
+    """
+    Resolve customer names in one query.
+
+    Args:
+        customers: iterable of Customer names (empty values are ignored)
+
+    Returns:
+        dict: {customer: customer_name}; unknown customers map to their own name
+    """
+    wanted = {customer for customer in customers if customer}
+    result = _names.get_many(wanted, _load_customer_names)
+
+    # Deleted / unknown customers fall back to the id (not cached)
+    for customer in wanted:
+        result.setdefault(customer, customer)
+
+    return result
+
+
+def _load_customer_names(customers):
+    return {
+        row.name: row.customer_name or row.name
+        for row in frappe.db.sql("""
+            SELECT name, customer_name
+            FROM `tabCustomer`
+            WHERE name IN %(names)s
+        """, {"names": tuple(customers)}, as_dict=1)
+    }
+
+
+# =============================================================================
+# INVALIDATION (Customer doc_events)
+# =============================================================================
+
+def on_customer_change(doc, method=None):
+    """Customer on_update / on_trash: invalidate when the name changed or the row is gone."""
+    if method == "on_update" and not doc.has_value_changed("customer_name"):
+        return
+
+    invalidate()
+
+
+def on_rename(doc, method=None, old_name=None, new_name=None, merge=False):
+    """Customer after_rename: the old id no longer resolves."""
+    invalidate()
+
+
+def invalidate():
+    """Bump the generation once the transaction is committed (all workers drop their LRU)."""
+    _names.invalidate()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Generation LRU
+
+Process-local LRU of database lookups (per site), shared by the customer
+resolvers (customer_names, customer_attributes):
+- Keys are looked up in bulk; only the missing ones are loaded, in one call
+- Invalidation: invalidate() bumps a Redis generation counter after commit;
+  every worker drops its LRU when the generation it sees changes (one Redis
+  GET per lookup)
+- Keys are matched case-insensitively, like document names under the
+  database collation: "acme" and "ACME" resolve to the same row
+"""
+
+from __future__ import unicode_literals
+from collections import OrderedDict
+import frappe
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe, decode as _decode
+
+
+class GenerationLRU:
+    """LRU of one lookup, invalidated through the Redis key generation_key."""
+
+    def __init__(self, generation_key, size=4096):
+        self.generation_key = generation_key
+        self.size = size
+        # {site: {"generation": <redis generation>, "values": OrderedDict(folded key -> value)}}
+        self._sites = {}
+
+    def get_many(self, keys, load):
+        """
+        Cached values of several keys.
+
+        Args:
+            keys: iterable of keys (empty values are ignored)
+            load: callable(missing keys) -> {database key: value}
+
+        Returns:
+            dict: {requested key: value}; keys unknown to load() are left out (not cached)
+        """
+        wanted = {key for key in keys if key}
+        if not wanted:
+            return {}
+
+        values = self._get_site_cache()
+        result = {}
+        missing = []
+        for key in wanted:
+            folded = _fold(key)
+            if folded in values:
+                values.move_to_end(folded)
+                result[key] = values[folded]
+            else:
+                missing.append(key)
+
+        if missing:
+            loaded = {_fold(name): value for name, value in load(missing).items()}
+            for key in missing:
+                folded = _fold(key)
+                if folded in loaded:
+                    values[folded] = result[key] = loaded[folded]
+
+            while len(values) > self.size:
+                values.popitem(last=False)
+
+        return result
+
+    def invalidate(self):
+        """Bump the generation once the transaction is committed (all workers drop their LRU)."""
+        self._sites.pop(frappe.local.site, None)
+        frappe.db.after_commit.add(self._bump_generation)
+
+    def _get_site_cache(self):
+        """LRU of the current site, dropped when the Redis generation moved."""
+        try:
+            generation = _decode(_pipe().get(_key(self.generation_key)).execute()[0])
+        except Exception:
+            # Graceful degradation - Redis unavailable, don't trust the LRU (no logging needed)
+            return OrderedDict()
+
+        site_cache = self._sites.get(frappe.local.site)
+        if not site_cache or site_cache["generation"] != generation:
+            site_cache = {"generation": generation, "values": OrderedDict()}
+            self._sites[frappe.local.site] = site_cache
+
+        return site_cache["values"]
+
+    def _bump_generation(self):
+        try:
+            _pipe().incr(_key(self.generation_key)).execute()
+        except Exception:
+            frappe.log_error("[[generation_lru.py]] _bump_generation")
+
+
+def _fold(key):
+    return key.lower() if isinstance(key, str) else key
@@ -35,17 +35,51 @@ FRAPPE API PATTERN - How Data Flows:
 """
 
 from __future__ import unicode_literals
+import base64
 import json
 import frappe
 from frappe import _
-from frappe.utils import flt
+from frappe.utils import add_days, add_to_date, cint, flt, get_datetime, now_datetime
+from posawesome.api import item_index, search_backend
+
+# Columns + JOINs shared by get_items(), search_items() and the keyed barcode lookup
+# Parameters: %(price_list)s, %(warehouse)s
+ITEM_COLUMNS = """
+                `tabItem`.name as item_code,
+                `tabItem`.item_name,
+                `tabItem`.item_group,
+                `tabItem`.brand,
+                `tabItem`.stock_uom,
+                `tabItem`.image,
+                `tabItem Price`.price_list_rate,
+                `tabItem Price`.price_list_rate as rate,
+                `tabItem Price`.price_list_rate as base_rate,
+                `tabItem Price`.currency,
+                COALESCE(`tabBin`.actual_qty, 0) as actual_qty"""
+
+ITEM_FROM = """
+            FROM `tabItem`
+            LEFT JOIN `tabItem Price`
+                ON `tabItem`.name = `tabItem Price`.item_code
+                AND `tabItem Price`.selling = 1
+                AND `tabItem Price`.price_list = %(price_list)s
+                AND (`tabItem Price`.valid_from IS NULL OR `tabItem Price`.valid_from <= CURDATE())
+                AND (`tabItem Price`.valid_upto IS NULL OR `tabItem Price`.valid_upto >= CURDATE())
+            LEFT JOIN `tabBin`
+                ON `tabItem`.name = `tabBin`.item_code
+                AND `tabBin`.warehouse = %(warehouse)s"""
+
+ITEM_SELECT = """
+            SELECT""" + ITEM_COLUMNS + ITEM_FROM
 
 
 @frappe.whitelist()
 def get_items(pos_profile, price_list=None, item_group="", search_value="", customer=None, include_zero_stock=False):
     """
     Search items by name, code, or barcode.
-    Uses LIKE search for flexibility.
+    Searches go through the configured search backend (search_backend.py): the catalog
+    index (item_index.py) or a FULLTEXT match, otherwise (and for searches shorter
+    than 3 characters) a LIKE search is used.
 
     Item Group filtering logic:
     - If item_group specified (not "ALL"): Shows items from that specific group
@@ -62,147 +96,39 @@ def get_items(pos_profile, price_list=None, item_group="", search_value="", cust
     - If POS Profile.posa_hide_zero_price_items = 0 or NULL: Shows all items regardless of price
     """
     try:
-        # Validate pos_profile is not empty/null
-        if not pos_profile:
-            frappe.throw(_("POS Profile is required"))
-
-        # FRAPPE STANDARD: Handle string (JSON) or dict parameter
-        # Frontend sends dict, Frappe auto-parses JSON, but we handle both cases
-        if isinstance(pos_profile, str):
-            # Check if string is empty or whitespace
-            if not pos_profile.strip():
-                frappe.throw(_("POS Profile is required"))
-            try:
-                pos_profile = json.loads(pos_profile)
-            except (json.JSONDecodeError, ValueError):
-                # If JSON parsing fails, treat it as POS Profile name
-                # But first validate it's not empty
-                if not pos_profile or not pos_profile.strip():
-                    frappe.throw(_("POS Profile is required"))
-                pos_profile = frappe.get_cached_doc(
-                    "POS Profile", pos_profile).as_dict()
-
-        # If pos_profile is dict, we already have the data from frontend
-        # Frontend sends 23 fields which is enough for get_items()
-        # We DON'T re-fetch here because we only need basic fields
-
-        # Validate parameter type
-        if not isinstance(pos_profile, dict):
-            frappe.throw(_("Invalid POS Profile data"))
-
-        # Validate pos_profile has required 'name' field
-        if not pos_profile.get('name'):
-            frappe.throw(_("POS Profile name is required"))
-
-        # CRITICAL: Frontend only sends loaded fields (23 fields), not all DB fields
-        # We use the minimal data sent from frontend for this method since we only need:
-        # name, warehouse, selling_price_list, posa_fetch_zero_qty, posa_hide_zero_price_items, item_groups
-
-        if not price_list:
-            price_list = pos_profile.get("selling_price_list")
-
-        warehouse = pos_profile.get("warehouse", "")
-
-        # Check POS Profile setting for fetching zero qty items
-        posa_fetch_zero_qty = pos_profile.get("posa_fetch_zero_qty", 0)
-
-        # Check POS Profile setting for hiding zero price items
-        posa_hide_zero_price_items = pos_profile.get(
-            "posa_hide_zero_price_items", 0)
-
-        # Build WHERE conditions
-        where_conditions = [
-            "`tabItem`.disabled = 0",
-            "`tabItem`.is_sales_item = 1",
-            "`tabItem`.has_variants = 0"
-        ]
-
-        params = {
-            "price_list": price_list,
-            "warehouse": warehouse
-        }
-
-        # Get allowed item groups from POS Profile
-        allowed_item_groups = []
-        if pos_profile.get("item_groups"):
-            # POS Profile has item_groups child table
-            # Handle both formats: list of strings or list of dicts (for backward compatibility)
-            for ig in pos_profile.get("item_groups"):
-                if isinstance(ig, dict):
-                    # Old format: list of dictionaries with 'item_group' key
-                    if ig.get("item_group"):
-                        allowed_item_groups.append(ig.get("item_group"))
-                elif isinstance(ig, str):
-                    # New format: list of strings (item_group names directly)
-                    allowed_item_groups.append(ig)
-
-        # Add item_group filter based on selection and allowed groups
-        if item_group and item_group.strip() and item_group != "ALL":
-            # User selected specific group - filter by it
-            where_conditions.append("`tabItem`.item_group LIKE %(item_group)s")
-            params["item_group"] = f"%{item_group}%"
-        elif allowed_item_groups:
-            # item_group = "ALL" but we have allowed groups in POS Profile
-            # Show only items from allowed groups
-            placeholders = ", ".join(
-                [f"%(item_group_{i})s" for i in range(len(allowed_item_groups))])
-            where_conditions.append(
-                f"`tabItem`.item_group IN ({placeholders})")
-            for i, group in enumerate(allowed_item_groups):
-                params[f"item_group_{i}"] = group
-        # else: No allowed groups configured - show all items (no filter)
+        pos_profile = _parse_items_profile(pos_profile)
+        query = _build_item_filters(pos_profile, price_list, item_group, include_zero_stock)
+
+        # ngram backend: answer searches from the shared catalog index when it is built
+        # Falls back to the SQL query below for short searches or while the index is (re)building
+        if search_value and search_backend.get_backend_name("Item") == "ngram":
+            indexed_items = item_index.search_items(
+                search_value,
+                query["price_list"],
+                query["warehouse"],
+                item_group=item_group,
+                allowed_item_groups=query["allowed_item_groups"],
+                require_stock=query["require_stock"],
+                hide_zero_price=query["hide_zero_price"],
+            )
+            if indexed_items is not None:
+                return indexed_items
 
         # Add search filter - enhanced to search by exact barcode match
         if search_value:
-            where_conditions.append(
-                "(`tabItem`.name LIKE %(search)s OR `tabItem`.item_name LIKE %(search)s OR `tabItem`.name IN (SELECT parent FROM `tabItem Barcode` WHERE barcode = %(exact_search)s) OR `tabItem`.name IN (SELECT parent FROM `tabItem Barcode` WHERE barcode LIKE %(search)s))")
-            params["search"] = f"%{search_value}%"
-            params["exact_search"] = search_value
-
-        # Filter stock based on POS Profile setting and include_zero_stock parameter
-        # If posa_fetch_zero_qty = 1, allow zero stock items
-        # If posa_fetch_zero_qty = 0, only show items with stock (unless include_zero_stock is True for barcode scans)
-        if not posa_fetch_zero_qty and not include_zero_stock:
-            where_conditions.append("COALESCE(`tabBin`.actual_qty, 0) > 0")
-
-        # Filter items with zero price based on POS Profile setting
-        # If posa_hide_zero_price_items = 1, only show items with price > 0
-        if posa_hide_zero_price_items:
-            where_conditions.append(
-                "`tabItem Price`.price_list_rate IS NOT NULL AND `tabItem Price`.price_list_rate > 0")
+            _add_search_filter(query, search_value)
 
-        where_clause = " AND ".join(where_conditions)
+        where_clause = " AND ".join(query["conditions"])
 
         # Single optimized query
         items = frappe.db.sql(
             f"""
-            SELECT
-                `tabItem`.name as item_code,
-                `tabItem`.item_name,
-                `tabItem`.item_group,
-                `tabItem`.brand,
-                `tabItem`.stock_uom,
-                `tabItem`.image,
-                `tabItem Price`.price_list_rate,
-                `tabItem Price`.price_list_rate as rate,
-                `tabItem Price`.price_list_rate as base_rate,
-                `tabItem Price`.currency,
-                COALESCE(`tabBin`.actual_qty, 0) as actual_qty
-            FROM `tabItem`
-            LEFT JOIN `tabItem Price`
-                ON `tabItem`.name = `tabItem Price`.item_code
-                AND `tabItem Price`.selling = 1
-                AND `tabItem Price`.price_list = %(price_list)s
-                AND (`tabItem Price`.valid_from IS NULL OR `tabItem Price`.valid_from <= CURDATE())
-                AND (`tabItem Price`.valid_upto IS NULL OR `tabItem Price`.valid_upto >= CURDATE())
-            LEFT JOIN `tabBin`
-                ON `tabItem`.name = `tabBin`.item_code
-                AND `tabBin`.warehouse = %(warehouse)s
+            {ITEM_SELECT}
             WHERE {where_clause}
             ORDER BY `tabItem`.item_name ASC
             LIMIT 50
             """,
-            params,
+            query["params"],
             as_dict=True
         )
 
@@ -214,6 +140,289 @@ def get_items(pos_profile, price_list=None, item_group="", search_value="", cust
         return []
 
 
+@frappe.whitelist()
+def search_items(pos_profile, search_value="", item_group="", cursor=None, page_length=20,
+                 price_list=None, include_zero_stock=False):
+    """
+    Relevance-ranked item search with keyset (cursor) pagination.
+
+    Ranking: exact barcode (0) > exact item code (1) > prefix of code/name (2) > substring (3),
+    then item_name (NULL sorted as ''), item_code. Each relevance tier is its own query
+    ordered on (IFNULL(item_name, ''), name), with the cursor predicate in its WHERE and
+    LIMIT page_length + 1: a page only reads the rows after the cursor, in the cursor's
+    tier and the following ones until the page is full. An empty search is one tier
+    (browse by name). The cursor is the sort key of the last row returned, so pages
+    never skip or repeat rows.
+
+    Filters are the same as get_items() (item groups, stock, zero price).
+
+    Args:
+        pos_profile: POS Profile name, JSON string or dict
+        search_value: Search text (empty = browse all items by name)
+        item_group: Item group filter ("ALL" or empty = profile groups)
+        cursor: next_cursor from the previous page (None for the first page)
+        page_length: Rows per page (max 200)
+
+    Returns:
+        dict: {items: [...], next_cursor: str or None}
+    """
+    try:
+        pos_profile = _parse_items_profile(pos_profile)
+        query = _build_item_filters(pos_profile, price_list, item_group, include_zero_stock)
+        page_length = min(max(cint(page_length) or 20, 1), MAX_SEARCH_PAGE_LENGTH)
+
+        search_value = (search_value or "").strip()
+        params = query["params"]
+        if search_value:
+            _add_search_filter(query, search_value)
+            params["prefix_search"] = f"{search_value}%"
+            tiers = SEARCH_TIERS
+        else:
+            tiers = BROWSE_TIERS
+
+        last_key = _decode_search_cursor(cursor)
+        if last_key:
+            params["cursor_name"], params["cursor_code"] = last_key[1], last_key[2]
+
+        # One extra row tells us whether there is a next page
+        items = []
+        previous_tiers = []
+        for relevance, tier_condition in tiers:
+            conditions = query["conditions"] + [f"NOT {condition}" for condition in previous_tiers]
+            if tier_condition:
+                conditions.append(tier_condition)
+                previous_tiers.append(tier_condition)
+
+            if last_key and relevance < last_key[0]:
+                continue
+            if last_key and relevance == last_key[0]:
+                # Keyset condition: rows strictly after the last returned (item_name, item_code)
+                conditions.append(f"""({SORT_NAME} > %(cursor_name)s
+                    OR ({SORT_NAME} = %(cursor_name)s AND `tabItem`.name > %(cursor_code)s))""")
+
+            rows = frappe.db.sql(
+                f"""
+                SELECT{ITEM_COLUMNS},
+                    {SORT_NAME} AS sort_name
+                {ITEM_FROM}
+                WHERE {" AND ".join(conditions)}
+                ORDER BY sort_name ASC, `tabItem`.name ASC
+                LIMIT %(limit)s
+                """,
+                dict(params, limit=page_length + 1 - len(items)),
+                as_dict=True
+            )
+            for row in rows:
+                row.relevance = relevance
+            items.extend(rows)
+            if len(items) > page_length:
+                break
+
+        next_cursor = None
+        if len(items) > page_length:
+            items = items[:page_length]
+            last = items[-1]
+            next_cursor = _encode_search_cursor(last.relevance, last.sort_name, last.item_code)
+
+        for item in items:
+            item.pop("sort_name", None)
+
+        return {"items": items, "next_cursor": next_cursor}
+
+    except Exception as e:
+        frappe.log_error(f"[[item.py]] search_items")
+        frappe.throw(_("Error fetching items"))
+        return {"items": [], "next_cursor": None}
+
+
+# =============================================================================
+# ITEM QUERY BUILDING - shared by get_items() and search_items()
+# =============================================================================
+
+# Upper bound for search_items() page_length
+MAX_SEARCH_PAGE_LENGTH = 200
+
+# search_items() sort key after relevance (NULL item names sort as '')
+SORT_NAME = "IFNULL(`tabItem`.item_name, '')"
+
+# search_items() relevance tiers, in rank order: (relevance, condition of the tier).
+# A tier excludes the rows of the tiers before it; None = every remaining match.
+SEARCH_TIERS = [
+    (0, "`tabItem`.name IN (SELECT parent FROM `tabItem Barcode` WHERE barcode = %(exact_search)s)"),
+    (1, "`tabItem`.name = %(exact_search)s"),
+    (2, f"(`tabItem`.name LIKE %(prefix_search)s OR {SORT_NAME} LIKE %(prefix_search)s)"),
+    (3, None),
+]
+BROWSE_TIERS = [(3, None)]
+
+
+def _parse_items_profile(pos_profile):
+    """
+    Return the POS Profile as a dict (name, JSON string or dict accepted).
+    The partial dict sent by the frontend is enough here - it is not re-fetched.
+    """
+    # Validate pos_profile is not empty/null
+    if not pos_profile:
+        frappe.throw(_("POS Profile is required"))
+
+    # FRAPPE STANDARD: Handle string (JSON) or dict parameter
+    # Frontend sends dict, Frappe auto-parses JSON, but we handle both cases
+    if isinstance(pos_profile, str):
+        # Check if string is empty or whitespace
+        if not pos_profile.strip():
+            frappe.throw(_("POS Profile is required"))
+        try:
+            pos_profile = json.loads(pos_profile)
+        except (json.JSONDecodeError, ValueError):
+            # If JSON parsing fails, treat it as POS Profile name
+            # But first validate it's not empty
+            if not pos_profile or not pos_profile.strip():
+                frappe.throw(_("POS Profile is required"))
+            pos_profile = frappe.get_cached_doc(
+                "POS Profile", pos_profile).as_dict()
+
+    # If pos_profile is dict, we already have the data from frontend
+    # Frontend sends 23 fields which is enough for get_items()
+    # We DON'T re-fetch here because we only need basic fields
+
+    # Validate parameter type
+    if not isinstance(pos_profile, dict):
+        frappe.throw(_("Invalid POS Profile data"))
+
+    # Validate pos_profile has required 'name' field
+    if not pos_profile.get('name'):
+        frappe.throw(_("POS Profile name is required"))
+
+    # CRITICAL: Frontend only sends loaded fields (23 fields), not all DB fields
+    # We use the minimal data sent from frontend for this method since we only need:
+    # name, warehouse, selling_price_list, posa_fetch_zero_qty, posa_hide_zero_price_items, item_groups
+
+    return pos_profile
+
+
+def _build_item_filters(pos_profile, price_list, item_group, include_zero_stock):
+    """
+    Build the WHERE conditions and params for item queries over ITEM_SELECT.
+
+    Returns:
+        dict: conditions (list), params (dict), price_list, warehouse,
+              allowed_item_groups, require_stock, hide_zero_price
+    """
+    if not price_list:
+        price_list = pos_profile.get("selling_price_list")
+
+    warehouse = pos_profile.get("warehouse", "")
+
+    # Check POS Profile setting for fetching zero qty items
+    posa_fetch_zero_qty = pos_profile.get("posa_fetch_zero_qty", 0)
+
+    # Check POS Profile setting for hiding zero price items
+    posa_hide_zero_price_items = pos_profile.get(
+        "posa_hide_zero_price_items", 0)
+
+    # Build WHERE conditions
+    where_conditions = [
+        "`tabItem`.disabled = 0",
+        "`tabItem`.is_sales_item = 1",
+        "`tabItem`.has_variants = 0"
+    ]
+
+    params = {
+        "price_list": price_list,
+        "warehouse": warehouse
+    }
+
+    # Get allowed item groups from POS Profile
+    allowed_item_groups = []
+    if pos_profile.get("item_groups"):
+        # POS Profile has item_groups child table
+        # Handle both formats: list of strings or list of dicts (for backward compatibility)
+        for ig in pos_profile.get("item_groups"):
+            if isinstance(ig, dict):
+                # Old format: list of dictionaries with 'item_group' key
+                if ig.get("item_group"):
+                    allowed_item_groups.append(ig.get("item_group"))
+            elif isinstance(ig, str):
+                # New format: list of strings (item_group names directly)
+                allowed_item_groups.append(ig)
+
+    # Add item_group filter based on selection and allowed groups
+    if item_group and item_group.strip() and item_group != "ALL":
+        # User selected specific group - filter by it
+        where_conditions.append("`tabItem`.item_group LIKE %(item_group)s")
+        params["item_group"] = f"%{item_group}%"
+    elif allowed_item_groups:
+        # item_group = "ALL" but we have allowed groups in POS Profile
+        # Show only items from allowed groups
+        placeholders = ", ".join(
+            [f"%(item_group_{i})s" for i in range(len(allowed_item_groups))])
+        where_conditions.append(
+            f"`tabItem`.item_group IN ({placeholders})")
+        for i, group in enumerate(allowed_item_groups):
+            params[f"item_group_{i}"] = group
+    # else: No allowed groups configured - show all items (no filter)
+
+    # Filter stock based on POS Profile setting and include_zero_stock parameter
+    # If posa_fetch_zero_qty = 1, allow zero stock items
+    # If posa_fetch_zero_qty = 0, only show items with stock (unless include_zero_stock is True for barcode scans)
+    require_stock = not posa_fetch_zero_qty and not include_zero_stock
+    if require_stock:
+        where_conditions.append("COALESCE(`tabBin`.actual_qty, 0) > 0")
+
+    # Filter items with zero price based on POS Profile setting
+    # If posa_hide_zero_price_items = 1, only show items with price > 0
+    if posa_hide_zero_price_items:
+        where_conditions.append(
+            "`tabItem Price`.price_list_rate IS NOT NULL AND `tabItem Price`.price_list_rate > 0")
+
+    return {
+        "conditions": where_conditions,
+        "params": params,
+        "price_list": price_list,
+        "warehouse": warehouse,
+        "allowed_item_groups": allowed_item_groups,
+        "require_stock": require_stock,
+        "hide_zero_price": posa_hide_zero_price_items,
+    }
+
+
+def _add_search_filter(query, search_value):
+    """
+    Add the code / name / barcode search condition to a _build_item_filters() query.
+    Uses the configured search backend (search_backend.py), LIKE '%x%' when it cannot answer.
+    Exact item code and exact barcode always match.
+    """
+    params = query["params"]
+    params["search"] = f"%{search_value}%"
+    params["exact_search"] = search_value
+
+    condition = search_backend.get_search_condition("Item", search_value, params, table="`tabItem`")
+    if condition:
+        query["conditions"].append(
+            f"({condition} OR `tabItem`.name = %(exact_search)s OR `tabItem`.name IN (SELECT parent FROM `tabItem Barcode` WHERE barcode = %(exact_search)s))")
+    else:
+        query["conditions"].append(
+            "(`tabItem`.name LIKE %(search)s OR `tabItem`.item_name LIKE %(search)s OR `tabItem`.name IN (SELECT parent FROM `tabItem Barcode` WHERE barcode = %(exact_search)s) OR `tabItem`.name IN (SELECT parent FROM `tabItem Barcode` WHERE barcode LIKE %(search)s))")
+
+
+def _encode_search_cursor(relevance, item_name, item_code):
+    """Opaque cursor for search_items(): the sort key of the last row."""
+    payload = json.dumps([cint(relevance), item_name or "", item_code])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_search_cursor(cursor):
+    """Decode a search_items() cursor, None for a missing or malformed cursor (first page)."""
+    if not cursor:
+        return None
+    try:
+        relevance, item_name, item_code = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return cint(relevance), item_name, item_code
+    except Exception:
+        # Malformed cursor - restart from the first page (no logging needed)
+        return None
+
+
 @frappe.whitelist()
 def get_items_groups():
     """Get item groups"""
@@ -234,194 +443,446 @@ def get_items_groups():
 def get_barcode_item(pos_profile, barcode_value):
     """
     Process barcode and return item.
-    Tries each barcode type in order.
+    Tries the profile's compiled scale/private rules, then a normal barcode.
     """
     try:
 
-        # Validate pos_profile is not empty/null
-        if not pos_profile:
+        pos_profile = _load_barcode_profile(pos_profile)
 
-            frappe.throw(_("POS Profile is required"))
+        # Scale / private formats: one dispatch through the compiled rule table
+        # Candidates come longest prefix first; fall through when the embedded item is unknown
+        for rule in match_barcode_rules(get_barcode_rules(pos_profile), barcode_value):
+            result = _apply_barcode_rule(pos_profile, rule, barcode_value)
 
-        # Parse pos_profile if it's a JSON string
-        if isinstance(pos_profile, str):
-            # Check if string is empty or whitespace
-            if not pos_profile.strip():
+            if result:
+                return result
 
-                frappe.throw(_("POS Profile is required"))
-            try:
-                pos_profile = json.loads(pos_profile)
-            except (json.JSONDecodeError, ValueError):
-                # If JSON parsing fails, treat it as POS Profile name and fetch the document
-                # But first validate it's not empty
-                if not pos_profile or not pos_profile.strip():
+        result = _check_normal_barcode(pos_profile, barcode_value)
 
-                    frappe.throw(_("POS Profile is required"))
+        if result:
+            return result
 
-                pos_profile = frappe.get_cached_doc(
-                    "POS Profile", pos_profile).as_dict()
+        return {}
 
-        # Ensure pos_profile is a dictionary
-        if not isinstance(pos_profile, dict):
-            frappe.throw(_("Invalid POS Profile data"))
+    except Exception as e:
+        frappe.log_error(f"[[item.py]] get_barcode_item")
+        frappe.throw(_("Error processing barcode"))
+        return {}
 
-        # Validate pos_profile has required 'name' field
-        if not pos_profile.get('name'):
 
-            frappe.throw(_("POS Profile name is required"))
+@frappe.whitelist()
+def get_barcode_items(pos_profile, barcodes):
+    """
+    Resolve many scanned barcodes in one call (bulk scans, pasted lists, imports).
 
-        # CRITICAL FIX: Frontend doesn't send all barcode fields, so we must fetch from DB
-        # Always fetch the complete POS Profile from database to get barcode configuration
-        profile_name = pos_profile.get('name')
-        if profile_name:
+    The profile and its compiled barcode rules are loaded once, every barcode is
+    parsed in memory, then all candidate values are resolved together
+    (one barcode/item_code lookup + one item/price/stock lookup).
 
-            pos_profile = frappe.get_cached_doc(
-                "POS Profile", profile_name).as_dict()
+    Args:
+        pos_profile: POS Profile name, JSON string or dict
+        barcodes: JSON list of barcodes (a newline/comma separated string also works)
 
-            # Normalize item_groups to list of strings (for consistency with get_items)
-            if pos_profile.get("item_groups"):
-                item_groups_list = []
-                for ig in pos_profile.get("item_groups"):
-                    if isinstance(ig, dict):
-                        if ig.get("item_group"):
-                            item_groups_list.append(ig.get("item_group"))
-                    elif isinstance(ig, str):
-                        item_groups_list.append(ig)
-                pos_profile["item_groups"] = item_groups_list
+    Returns:
+        list: One entry per input barcode, in input order:
+            {barcode, item (or None), qty, rule: {type, prefix, embedded} or None,
+             item_part, value_part}
+    """
+    try:
 
-        result = _check_scale_barcode(pos_profile, barcode_value)
+        pos_profile = _load_barcode_profile(pos_profile)
+        barcodes = _parse_barcode_list(barcodes)
+
+        if len(barcodes) > MAX_BARCODES_PER_CALL:
+            frappe.throw(_("Too many barcodes in one request (max {0})").format(MAX_BARCODES_PER_CALL))
+
+        table = get_barcode_rules(pos_profile)
+
+        # Parse every barcode into candidates: rule matches (longest prefix first), then normal
+        plans = []
+        lookup_values = set()
+        for barcode in barcodes:
+            candidates = []
+            for rule in match_barcode_rules(table, barcode):
+                item_part, value_part = _parse_barcode_rule(rule, barcode)
+                candidates.append((rule, item_part, value_part))
+            candidates.append((None, barcode, ""))
+
+            lookup_values.update(candidate[1] for candidate in candidates)
+            plans.append((barcode, candidates))
+
+        # Set-based resolution of all candidates
+        codes = _resolve_item_codes(lookup_values)
+        items = _get_items_by_code(pos_profile, codes.values())
+
+        results = []
+        for barcode, candidates in plans:
+            result = {
+                "barcode": barcode,
+                "item": None,
+                "qty": 0,
+                "rule": None,
+                "item_part": None,
+                "value_part": None,
+            }
+
+            for rule, item_part, value_part in candidates:
+                item = items.get(codes.get(item_part))
+                if not item:
+                    continue
+
+                # Copy - the same item may be scanned several times with different qty
+                item = dict(item)
+                item["qty"] = _embedded_qty(rule, value_part, item) if rule else 1
+
+                result.update({
+                    "item": item,
+                    "qty": item["qty"],
+                    "rule": {
+                        "type": rule["type"],
+                        "prefix": rule["prefix"],
+                        "embedded": rule["embedded"],
+                    } if rule else None,
+                    "item_part": item_part,
+                    "value_part": value_part or None,
+                })
+                break
+
+            results.append(result)
+
+        return results
+
+    except frappe.ValidationError:
+        raise
+    except Exception as e:
+        frappe.log_error(f"[[item.py]] get_barcode_items")
+        frappe.throw(_("Error processing barcodes"))
+        return []
 
-        if result:
-            return result
 
-        result = _check_private_barcode(pos_profile, barcode_value)
+# =============================================================================
+# BARCODE RULES - compiled once per POS Profile version
+# =============================================================================
+# Table layout: {barcode_length: {"prefix_lengths": [4, 2], "rules": {prefix: [rule, ...]}}}
+# A scan is dispatched by its length, then by its prefix (longest prefix first).
+# Cached in Redis per profile, recompiled when POS Profile.modified changes,
+# and dropped on POS Profile save (hooks.py).
 
-        if result:
-            return result
+BARCODE_RULES_CACHE_KEY = "posa_barcode_rules"
 
-        result = _check_normal_barcode(pos_profile, barcode_value)
+# Divisors for values embedded in scale barcodes
+SCALE_WEIGHT_DIVISOR = 1000  # grams -> kg
+SCALE_PRICE_DIVISOR = 100  # minor currency units -> price
 
-        if result:
-            return result
+# Upper bound for get_barcode_items() (keeps IN lists and response size sane)
+MAX_BARCODES_PER_CALL = 1000
 
-        return {}
 
-    except Exception as e:
-        frappe.log_error(f"[[item.py]] get_barcode_item")
-        frappe.throw(_("Error processing barcode"))
-        return {}
+def get_barcode_rules(profile):
+    """Return the compiled barcode rule table for a POS Profile dict."""
+    try:
+        cache = frappe.cache()
+        version = str(profile.get("modified") or "")
 
+        cached = cache.hget(BARCODE_RULES_CACHE_KEY, profile.get("name"))
+        if cached and cached.get("version") == version:
+            return cached["table"]
 
-def _check_scale_barcode(profile, barcode):
-    """Check if barcode matches scale format and extract item."""
+        table = _compile_barcode_rules(profile)
+        cache.hset(BARCODE_RULES_CACHE_KEY, profile.get("name"),
+                   {"version": version, "table": table})
+        return table
 
-    if not profile.get("posa_enable_scale_barcode"):
+    except Exception:
+        # Graceful degradation - compile without caching (no logging needed)
+        return _compile_barcode_rules(profile)
 
-        return None
 
-    prefix = str(profile.get("posa_scale_barcode_start", ""))
-    total_len = profile.get("posa_scale_barcode_lenth")
-    item_len = profile.get("posa_scale_item_code_length")
-    weight_len = profile.get("posa_weight_length")
+def clear_barcode_rules_cache(doc, method=None):
+    """POS Profile on_update / on_trash: drop the compiled rules of this profile."""
+    frappe.cache().hdel(BARCODE_RULES_CACHE_KEY, doc.name)
 
-    if not all([prefix, total_len, item_len, weight_len]):
-        return None
 
-    if not barcode.startswith(prefix) or len(barcode) != total_len:
-        return None
+def match_barcode_rules(table, barcode):
+    """Return the rules matching a scanned barcode, longest prefix first."""
+    bucket = table.get(len(barcode))
+    if not bucket:
+        return []
+
+    matches = []
+    for prefix_length in bucket["prefix_lengths"]:
+        matches.extend(bucket["rules"].get(barcode[:prefix_length], []))
+    return matches
+
+
+def _compile_barcode_rules(profile):
+    """Compile posa_scale_barcode_* and posa_private_barcode_* settings into a rule table."""
+    rules = []
+
+    # Scale barcode: prefix + item code + embedded weight or price
+    if profile.get("posa_enable_scale_barcode"):
+        prefix = str(profile.get("posa_scale_barcode_start", ""))
+        total_len = cint(profile.get("posa_scale_barcode_lenth"))
+        item_len = cint(profile.get("posa_scale_item_code_length"))
+        value_len = cint(profile.get("posa_weight_length"))
+
+        if all([prefix, total_len, item_len, value_len]):
+            rules.append({
+                "type": "scale",
+                "prefix": prefix,
+                "length": total_len,
+                "item_len": item_len,
+                "value_len": value_len,
+                "embedded": profile.get("posa_scale_embedded_value") or "Weight",
+            })
+
+    # Private barcode: one of many prefixes + item code
+    if profile.get("posa_enable_private_barcode"):
+        prefixes_str = str(profile.get("posa_private_barcode_prefixes", ""))
+        total_len = cint(profile.get("posa_private_barcode_lenth"))
+        item_len = cint(profile.get("posa_private_item_code_length"))
+
+        if all([prefixes_str, total_len, item_len]):
+            for prefix in prefixes_str.split(","):
+                prefix = prefix.strip()
+                if prefix:
+                    rules.append({
+                        "type": "private",
+                        "prefix": prefix,
+                        "length": total_len,
+                        "item_len": item_len,
+                        "value_len": 0,
+                        "embedded": None,
+                    })
+
+    table = {}
+    for rule in rules:
+        bucket = table.setdefault(rule["length"], {"prefix_lengths": [], "rules": {}})
+        bucket["rules"].setdefault(rule["prefix"], []).append(rule)
+        if len(rule["prefix"]) not in bucket["prefix_lengths"]:
+            bucket["prefix_lengths"].append(len(rule["prefix"]))
+
+    for bucket in table.values():
+        bucket["prefix_lengths"].sort(reverse=True)
+
+    return table
+
+
+def _load_barcode_profile(pos_profile):
+    """
+    Return the complete POS Profile dict for barcode handling.
+    Accepts a profile name, a JSON string or a dict (frontend sends partial docs).
+    """
+    # Validate pos_profile is not empty/null
+    if not pos_profile:
 
-    # Extract item_code and weight
-    prefix_len = len(prefix)
-    item_code = barcode[prefix_len:prefix_len + item_len]
-    weight_part = barcode[prefix_len +
-                          item_len:prefix_len + item_len + weight_len]
+        frappe.throw(_("POS Profile is required"))
 
-    # Get item using get_items with include_zero_stock=True
-    items = get_items(profile, profile.get("selling_price_list"),
-                      search_value=item_code, include_zero_stock=True)
-    if not items:
+    # Parse pos_profile if it's a JSON string
+    if isinstance(pos_profile, str):
+        # Check if string is empty or whitespace
+        if not pos_profile.strip():
 
-        return None
+            frappe.throw(_("POS Profile is required"))
+        try:
+            pos_profile = json.loads(pos_profile)
+        except (json.JSONDecodeError, ValueError):
+            # If JSON parsing fails, treat it as POS Profile name and fetch the document
+            # But first validate it's not empty
+            if not pos_profile or not pos_profile.strip():
 
-    item = items[0]
+                frappe.throw(_("POS Profile is required"))
 
-    try:
-        weight_value = flt(weight_part) / 1000  # Convert grams to kg
-        item["qty"] = flt(weight_value, 3)
+            pos_profile = frappe.get_cached_doc(
+                "POS Profile", pos_profile).as_dict()
 
-    except:
-        item["qty"] = 1
+    # Ensure pos_profile is a dictionary
+    if not isinstance(pos_profile, dict):
+        frappe.throw(_("Invalid POS Profile data"))
 
-    return item
+    # Validate pos_profile has required 'name' field
+    if not pos_profile.get('name'):
 
+        frappe.throw(_("POS Profile name is required"))
 
-def _check_private_barcode(profile, barcode):
-    """Check if barcode matches private format and extract item."""
+    # CRITICAL FIX: Frontend doesn't send all barcode fields, so we must fetch from DB
+    # Always fetch the complete POS Profile from database to get barcode configuration
+    profile_name = pos_profile.get('name')
+    if profile_name:
 
-    if not profile.get("posa_enable_private_barcode"):
+        pos_profile = frappe.get_cached_doc(
+            "POS Profile", profile_name).as_dict()
 
-        return None
+        # Normalize item_groups to list of strings (for consistency with get_items)
+        if pos_profile.get("item_groups"):
+            item_groups_list = []
+            for ig in pos_profile.get("item_groups"):
+                if isinstance(ig, dict):
+                    if ig.get("item_group"):
+                        item_groups_list.append(ig.get("item_group"))
+                elif isinstance(ig, str):
+                    item_groups_list.append(ig)
+            pos_profile["item_groups"] = item_groups_list
 
-    prefixes_str = str(profile.get("posa_private_barcode_prefixes", ""))
-    total_len = profile.get("posa_private_barcode_lenth")
-    item_len = profile.get("posa_private_item_code_length")
+    return pos_profile
 
-    if not all([prefixes_str, total_len, item_len]) or len(barcode) != total_len:
 
-        return None
+def _parse_barcode_list(barcodes):
+    """Normalize the barcodes argument to a list of non-empty stripped strings."""
+    if isinstance(barcodes, str):
+        try:
+            barcodes = json.loads(barcodes)
+        except (json.JSONDecodeError, ValueError):
+            # Pasted list: one barcode per line or comma separated
+            barcodes = barcodes.replace(",", "\n").splitlines()
+
+    if not isinstance(barcodes, (list, tuple)):
+        barcodes = [barcodes]
+
+    return [str(b).strip() for b in barcodes if b is not None and str(b).strip()]
 
-    # Check prefix match
-    prefixes = [p.strip() for p in prefixes_str.split(",")]
 
-    matched_prefix = next((p for p in prefixes if barcode.startswith(p)), None)
+def _parse_barcode_rule(rule, barcode):
+    """Split a barcode by a rule into (item_part, value_part)."""
+    start = len(rule["prefix"])
+    item_end = start + rule["item_len"]
+    return barcode[start:item_end], barcode[item_end:item_end + rule["value_len"]]
 
-    if not matched_prefix:
 
+def _embedded_qty(rule, value_part, item):
+    """Quantity from the value embedded in a scale barcode (1 for private barcodes)."""
+    if rule["type"] != "scale":
+        return 1
+
+    if rule["embedded"] == "Price":
+        price = flt(value_part) / SCALE_PRICE_DIVISOR
+        rate = flt(item.get("rate"))
+        return flt(price / rate, 3) if rate else 1
+
+    return flt(flt(value_part) / SCALE_WEIGHT_DIVISOR, 3)
+
+
+def _apply_barcode_rule(profile, rule, barcode):
+    """Resolve the item embedded in a scale/private barcode and set its qty."""
+    item_part, value_part = _parse_barcode_rule(rule, barcode)
+
+    # Exact item lookup (zero stock allowed for scans)
+    item = _get_item_by_code(profile, _resolve_item_code(item_part))
+    if not item:
         return None
 
-    # Extract item_code
-    item_code = barcode[len(matched_prefix):len(matched_prefix) + item_len]
+    item["qty"] = _embedded_qty(rule, value_part, item)
+    return item
 
-    # Get item using get_items with include_zero_stock=True
-    items = get_items(profile, profile.get("selling_price_list"),
-                      search_value=item_code, include_zero_stock=True)
-    if not items:
 
+def _check_normal_barcode(profile, barcode):
+    """Check normal barcode: exact barcode (or item code) match, then keyed item lookup."""
+
+    item = _get_item_by_code(profile, _resolve_item_code(barcode))
+
+    if not item:
         return None
 
-    item = items[0]
     item["qty"] = 1
     return item
 
 
-def _check_normal_barcode(profile, barcode):
-    """Check normal barcode in Item Barcode table."""
+def _resolve_item_code(value):
+    """Resolve one scanned value to an item_code (see _resolve_item_codes)."""
+    return _resolve_item_codes([value]).get(value)
+
+
+def _resolve_item_codes(values):
+    """
+    Resolve scanned values to item_codes with exact matches only.
+    Item code first, then Item Barcode. Uses the catalog index when built,
+    otherwise one UNION query over `tabItem` and `tabItem Barcode`.
 
-    # First, check if barcode exists in Item Barcode table
-    barcode_record = frappe.db.sql("""
-        SELECT parent, barcode, barcode_type
+    Returns:
+        dict: value -> item_code (unknown values are omitted)
+    """
+    values = list({v for v in values if v})
+    if not values:
+        return {}
+
+    if item_index.is_index_ready():
+        return item_index.resolve_codes(values)
+
+    placeholders = ", ".join(["%s"] * len(values))
+    rows = frappe.db.sql(f"""
+        SELECT name AS value, name AS item_code, 0 AS priority
+        FROM `tabItem`
+        WHERE name IN ({placeholders})
+        UNION ALL
+        SELECT barcode AS value, parent AS item_code, 1 AS priority
         FROM `tabItem Barcode`
-        WHERE barcode = %s
-        LIMIT 1
-    """, (barcode,), as_dict=True)
+        WHERE barcode IN ({placeholders})
+        ORDER BY priority
+    """, tuple(values) * 2, as_dict=True)
 
-    if barcode_record:
-        # Barcode found in DB
-        pass
-    else:
-        # Barcode not in DB, use get_items
-        pass
+    resolved = {}
+    for row in rows:
+        resolved.setdefault(row.value, row.item_code)
+    return resolved
 
-    # Simply use get_items with the barcode value and include_zero_stock=True
-    items = get_items(profile, profile.get("selling_price_list"),
-                      search_value=barcode, include_zero_stock=True)
 
-    if not items:
+def _get_item_by_code(profile, item_code):
+    """Keyed lookup of one item with price and stock (see _get_items_by_code)."""
+    if not item_code:
         return None
+    return _get_items_by_code(profile, [item_code]).get(item_code)
 
-    item = items[0]
-    item["qty"] = 1
-    return item
+
+def _get_items_by_code(profile, item_codes):
+    """
+    Keyed lookup of items with price and stock (index HMGETs or one SQL query).
+    Applies the same POS Profile filters as get_items(include_zero_stock=True):
+    allowed item_groups and posa_hide_zero_price_items.
+
+    Returns:
+        dict: item_code -> item in get_items() shape
+    """
+    item_codes = list({c for c in item_codes if c})
+    if not item_codes:
+        return {}
+
+    price_list = profile.get("selling_price_list")
+    warehouse = profile.get("warehouse", "")
+
+    if item_index.is_index_ready():
+        items = item_index.get_items(item_codes, price_list, warehouse)
+    else:
+        params = {"price_list": price_list, "warehouse": warehouse}
+        placeholders = []
+        for i, item_code in enumerate(item_codes):
+            params[f"item_code_{i}"] = item_code
+            placeholders.append(f"%(item_code_{i})s")
+
+        items = {}
+        for row in frappe.db.sql(
+            f"""
+            {ITEM_SELECT}
+            WHERE `tabItem`.name IN ({", ".join(placeholders)})
+            AND `tabItem`.disabled = 0
+            AND `tabItem`.is_sales_item = 1
+            AND `tabItem`.has_variants = 0
+            """,
+            params,
+            as_dict=True
+        ):
+            # Keep the first price row per item (same as LIMIT 1 on a single item)
+            items.setdefault(row.item_code, row)
+
+    # item_groups is normalized to a list of strings by _load_barcode_profile()
+    allowed_item_groups = profile.get("item_groups") or []
+    hide_zero_price = profile.get("posa_hide_zero_price_items")
+
+    return {
+        item_code: item
+        for item_code, item in items.items()
+        if not (allowed_item_groups and item.get("item_group") not in allowed_item_groups)
+        and not (hide_zero_price and not flt(item.get("price_list_rate")))
+    }
 
 
 @frappe.whitelist()
@@ -440,3 +901,190 @@ def process_batch_selection(item_code, current_item_row_id, existing_items_data,
             "message": str(e),
             "data": {}
         }
+
+
+# =============================================================================
+# DELTA CATALOG SYNC - client-side (IndexedDB) item catalog
+# =============================================================================
+# get_items_delta() returns what changed since a watermark token:
+# - items    : Item rows with modified >= watermark (sellable, in the profile's groups)
+# - barcodes : all barcodes of the changed items (client replaces per item)
+# - prices   : all selling price rows (profile price list) of items whose prices changed
+#              (client replaces per item_code listed in prices["affected"])
+# - stock    : Bin qty in the profile warehouse with modified >= watermark
+# - removed  : item codes deleted (Deleted Document) or no longer sellable / allowed
+#
+# Payloads are columnar ({field: [values...]}) to cut the JSON size.
+# The watermark is the DB time when the previous delta started, minus an overlap
+# window so rows committed by transactions in flight at that moment are not missed.
+# Re-sent rows are harmless - the client upserts.
+
+DELTA_OVERLAP_SECONDS = 60
+# Tokens older than this get a full snapshot (Deleted Document may have been cleaned up)
+DELTA_MAX_AGE_DAYS = 7
+
+DELTA_ITEM_FIELDS = ["item_code", "item_name", "item_group", "brand", "stock_uom", "image"]
+DELTA_PRICE_FIELDS = ["item_code", "price_list_rate", "currency", "valid_from", "valid_upto"]
+
+
+@frappe.whitelist()
+def get_items_delta(pos_profile, since_token=None):
+    """
+    Catalog changes since since_token for a client-side item cache.
+
+    Args:
+        pos_profile: POS Profile name, JSON string or dict
+        since_token: token from the previous call (None = full snapshot)
+
+    Returns:
+        dict: {
+            full: bool (True = replace the whole local catalog),
+            token: str (pass as since_token next time),
+            items: {item_code: [...], item_name: [...], ...},
+            barcodes: {item_code: [...], barcode: [...]},
+            prices: {affected: [...], item_code: [...], price_list_rate: [...], ...},
+            stock: {item_code: [...], actual_qty: [...]},
+            removed: [item_code, ...]
+        }
+    """
+    try:
+        pos_profile = _parse_items_profile(pos_profile)
+        query = _build_item_filters(pos_profile, None, "ALL", True)
+        price_list = query["price_list"]
+        warehouse = query["warehouse"]
+        allowed_item_groups = set(query["allowed_item_groups"])
+
+        # Same clock as `modified` (frappe.utils.now_datetime in the system time zone)
+        started_at = now_datetime()
+        since = _decode_delta_token(since_token, started_at)
+        full = since is None
+
+        # Items (sellable ones are sent, the rest of the changed ones are removed)
+        item_rows = frappe.db.sql(f"""
+            SELECT name AS item_code, item_name, item_group, brand, stock_uom, image,
+                disabled, is_sales_item, has_variants
+            FROM `tabItem`
+            {"" if full else "WHERE modified >= %(since)s"}
+            ORDER BY name
+        """, {"since": since}, as_dict=True)
+
+        items = []
+        removed = []
+        for row in item_rows:
+            if (row.disabled or not row.is_sales_item or row.has_variants
+                    or (allowed_item_groups and row.item_group not in allowed_item_groups)):
+                removed.append(row.item_code)
+            else:
+                items.append(row)
+
+        if not full:
+            removed.extend(frappe.db.sql_list("""
+                SELECT deleted_name FROM `tabDeleted Document`
+                WHERE deleted_doctype = 'Item' AND creation >= %s
+            """, since))
+
+        item_codes = [row.item_code for row in items]
+
+        # Barcodes of the changed items (child rows are rewritten with their parent)
+        barcodes = []
+        if item_codes:
+            barcodes = frappe.db.sql(f"""
+                SELECT parent AS item_code, barcode
+                FROM `tabItem Barcode`
+                WHERE parenttype = 'Item' AND IFNULL(barcode, '') != ''
+                {"" if full else "AND parent IN %(item_codes)s"}
+                ORDER BY parent, idx
+            """, {"item_codes": tuple(item_codes)}, as_dict=True)
+
+            if full:
+                sellable = set(item_codes)
+                barcodes = [row for row in barcodes if row.item_code in sellable]
+
+        # Prices: every item whose price rows changed or were deleted, plus changed items
+        if full:
+            price_items = None
+        else:
+            price_items = set(item_codes)
+            price_items.update(frappe.db.sql_list("""
+                SELECT item_code FROM `tabItem Price`
+                WHERE selling = 1 AND price_list = %s AND modified >= %s
+            """, (price_list, since)))
+            for data in frappe.db.sql_list("""
+                SELECT data FROM `tabDeleted Document`
+                WHERE deleted_doctype = 'Item Price' AND creation >= %s
+            """, since):
+                deleted = json.loads(data or "{}")
+                if deleted.get("price_list") == price_list and deleted.get("item_code"):
+                    price_items.add(deleted["item_code"])
+
+        prices = []
+        if price_items is None or price_items:
+            prices = frappe.db.sql(f"""
+                SELECT item_code, price_list_rate, currency, valid_from, valid_upto
+                FROM `tabItem Price`
+                WHERE selling = 1 AND price_list = %(price_list)s
+                {"" if price_items is None else "AND item_code IN %(price_items)s"}
+                ORDER BY item_code, modified DESC
+            """, {"price_list": price_list, "price_items": tuple(price_items or [])}, as_dict=True)
+
+        # Stock levels in the profile warehouse
+        stock = frappe.db.sql(f"""
+            SELECT item_code, actual_qty
+            FROM `tabBin`
+            WHERE warehouse = %(warehouse)s
+            {"" if full else "AND modified >= %(since)s"}
+        """, {"warehouse": warehouse, "since": since}, as_dict=True)
+
+        price_columns = _to_columns(prices, DELTA_PRICE_FIELDS)
+        price_columns["affected"] = sorted(price_items) if price_items is not None else None
+
+        return {
+            "full": full,
+            "token": _encode_delta_token(started_at),
+            "items": _to_columns(items, DELTA_ITEM_FIELDS),
+            "barcodes": _to_columns(barcodes, ["item_code", "barcode"]),
+            "prices": price_columns,
+            "stock": _to_columns(stock, ["item_code", "actual_qty"]),
+            "removed": sorted(set(removed)),
+        }
+
+    except Exception as e:
+        frappe.log_error(f"[[item.py]] get_items_delta")
+        frappe.throw(_("Error fetching item changes"))
+        return {}
+
+
+def _to_columns(rows, fields):
+    """List of dicts -> {field: [values...]} (dates as strings)."""
+    columns = {field: [] for field in fields}
+    for row in rows:
+        for field in fields:
+            value = row.get(field)
+            if value is not None and not isinstance(value, (str, int, float)):
+                value = str(value)
+            columns[field].append(value)
+    return columns
+
+
+def _encode_delta_token(started_at):
+    """Opaque get_items_delta() token holding the DB time the delta started at."""
+    return base64.urlsafe_b64encode(json.dumps({"ts": str(started_at)}).encode()).decode()
+
+
+def _decode_delta_token(token, now_value):
+    """
+    Watermark to query from (token time minus the overlap window), or None for a
+    full snapshot (no token, malformed token, or older than DELTA_MAX_AGE_DAYS).
+    """
+    if not token:
+        return None
+    try:
+        since = get_datetime(json.loads(base64.urlsafe_b64decode(token.encode()))["ts"])
+    except Exception:
+        # Malformed token - send a full snapshot (no logging needed)
+        return None
+
+    if since < add_days(get_datetime(now_value), -DELTA_MAX_AGE_DAYS):
+        return None
+
+    return add_to_date(since, seconds=-DELTA_OVERLAP_SECONDS)
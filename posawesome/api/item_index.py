@@ -0,0 +1,650 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Item Catalog Index for POS Awesome
+
+Shared (Redis) token index used by get_items() so that item searches do not run
+a LIKE '%x%' scan over `tabItem` (plus barcode subqueries) on every keystroke.
+
+CACHE LAYOUT (all keys are site-prefixed through frappe.cache().make_key()):
+- posa_catalog_meta               -> JSON {"built_at": ...} (index readiness flag)
+- posa_catalog_items              -> hash item_code -> JSON item row
+- posa_catalog_token|<trigram>    -> set of item_codes containing the trigram
+- posa_catalog_barcodes           -> hash barcode -> item_code
+- posa_catalog_prices|<list>      -> hash item_code -> JSON list of selling price rows
+- posa_catalog_stock|<warehouse>  -> hash item_code -> actual_qty
+
+The index covers item_code, item_name and barcodes, normalized with
+search_backend.normalize_text() (Arabic letter variants folded). Searches shorter than
+MIN_TOKEN_LENGTH characters cannot be answered from trigrams and fall back to SQL.
+
+INCREMENTAL UPDATES (hooks.py doc_events):
+- Item on_update / after_rename / on_trash   -> refresh item row, barcodes and tokens
+- Item Price on_update / on_trash            -> refresh prices of that item in that price list
+- Stock Ledger Entry on_submit / on_cancel   -> refresh stock of that item in that warehouse
+  (Bin rows are written with db.set_value after the SLE, so the refresh runs after commit)
+
+A full rebuild is enqueued on first use and runs daily to heal any drift. It writes
+into posa_catalog_build|k|<key> and swaps them in with RENAME in one MULTI/EXEC, so
+searches keep using the previous index meanwhile. Changes hooked while a rebuild
+runs are recorded in posa_catalog_build|dirty and replayed after the swap.
+
+Searches whose rarest trigram matches more than CANDIDATE_LIMIT items are too broad
+for the index (every candidate costs HMGETs) and fall back to SQL.
+"""
+
+from __future__ import unicode_literals
+import json
+import frappe
+from frappe.utils import flt, getdate, nowdate, now
+from posawesome.api import search_backend
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe, decode as _decode
+from posawesome.api.redis_utils import BuildWriter, swap_in
+
+
+MIN_TOKEN_LENGTH = 3
+RESULT_LIMIT = 50
+# Same cap as the ngram search backend
+CANDIDATE_LIMIT = search_backend.NGRAM_CANDIDATE_LIMIT
+
+META_KEY = "posa_catalog_meta"
+ITEMS_KEY = "posa_catalog_items"
+BARCODES_KEY = "posa_catalog_barcodes"
+TOKEN_KEY = "posa_catalog_token|{0}"
+PRICES_KEY = "posa_catalog_prices|{0}"
+STOCK_KEY = "posa_catalog_stock|{0}"
+
+# Rebuild: temporary keys, running flag and changes to replay after the swap
+BUILD_PREFIX = "posa_catalog_build|"
+BUILD_KEY = BUILD_PREFIX + "k|{0}"
+REBUILDING_KEY = BUILD_PREFIX + "running"
+DIRTY_KEY = BUILD_PREFIX + "dirty"
+REBUILD_TIMEOUT = 2 * 60 * 60
+
+
+# =============================================================================
+# SECTION 1: SEARCH
+# =============================================================================
+
+def search_items(
+    search_value,
+    price_list,
+    warehouse,
+    item_group=None,
+    allowed_item_groups=None,
+    require_stock=False,
+    hide_zero_price=False,
+):
+    """
+    Answer a get_items() search from the catalog index.
+
+    Returns:
+        list|None: Item rows in get_items() shape (max RESULT_LIMIT, item_name ASC),
+                   or None when the index cannot answer (not built yet, search too
+                   short or too broad).
+    """
+    try:
+        needle = normalize_text(search_value)
+        if len(needle) < MIN_TOKEN_LENGTH:
+            return None
+
+        if not is_index_ready():
+            return None
+
+        item_codes, exact_barcode_item = _candidate_codes(needle, search_value)
+        if item_codes is None:
+            return None
+        if not item_codes:
+            return []
+
+        rows = _hmget_json(ITEMS_KEY, item_codes)
+        prices = _hmget_json(PRICES_KEY.format(price_list or ""), item_codes)
+        stock = _pipe().hmget(_key(STOCK_KEY.format(warehouse or "")), item_codes).execute()[0]
+
+        today = getdate(nowdate())
+        group_needle = (item_group or "").strip().lower()
+        use_selected_group = bool(group_needle) and item_group != "ALL"
+        allowed_item_groups = set(allowed_item_groups or [])
+
+        results = []
+        for item_code, row, price_rows, qty in zip(item_codes, rows, prices, stock):
+            if not row:
+                continue
+
+            # Same match semantics as the SQL path: code/name/barcode LIKE %x% or exact barcode
+            if item_code != exact_barcode_item and not _row_matches(item_code, row, needle):
+                continue
+
+            # Item group filter (selected group is LIKE %x%, profile groups are IN)
+            if use_selected_group:
+                if group_needle not in (row.get("item_group") or "").lower():
+                    continue
+            elif allowed_item_groups and row.get("item_group") not in allowed_item_groups:
+                continue
+
+            actual_qty = flt(_decode(qty)) if qty is not None else 0
+            if require_stock and actual_qty <= 0:
+                continue
+
+            price = _pick_price(price_rows, today)
+            if hide_zero_price and not flt(price.get("price_list_rate") if price else None):
+                continue
+
+            results.append(_make_result(item_code, row, price, actual_qty))
+
+        results.sort(key=lambda r: ((r.get("item_name") or "").lower(), r["item_code"]))
+        return results[:RESULT_LIMIT]
+
+    except Exception:
+        # Graceful degradation - caller falls back to SQL (no logging needed)
+        return None
+
+
+def match_codes(search_value):
+    """
+    Item codes matching a search (code/name/barcode contains the value, or exact barcode).
+    Used by the ngram search backend (search_backend.py) to build `name IN (...)`.
+
+    Returns:
+        list|None: Matching item codes, None when the index cannot answer.
+    """
+    needle = normalize_text(search_value)
+    if len(needle) < MIN_TOKEN_LENGTH or not is_index_ready():
+        return None
+
+    item_codes, exact_barcode_item = _candidate_codes(needle, search_value)
+    if item_codes is None:
+        return None
+    if not item_codes:
+        return []
+
+    rows = _hmget_json(ITEMS_KEY, item_codes)
+    return [
+        item_code for item_code, row in zip(item_codes, rows)
+        if row and (item_code == exact_barcode_item or _row_matches(item_code, row, needle))
+    ]
+
+
+def resolve_codes(values):
+    """
+    Exact lookup of scanned values: item_code first, then barcode.
+
+    Returns:
+        dict: value -> item_code for values that match an indexed (sellable) item
+    """
+    values = list(values)
+    if not values:
+        return {}
+
+    exists, barcode_items = (
+        _pipe().hmget(_key(ITEMS_KEY), values).hmget(_key(BARCODES_KEY), values).execute()
+    )
+
+    resolved = {}
+    for value, row, barcode_item in zip(values, exists, barcode_items):
+        if row:
+            resolved[value] = value
+        elif barcode_item:
+            resolved[value] = _decode(barcode_item)
+    return resolved
+
+
+def get_items(item_codes, price_list, warehouse):
+    """
+    Keyed lookup of indexed items with their current price and stock (3 HMGETs).
+
+    Returns:
+        dict: item_code -> item row in get_items() shape (unknown codes are omitted)
+    """
+    item_codes = list(item_codes)
+    if not item_codes:
+        return {}
+
+    rows, prices, stock = _pipe().hmget(_key(ITEMS_KEY), item_codes).hmget(
+        _key(PRICES_KEY.format(price_list or "")), item_codes
+    ).hmget(_key(STOCK_KEY.format(warehouse or "")), item_codes).execute()
+
+    today = getdate(nowdate())
+    items = {}
+    for item_code, row, price_rows, qty in zip(item_codes, rows, prices, stock):
+        if not row:
+            continue
+        items[item_code] = _make_result(
+            item_code,
+            json.loads(row),
+            _pick_price(json.loads(price_rows) if price_rows else None, today),
+            flt(_decode(qty)) if qty is not None else 0,
+        )
+    return items
+
+
+def is_index_ready():
+    """Return True if the catalog index is built; enqueue a build otherwise."""
+    if _index_exists():
+        return True
+
+    enqueue_rebuild()
+    return False
+
+
+def normalize_text(value):
+    """Normalize text for indexing and searching (shared with search_backend: case, Arabic variants)."""
+    return search_backend.normalize_text(value)
+
+
+# =============================================================================
+# SECTION 2: FULL REBUILD
+# =============================================================================
+
+def enqueue_rebuild():
+    """Enqueue a full catalog index rebuild (deduplicated per site)."""
+    try:
+        frappe.enqueue(
+            "posawesome.api.item_index.rebuild_catalog_index",
+            queue="long",
+            job_id=f"posa_catalog_rebuild::{frappe.local.site}",
+            deduplicate=True,
+        )
+    except Exception:
+        # Silent fail - index stays unavailable and get_items keeps using SQL (no logging needed)
+        pass
+
+
+def rebuild_catalog_index():
+    """
+    Rebuild the whole catalog index from the database.
+    Runs in a background job (queue=long) and from the daily scheduler.
+
+    The new index is written to temporary keys and swapped in atomically, then the
+    changes recorded by the doc_events while it was built are replayed on it.
+    """
+    try:
+        cache = frappe.cache()
+        cache.delete_keys(BUILD_KEY.format(""))
+        _pipe().delete(_key(DIRTY_KEY)).set(
+            _key(REBUILDING_KEY), now(), ex=REBUILD_TIMEOUT).execute()
+
+        built = BuildWriter(BUILD_KEY)
+
+        items = frappe.db.sql("""
+            SELECT name, item_name, item_group, brand, stock_uom, image
+            FROM `tabItem`
+            WHERE disabled = 0
+            AND is_sales_item = 1
+            AND has_variants = 0
+        """, as_dict=True)
+        item_codes = {item.name for item in items}
+
+        barcodes = {}
+        for row in frappe.db.sql("""
+            SELECT parent, barcode FROM `tabItem Barcode`
+            WHERE parenttype = 'Item' AND IFNULL(barcode, '') != ''
+        """, as_dict=True):
+            if row.parent in item_codes:
+                barcodes.setdefault(row.parent, []).append(row.barcode)
+
+        for item in items:
+            row = _make_item_row(item, barcodes.get(item.name, []))
+            built.hset(ITEMS_KEY, item.name, json.dumps(row))
+            for token in row["tokens"]:
+                built.sadd(TOKEN_KEY.format(token), item.name)
+            for barcode in row["barcodes"]:
+                built.hset(BARCODES_KEY, barcode, item.name)
+        built.flush()
+
+        prices = {}
+        for row in frappe.db.sql("""
+            SELECT item_code, price_list, price_list_rate, currency, valid_from, valid_upto
+            FROM `tabItem Price`
+            WHERE selling = 1
+            ORDER BY item_code, price_list, modified DESC
+        """, as_dict=True):
+            if row.item_code in item_codes:
+                prices.setdefault((row.price_list, row.item_code), []).append(_make_price_row(row))
+
+        for (price_list, item_code), price_rows in prices.items():
+            built.hset(PRICES_KEY.format(price_list), item_code, json.dumps(price_rows))
+        built.flush()
+
+        for row in frappe.db.sql("""
+            SELECT item_code, warehouse, actual_qty FROM `tabBin`
+        """, as_dict=True):
+            if row.item_code in item_codes:
+                built.hset(STOCK_KEY.format(row.warehouse), row.item_code, flt(row.actual_qty))
+
+        built.set(META_KEY, json.dumps({"built_at": now(), "items": len(items)}))
+        built.flush()
+
+        swap_in(built, ["posa_catalog_"], exclude_prefix=BUILD_PREFIX)
+        _pipe().delete(_key(REBUILDING_KEY)).execute()
+        _replay_dirty()
+
+    except Exception:
+        frappe.log_error("[[item_index.py]] rebuild_catalog_index")
+        try:
+            _pipe().delete(_key(REBUILDING_KEY)).execute()
+            frappe.cache().delete_keys(BUILD_KEY.format(""))
+        except Exception:
+            # Graceful degradation - the running flag expires after REBUILD_TIMEOUT (no logging needed)
+            pass
+
+
+def _replay_dirty():
+    """Re-apply the item / price / stock changes hooked while the rebuild ran."""
+    entries = _pipe().smembers(_key(DIRTY_KEY)).delete(_key(DIRTY_KEY)).execute()[0]
+
+    stock = set()
+    for entry in entries or []:
+        kind, first, second = json.loads(_decode(entry))
+        if kind == "item":
+            _refresh_item(first)
+        elif kind == "price":
+            _refresh_price(first, second)
+        elif kind == "stock":
+            stock.add((first, second))
+
+    if stock:
+        _refresh_stock(stock)
+
+
+# =============================================================================
+# SECTION 3: INCREMENTAL UPDATES (doc_events)
+# =============================================================================
+
+def on_item_change(doc, method=None):
+    """Item on_update / on_trash: refresh the indexed row, barcodes and tokens."""
+    try:
+        _record_dirty([("item", doc.name, None)])
+        if not _index_exists():
+            return
+
+        _remove_item(doc.name)
+
+        if method == "on_trash":
+            return
+
+        if doc.disabled or not doc.is_sales_item or doc.has_variants:
+            return
+
+        barcodes = [b.barcode for b in doc.get("barcodes", []) if b.barcode]
+        _add_item(doc, barcodes)
+
+    except Exception:
+        frappe.log_error("[[item_index.py]] on_item_change")
+
+
+def on_item_rename(doc, method=None, old_name=None, new_name=None, merge=False):
+    """Item after_rename: drop the old code and index the new one."""
+    try:
+        _record_dirty([("item", old_name, None)])
+        if not _index_exists():
+            return
+
+        _remove_item(old_name)
+        on_item_change(frappe.get_doc("Item", new_name), "on_update")
+
+    except Exception:
+        frappe.log_error("[[item_index.py]] on_item_rename")
+
+
+def on_item_price_change(doc, method=None):
+    """Item Price on_update / on_trash: refresh price rows of the affected item(s)."""
+    try:
+        targets = {(doc.price_list, doc.item_code)}
+        before = doc.get_doc_before_save() if method == "on_update" else None
+        if before:
+            targets.add((before.price_list, before.item_code))
+
+        _record_dirty([("price", price_list, item_code) for price_list, item_code in targets])
+        if not _index_exists():
+            return
+
+        for price_list, item_code in targets:
+            _refresh_price(price_list, item_code)
+
+    except Exception:
+        frappe.log_error("[[item_index.py]] on_item_price_change")
+
+
+def on_stock_ledger_change(doc, method=None):
+    """
+    Stock Ledger Entry on_submit / on_cancel: refresh stock after commit.
+    Bin is updated after the SLE hook runs, so reading it now would be stale.
+    """
+    try:
+        if not doc.item_code or not doc.warehouse:
+            return
+
+        pending = frappe.flags.setdefault("posa_catalog_stock_refresh", set())
+        if not pending:
+            frappe.db.after_commit.add(_flush_stock_refresh)
+        pending.add((doc.item_code, doc.warehouse))
+
+    except Exception:
+        # Silent fail - daily rebuild corrects stock drift (no logging needed)
+        pass
+
+
+def _flush_stock_refresh():
+    """After-commit callback: copy current Bin qty of touched (item, warehouse) pairs."""
+    pending = frappe.flags.pop("posa_catalog_stock_refresh", None) or set()
+    if not pending:
+        return
+
+    try:
+        _record_dirty([("stock", item_code, warehouse) for item_code, warehouse in pending])
+        if _index_exists():
+            _refresh_stock(pending)
+
+    except Exception:
+        # Silent fail - daily rebuild corrects stock drift (no logging needed)
+        pass
+
+
+def _record_dirty(entries):
+    """
+    While a rebuild runs, remember the changed rows: the rebuild may have read them
+    before the change, so they are replayed on the new index after its swap.
+    """
+    if not entries or not _pipe().exists(_key(REBUILDING_KEY)).execute()[0]:
+        return
+
+    _pipe().sadd(_key(DIRTY_KEY), *[json.dumps(list(entry)) for entry in entries]).execute()
+
+
+# =============================================================================
+# SECTION 4: HELPERS
+# =============================================================================
+
+def _index_exists():
+    """True once a full rebuild has completed (hooks only patch an existing index)."""
+    return bool(_pipe().exists(_key(META_KEY)).execute()[0])
+
+
+def _add_item(item, barcodes):
+    """Write one item row, its barcodes and its tokens."""
+    row = _make_item_row(item, barcodes)
+    pipe = _pipe()
+    pipe.hset(_key(ITEMS_KEY), item.name, json.dumps(row))
+    for token in row["tokens"]:
+        pipe.sadd(_key(TOKEN_KEY.format(token)), item.name)
+    for barcode in row["barcodes"]:
+        pipe.hset(_key(BARCODES_KEY), barcode, item.name)
+    pipe.execute()
+
+
+def _remove_item(item_code):
+    """Remove one item row with its tokens and barcodes (uses tokens stored on the row)."""
+    if not item_code:
+        return
+
+    row = _hmget_json(ITEMS_KEY, [item_code])[0]
+    if not row:
+        return
+
+    pipe = _pipe()
+    pipe.hdel(_key(ITEMS_KEY), item_code)
+    for token in row.get("tokens", []):
+        pipe.srem(_key(TOKEN_KEY.format(token)), item_code)
+    for barcode in row.get("barcodes", []):
+        pipe.hdel(_key(BARCODES_KEY), barcode)
+    pipe.execute()
+
+
+def _refresh_price(price_list, item_code):
+    """Reload all selling price rows of one item in one price list."""
+    if not price_list or not item_code:
+        return
+
+    rows = frappe.db.sql("""
+        SELECT price_list_rate, currency, valid_from, valid_upto
+        FROM `tabItem Price`
+        WHERE selling = 1 AND price_list = %s AND item_code = %s
+        ORDER BY modified DESC
+    """, (price_list, item_code), as_dict=True)
+
+    key = _key(PRICES_KEY.format(price_list))
+    if rows:
+        _pipe().hset(key, item_code, json.dumps([_make_price_row(r) for r in rows])).execute()
+    else:
+        _pipe().hdel(key, item_code).execute()
+
+
+def _refresh_item(item_code):
+    """Re-index one item from the database (removed if gone or no longer sellable)."""
+    if not item_code:
+        return
+
+    _remove_item(item_code)
+    if not frappe.db.exists("Item", item_code):
+        return
+
+    item = frappe.get_doc("Item", item_code)
+    if item.disabled or not item.is_sales_item or item.has_variants:
+        return
+
+    _add_item(item, [b.barcode for b in item.get("barcodes", []) if b.barcode])
+
+
+def _refresh_stock(pairs):
+    """Copy the current Bin qty of (item_code, warehouse) pairs."""
+    conditions = " OR ".join(["(item_code = %s AND warehouse = %s)"] * len(pairs))
+    values = [v for pair in pairs for v in pair]
+    bins = frappe.db.sql(f"""
+        SELECT item_code, warehouse, actual_qty FROM `tabBin` WHERE {conditions}
+    """, values, as_dict=True)
+
+    pipe = _pipe()
+    for row in bins:
+        pipe.hset(_key(STOCK_KEY.format(row.warehouse)), row.item_code, flt(row.actual_qty))
+    pipe.execute()
+
+
+def _make_item_row(item, barcodes):
+    """Build the cached item row (fields returned by get_items + tokens for removal)."""
+    tokens = set()
+    for value in [item.name, item.item_name] + list(barcodes):
+        tokens.update(_trigrams(normalize_text(value)))
+
+    return {
+        "item_name": item.item_name,
+        "item_group": item.item_group,
+        "brand": item.brand,
+        "stock_uom": item.stock_uom,
+        "image": item.image,
+        "barcodes": list(barcodes),
+        "tokens": sorted(tokens),
+    }
+
+
+def _make_result(item_code, row, price, actual_qty):
+    """Build an item dict with the same keys as the get_items() SQL projection."""
+    rate = price.get("price_list_rate") if price else None
+    return {
+        "item_code": item_code,
+        "item_name": row.get("item_name"),
+        "item_group": row.get("item_group"),
+        "brand": row.get("brand"),
+        "stock_uom": row.get("stock_uom"),
+        "image": row.get("image"),
+        "price_list_rate": rate,
+        "rate": rate,
+        "base_rate": rate,
+        "currency": price.get("currency") if price else None,
+        "actual_qty": actual_qty,
+    }
+
+
+def _make_price_row(row):
+    """Build a cached price row (dates kept as strings for JSON)."""
+    return {
+        "price_list_rate": flt(row.price_list_rate),
+        "currency": row.currency,
+        "valid_from": str(row.valid_from) if row.valid_from else None,
+        "valid_upto": str(row.valid_upto) if row.valid_upto else None,
+    }
+
+
+def _pick_price(price_rows, today):
+    """Return the first price row valid today (same validity window as the SQL join)."""
+    for price in price_rows or []:
+        if price.get("valid_from") and getdate(price["valid_from"]) > today:
+            continue
+        if price.get("valid_upto") and getdate(price["valid_upto"]) < today:
+            continue
+        return price
+    return None
+
+
+def _candidate_codes(needle, search_value):
+    """
+    Candidate item codes = intersection of all trigrams of the search value (superset of matches).
+    The exact barcode hit is always a candidate (it may not contain the normalized value).
+
+    The intersection is bounded by the rarest trigram: when even that one holds more
+    than CANDIDATE_LIMIT items the search is too broad for the index.
+
+    Returns:
+        tuple: (sorted item codes or None when too broad, exact barcode item_code or None)
+    """
+    token_keys = [_key(TOKEN_KEY.format(t)) for t in _trigrams(needle)]
+    pipe = _pipe()
+    for token_key in token_keys:
+        pipe.scard(token_key)
+    sizes = pipe.execute()
+    if min(sizes) > CANDIDATE_LIMIT:
+        return None, None
+
+    candidates, exact_barcode_item = (
+        _pipe().sinter(token_keys).hget(_key(BARCODES_KEY), search_value).execute()
+    )
+    item_codes = sorted(_decode(c) for c in candidates)
+
+    if exact_barcode_item:
+        exact_barcode_item = _decode(exact_barcode_item)
+        if exact_barcode_item not in item_codes:
+            item_codes.append(exact_barcode_item)
+
+    return item_codes, exact_barcode_item
+
+
+def _row_matches(item_code, row, needle):
+    """Verify a trigram candidate really contains the search value."""
+    return (
+        needle in normalize_text(item_code)
+        or needle in normalize_text(row.get("item_name"))
+        or any(needle in normalize_text(b) for b in row.get("barcodes", []))
+    )
+
+
+def _trigrams(text):
+    """All overlapping 3-character substrings of an already normalized string."""
+    return {text[i:i + MIN_TOKEN_LENGTH] for i in range(len(text) - MIN_TOKEN_LENGTH + 1)}
+
+
+def _hmget_json(name, fields):
+    """HMGET a JSON hash and decode each value (missing values become None)."""
+    values = _pipe().hmget(_key(name), fields).execute()[0]
+    return [json.loads(v) if v else None for v in values]
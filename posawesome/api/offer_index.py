@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled POS Offer Index
+
+get_offers() runs on every cart change. Instead of querying `tabPOS Offer` each
+time, the active offers of a (company, POS Profile, warehouse, date) are loaded
+once and compiled into lookup tables:
+- by_item_code / by_item_group / by_brand / by_customer / by_customer_group
+  -> {value: [offer names]}
+- general -> offers without a target (grand_total or empty offer_type)
+- bounds -> {name: (min_qty, max_qty, min_amt, max_amt)}, where an empty / 0
+  bound means no limit
+
+Matching a cart is then a walk over its lines plus a bounds check of the
+candidate offers only, with no query (customer attributes such as
+customer_group come from the customer_attributes.py cache, once per
+evaluation). The cost depends on the cart and on the offers targeting it,
+not on the number of active offers (benchmarks.benchmark_offer_evaluation).
+
+The compiled index is cached in Redis (OFFER_INDEX_CACHE_TTL as safety net,
+the date is part of the key). Invalidation: POS Offer on_update / on_trash
+drop every compiled index and bump an index generation after commit
+(hooks.py doc_events).
+
+CART SESSIONS (pos_offer.get_offers_delta): the aggregates of a cart (lines,
+totals, items / groups / brands present), its matched offers and line
+discounts are kept in Redis per user and session id. The client sends only
+the changed lines with the fingerprint of the last response and gets back the
+offer additions / removals, the line discounts that changed and the transaction
+discount. Prices come from offer_solver.solve() over the whole session cart, as
+in get_offers(), so both endpoints agree on the cart-wide stacking rule. A
+fingerprint mismatch (expired or concurrent session) asks the client to resync
+the cart. So does a session started on an older index generation: an edited
+offer keeps its name, so it would neither be added nor removed and the
+session would keep its stale discounts.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt, nowdate
+from posawesome.api import customer_attributes, offer_solver
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe, decode as _decode
+
+
+OFFER_INDEX_CACHE_PREFIX = "posa_offer_index|"
+OFFER_INDEX_CACHE_KEY = OFFER_INDEX_CACHE_PREFIX + "{0}|{1}|{2}|{3}"
+OFFER_INDEX_CACHE_TTL = 6 * 60 * 60
+
+# Bumped on every POS Offer change (cart sessions of an older generation resync)
+OFFER_INDEX_GENERATION_KEY = "posa_offer_index_generation"
+
+CART_SESSION_CACHE_KEY = "posa_offer_cart|{0}|{1}"
+CART_SESSION_CACHE_TTL = 4 * 60 * 60
+
+OFFER_FIELDS = [
+    "name", "title", "description", "offer_type", "discount_type",
+    "discount_percentage", "min_qty", "max_qty", "min_amt", "max_amt", "auto",
+    "item_code", "item_group", "brand", "customer", "customer_group",
+    "valid_from", "valid_upto", "stackable",
+]
+
+# Offer type -> (index table, offer field)
+TARGETED_OFFER_TYPES = {
+    "item_code": ("by_item_code", "item_code"),
+    "item_group": ("by_item_group", "item_group"),
+    "brand": ("by_brand", "brand"),
+    "customer": ("by_customer", "customer"),
+    "customer_group": ("by_customer_group", "customer_group"),
+}
+
+# (index table, cart line field) of the item level offer targets
+CART_KEYS = (
+    ("by_item_code", "item_code"),
+    ("by_item_group", "item_group"),
+    ("by_brand", "brand"),
+)
+
+# (index table, customer attribute) of the offer targets resolved through
+# customer_attributes.py
+CUSTOMER_ATTRIBUTE_KEYS = (
+    ("by_customer_group", "customer_group"),
+)
+
+UNBOUNDED = float("inf")
+
+# Cart totals are updated incrementally - rounded to keep float drift out of
+# the min / max threshold comparisons
+TOTAL_PRECISION = 9
+
+
+# =============================================================================
+# LOOKUP
+# =============================================================================
+
+def get_offer_index(company, pos_profile, warehouse, date=None):
+    """Cached compiled index of the active offers (see module docstring)."""
+    date = str(date or nowdate())
+    cache_key = OFFER_INDEX_CACHE_KEY.format(company, pos_profile or "", warehouse or "", date)
+    try:
+        index = frappe.cache().get_value(cache_key)
+        if index is not None:
+            return index
+    except Exception:
+        # Graceful degradation - build from the database (no logging needed)
+        pass
+
+    index = compile_offers(_load_offers(company, pos_profile, warehouse, date))
+
+    try:
+        frappe.cache().set_value(cache_key, index, expires_in_sec=OFFER_INDEX_CACHE_TTL)
+    except Exception:
+        # Graceful degradation - not cached (no logging needed)
+        pass
+
+    return index
+
+
+def get_active_offers(company, pos_profile, warehouse, date=None):
+    """Active offers in offer order (auto desc, discount_percentage desc, title asc)."""
+    index = get_offer_index(company, pos_profile, warehouse, date)
+    return [frappe._dict(index["offers"][name]) for name in index["order"]]
+
+
+def match_offers(index, items, customer=None):
+    """
+    Offers of the index applicable to a cart.
+
+    Args:
+        index: Compiled index (get_offer_index)
+        items: Cart lines (dicts with item_code, item_group, brand, qty, rate)
+        customer: Invoice customer
+
+    Returns:
+        list: Offer dicts in offer order
+    """
+    cart = new_cart()
+    for row, item in enumerate(items):
+        set_cart_line(cart, item.get("posa_row_id") or str(row), item)
+
+    return [frappe._dict(index["offers"][name]) for name in match_cart(index, cart, customer)]
+
+
+def match_cart(index, cart, customer=None):
+    """
+    Names of the offers applicable to cart aggregates (new_cart), in offer order.
+    Only the offers targeting the items, groups and brands present are looked at.
+    """
+    if not index["order"]:
+        return []
+
+    candidates = set(index["general"])
+    for table, field in CART_KEYS:
+        for value in cart[field]:
+            candidates.update(index[table].get(value, ()))
+
+    if customer:
+        candidates.update(index["by_customer"].get(customer, ()))
+        # Customer attributes resolved once per evaluation, only when an offer uses them
+        if any(index[table] for table, _field in CUSTOMER_ATTRIBUTE_KEYS):
+            attributes = _get_customer_attributes(customer)
+            for table, field in CUSTOMER_ATTRIBUTE_KEYS:
+                if attributes.get(field):
+                    candidates.update(index[table].get(attributes[field], ()))
+
+    matched = []
+    for name in candidates:
+        min_qty, max_qty, min_amt, max_amt = index["bounds"][name]
+        if min_qty <= cart["total_qty"] <= max_qty and min_amt <= cart["total_amount"] <= max_amt:
+            matched.append(name)
+
+    # Offer order (auto desc, discount_percentage desc, title asc)
+    matched.sort(key=index["rank"].get)
+    return matched
+
+
+# =============================================================================
+# CART AGGREGATES
+# =============================================================================
+
+def new_cart():
+    """
+    Empty cart aggregates:
+    {lines: {row_id: line}, total_qty, total_amount,
+     item_code / item_group / brand: {value: [row_ids]}}
+    """
+    cart = {"lines": {}, "total_qty": 0, "total_amount": 0}
+    for _table, field in CART_KEYS:
+        cart[field] = {}
+    return cart
+
+
+def set_cart_line(cart, row_id, item):
+    """Add or replace a cart line, updating the aggregates incrementally."""
+    remove_cart_line(cart, row_id)
+
+    line = {
+        "item_code": item.get("item_code"),
+        "item_group": item.get("item_group"),
+        "brand": item.get("brand"),
+        "qty": flt(item.get("qty", 0)),
+        "rate": flt(item.get("rate", 0)),
+    }
+    cart["lines"][row_id] = line
+    cart["total_qty"] = flt(cart["total_qty"] + line["qty"], TOTAL_PRECISION)
+    cart["total_amount"] = flt(cart["total_amount"] + line["qty"] * line["rate"], TOTAL_PRECISION)
+    for _table, field in CART_KEYS:
+        if line[field]:
+            cart[field].setdefault(line[field], []).append(row_id)
+
+
+def remove_cart_line(cart, row_id):
+    """Remove a cart line (no-op when absent), updating the aggregates incrementally."""
+    line = cart["lines"].pop(row_id, None)
+    if not line:
+        return
+
+    cart["total_qty"] = flt(cart["total_qty"] - line["qty"], TOTAL_PRECISION)
+    cart["total_amount"] = flt(cart["total_amount"] - line["qty"] * line["rate"], TOTAL_PRECISION)
+    for _table, field in CART_KEYS:
+        rows = cart[field].get(line[field])
+        if rows and row_id in rows:
+            rows.remove(row_id)
+            if not rows:
+                del cart[field][line[field]]
+
+
+def _get_customer_attributes(customer):
+    try:
+        return customer_attributes.get_customer_attributes(customer)
+    except Exception:
+        # Graceful degradation - no customer attribute offers (no logging needed)
+        return {}
+
+
+# =============================================================================
+# CART SESSIONS (get_offers_delta)
+# =============================================================================
+
+def apply_cart_delta(session_id, company, pos_profile, warehouse, fingerprint=None,
+                     lines=None, removed=None, customer=None, reset=False, posting_date=None):
+    """
+    Apply changed / removed lines to a cart session and re-match its offers.
+
+    Args:
+        session_id: Client cart id
+        company, pos_profile, warehouse: Offer index of the cart
+        fingerprint: Fingerprint of the last response (ignored on reset)
+        lines: Added / changed lines (posa_row_id, item_code, item_group, brand, qty, rate)
+        removed: posa_row_id of the removed lines
+        customer: New customer (None = unchanged)
+        reset: Start the session over from `lines` (full cart)
+        posting_date: Offer validity date (default today)
+
+    Returns:
+        dict: {resync: True} when the session is unknown, out of date or older than
+              the last offer change, else
+              {resync: False, fingerprint, added: [offer dicts], removed: [offer names],
+               line_discounts: {posa_row_id: discount_percentage} (changed lines only),
+               additional_discount_percentage, transaction_offers: [offer names],
+               total_qty, total_amount}
+    """
+    cache_key = CART_SESSION_CACHE_KEY.format(frappe.session.user, session_id)
+    context = [company, pos_profile, warehouse, str(posting_date or nowdate())]
+    generation = _get_index_generation()
+
+    if reset:
+        session = {
+            "context": context,
+            "generation": generation,
+            "cart": new_cart(),
+            "customer": None,
+            "offers": [],
+            "line_discounts": {},
+        }
+    else:
+        session = _get_cart_session(cache_key)
+        if (not session or not fingerprint or session["fingerprint"] != fingerprint
+                or session["context"] != context or session.get("generation") != generation):
+            return {"resync": True}
+
+    cart = session["cart"]
+    for row_id in removed or []:
+        remove_cart_line(cart, row_id)
+        session["line_discounts"].pop(row_id, None)
+
+    for line in lines or []:
+        row_id = line.get("posa_row_id")
+        if not row_id:
+            frappe.throw("Cart line without posa_row_id")
+        set_cart_line(cart, row_id, line)
+
+    if customer is not None:
+        session["customer"] = customer
+
+    index = get_offer_index(company, pos_profile, warehouse, context[3])
+    matched = match_cart(index, cart, session["customer"])
+    matched_names = set(matched)
+    previous_names = set(session["offers"])
+    added = [name for name in matched if name not in previous_names]
+    removed_offers = [name for name in session["offers"] if name not in matched_names]
+
+    # Same assignment as get_offers(): a transaction offer limits every line of
+    # the cart to its stackable item offers, so the whole cart is solved
+    row_ids = list(cart["lines"])
+    solution = offer_solver.solve(
+        [cart["lines"][row_id] for row_id in row_ids],
+        [index["offers"][name] for name in matched])
+
+    line_discounts = {}
+    for row_id, line in zip(row_ids, solution["lines"]):
+        discount = line["discount_percentage"]
+        if discount != session["line_discounts"].get(row_id, 0):
+            line_discounts[row_id] = discount
+        if discount:
+            session["line_discounts"][row_id] = discount
+        else:
+            session["line_discounts"].pop(row_id, None)
+
+    session["offers"] = matched
+    session["fingerprint"] = frappe.generate_hash(length=12)
+    _set_cart_session(cache_key, session)
+
+    return {
+        "resync": False,
+        "fingerprint": session["fingerprint"],
+        "added": [frappe._dict(index["offers"][name]) for name in added],
+        "removed": removed_offers,
+        "line_discounts": line_discounts,
+        "additional_discount_percentage": solution["additional_discount_percentage"],
+        "transaction_offers": solution["transaction_offers"],
+        "total_qty": cart["total_qty"],
+        "total_amount": cart["total_amount"],
+    }
+
+
+def _get_index_generation():
+    try:
+        return _decode(_pipe().get(_key(OFFER_INDEX_GENERATION_KEY)).execute()[0])
+    except Exception:
+        # Graceful degradation - cart sessions are unavailable as well (no logging needed)
+        return None
+
+
+def _get_cart_session(cache_key):
+    try:
+        return frappe.cache().get_value(cache_key)
+    except Exception:
+        # Graceful degradation - client resyncs the cart (no logging needed)
+        return None
+
+
+def _set_cart_session(cache_key, session):
+    try:
+        frappe.cache().set_value(cache_key, session, expires_in_sec=CART_SESSION_CACHE_TTL)
+    except Exception:
+        # Graceful degradation - next delta asks for a resync (no logging needed)
+        pass
+
+
+# =============================================================================
+# COMPILATION
+# =============================================================================
+
+def _load_offers(company, pos_profile, warehouse, date):
+    """
+    Active offers of the company for the profile / warehouse (empty = all) on date.
+
+    One projection of every field the evaluation uses (OFFER_FIELDS). Only the
+    company prefix of posa_offer_profile_index (patches/v15/add_offer_index.py)
+    is a guaranteed seek: pos_profile matches the profile, '' or NULL (offers for
+    every profile), so the rows of the company are at best read as several
+    pos_profile intervals and disable / dates are filtered within them. Offers
+    are few per company and the compiled index is cached (get_offer_index).
+    """
+    if not company:
+        return []
+
+    return frappe.db.sql("""
+        SELECT {fields}
+        FROM `tabPOS Offer`
+        WHERE disable = 0
+            AND company = %(company)s
+            AND (pos_profile IN (%(pos_profile)s, '') OR pos_profile IS NULL)
+            AND (warehouse IN (%(warehouse)s, '') OR warehouse IS NULL)
+            AND valid_from <= %(date)s
+            AND valid_upto >= %(date)s
+        ORDER BY auto DESC, discount_percentage DESC, title ASC
+    """.format(fields=", ".join("`{0}`".format(field) for field in OFFER_FIELDS)), {
+        "company": company,
+        "pos_profile": pos_profile or "",
+        "warehouse": warehouse or "",
+        "date": date,
+    }, as_dict=1)
+
+
+def compile_offers(offers):
+    """Build the lookup tables of a list of offers (already in offer order)."""
+    index = {
+        "offers": {},
+        "order": [],
+        "rank": {},
+        "general": [],
+        "bounds": {},
+    }
+    for table, _field in TARGETED_OFFER_TYPES.values():
+        index[table] = {}
+
+    for offer in offers:
+        name = offer["name"]
+        index["offers"][name] = dict(offer)
+        index["rank"][name] = len(index["order"])
+        index["order"].append(name)
+
+        offer_type = offer.get("offer_type")
+        if offer_type in TARGETED_OFFER_TYPES:
+            table, field = TARGETED_OFFER_TYPES[offer_type]
+            # An offer without its target value never applies
+            if offer.get(field):
+                index[table].setdefault(offer[field], []).append(name)
+        elif not offer_type or offer_type == "grand_total":
+            index["general"].append(name)
+
+        index["bounds"][name] = (
+            flt(offer.get("min_qty")) or -UNBOUNDED,
+            flt(offer.get("max_qty")) or UNBOUNDED,
+            flt(offer.get("min_amt")) or -UNBOUNDED,
+            flt(offer.get("max_amt")) or UNBOUNDED,
+        )
+
+    return index
+
+
+# =============================================================================
+# INVALIDATION (POS Offer doc_events)
+# =============================================================================
+
+def on_offer_change(doc, method=None):
+    """POS Offer on_update / on_trash: the offer may be in any compiled index or cart session."""
+    frappe.db.after_commit.add(invalidate)
+
+
+def invalidate():
+    """Drop every compiled index and bump the index generation (cart sessions resync)."""
+    try:
+        frappe.cache().delete_keys(OFFER_INDEX_CACHE_PREFIX)
+        _pipe().incr(_key(OFFER_INDEX_GENERATION_KEY)).execute()
+    except Exception:
+        frappe.log_error("[[offer_index.py]] invalidate")
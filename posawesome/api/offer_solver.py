@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+POS Offer Solver
+
+Picks the offers of a cart that give the customer the best price, instead of
+applying every applicable offer in offer order (where the last one written to
+a line or to additional_discount_percentage wins).
+
+STACKING RULES (POS Offer "Stackable" checkbox):
+- Item level offers (item_code / item_group / brand) discount the lines they
+  target. On a line a non stackable offer excludes every other offer, while
+  stackable offers compound: 1 - (1 - a) * (1 - b) ... Each line gets the
+  better of its best single offer and its compounded stackable offers.
+- Transaction level offers (grand_total / customer / customer_group / no type)
+  set additional_discount_percentage, with the same rule among themselves.
+- Item and transaction discounts combine only when both sides are stackable.
+  This rule is cart-wide: additional_discount_percentage discounts every line
+  of the invoice, so once a transaction offer applies, every line is limited
+  to its stackable item offers (a line can't keep a non stackable offer while
+  the others take the transaction discount). The solver compares item offers
+  alone, transaction offers alone, and stackable transaction offers on top of
+  stackable item offers, and keeps the lowest net total (ties keep the earlier
+  of these options).
+
+Line choices depend only on the offers targeting the line, so they are solved
+once per distinct (item_code, item_group, brand): the cost is
+O(lines + offers targeting the cart). Results are memoized per cart signature
+(lines + offers) in a process-local LRU (benchmarks.benchmark_offer_solver).
+"""
+
+from __future__ import unicode_literals
+import copy
+import hashlib
+import json
+from collections import OrderedDict
+from frappe.utils import cint, flt
+
+
+ITEM_OFFER_TYPES = ("item_code", "item_group", "brand")
+
+# Max solved carts kept in each worker process
+MEMO_SIZE = 512
+
+# {cart signature: solution}
+_memo = OrderedDict()
+
+
+# =============================================================================
+# SOLVER
+# =============================================================================
+
+def solve(items, offers):
+    """
+    Best non-conflicting offer assignment of a cart.
+
+    Args:
+        items: Cart lines (dicts with item_code, item_group, brand, qty, rate)
+        offers: Applicable offers in offer order (name, offer_type, target field,
+                discount_percentage, stackable)
+
+    Returns:
+        dict: {
+            lines: [{discount_percentage, offers: [names]}] aligned with items,
+            additional_discount_percentage, transaction_offers: [names],
+            total, net_total
+        }
+    """
+    signature = _cart_signature(items, offers)
+    solution = _memo.get(signature)
+    if solution is None:
+        solution = _solve(items, offers)
+        _memo[signature] = solution
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    else:
+        _memo.move_to_end(signature)
+
+    # Callers may modify the result
+    return copy.deepcopy(solution)
+
+
+def solve_offers(offers, stackable_only=False):
+    """
+    Best offer set among offers competing for the same line (or invoice).
+
+    Returns:
+        tuple: (discount_percentage, [offer names])
+    """
+    best_single = (0, [])
+    stacked = []
+    for offer in offers:
+        percentage = _percentage(offer)
+        if not percentage:
+            continue
+        if cint(offer.get("stackable")):
+            stacked.append(offer)
+        elif stackable_only:
+            continue
+        if percentage > best_single[0]:
+            best_single = (percentage, [offer.get("name")])
+
+    if len(stacked) > 1:
+        remaining = 1.0
+        for offer in stacked:
+            remaining *= 1 - _percentage(offer) / 100.0
+        combined = flt((1 - remaining) * 100, 6)
+        if combined > best_single[0]:
+            return combined, [offer.get("name") for offer in stacked]
+
+    return best_single
+
+
+def _solve(items, offers):
+    item_offers = {}
+    transaction_offers = []
+    for offer in offers:
+        offer_type = offer.get("offer_type")
+        if offer_type in ITEM_OFFER_TYPES:
+            if offer.get(offer_type):
+                item_offers.setdefault((offer_type, offer.get(offer_type)), []).append(offer)
+        else:
+            transaction_offers.append(offer)
+
+    # Line choices, once per distinct (item_code, item_group, brand)
+    choices = {}
+    lines = []
+    for item in items:
+        key = tuple(item.get(field) for field in ITEM_OFFER_TYPES)
+        if key not in choices:
+            targeting = []
+            for field, value in zip(ITEM_OFFER_TYPES, key):
+                if value:
+                    targeting.extend(item_offers.get((field, value), ()))
+            choices[key] = (solve_offers(targeting), solve_offers(targeting, stackable_only=True))
+        lines.append((flt(item.get("qty")) * flt(item.get("rate")), choices[key]))
+
+    total = sum(amount for amount, _choice in lines)
+    transaction = solve_offers(transaction_offers)
+    stackable_transaction = solve_offers(transaction_offers, stackable_only=True)
+
+    # (line choice index, transaction choice) of each option - a transaction
+    # discount covers the whole invoice, so line choices are the same on every line
+    options = [
+        (0, (0, [])),                # item offers alone
+        (None, transaction),         # transaction offers alone
+        (1, stackable_transaction),  # stackable transaction + stackable item offers
+    ]
+    best = None
+    for line_choice, (transaction_percentage, transaction_names) in options:
+        line_total = sum(
+            amount * (1 - choice[line_choice][0] / 100.0) if line_choice is not None else amount
+            for amount, choice in lines
+        )
+        net_total = flt(line_total * (1 - transaction_percentage / 100.0), 6)
+        if best is None or net_total < best["net_total"]:
+            best = {
+                "lines": [
+                    _line_solution(choice[line_choice] if line_choice is not None else (0, []))
+                    for _amount, choice in lines
+                ],
+                "additional_discount_percentage": transaction_percentage,
+                "transaction_offers": transaction_names,
+                "total": flt(total, 6),
+                "net_total": net_total,
+            }
+
+    return best
+
+
+def _line_solution(choice):
+    return {"discount_percentage": choice[0], "offers": choice[1]}
+
+
+def _percentage(offer):
+    return min(max(flt(offer.get("discount_percentage")), 0), 100)
+
+
+def _cart_signature(items, offers):
+    """Hash of everything the solution depends on (lines and offers, in order)."""
+    payload = [
+        [[item.get(field) for field in ITEM_OFFER_TYPES] + [flt(item.get("qty")), flt(item.get("rate"))]
+         for item in items],
+        [[offer.get("name"), offer.get("offer_type"), offer.get(offer.get("offer_type") or "name"),
+          flt(offer.get("discount_percentage")), cint(offer.get("stackable"))]
+         for offer in offers],
+    ]
+    return hashlib.sha1(json.dumps(payload, default=str).encode()).hexdigest()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Sales Invoice on_submit hook.
+Keeps the materialized returned balances of the original invoice up to date.
+"""
+from __future__ import unicode_literals
+from posawesome.api.sales_invoice import update_returned_balances
+
+
+def on_submit(doc, method):
+    """
+    Book a submitted return on its original invoice
+    (posa_returned_amount / posa_returned_qty).
+    """
+    update_returned_balances(doc, sign=1)
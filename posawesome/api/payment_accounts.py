@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Mode of Payment Account Resolver
+
+Single resolver of the account of a mode of payment, used by payment_entry.py
+(settlement Payment Entries) and pos_profile.py (POS payment methods):
+- One query builds the account map of a company: its Mode of Payment Accounts
+  and every fallback (default cash / bank account, first Cash / Bank account)
+- The map is cached in Redis per company (ACCOUNTS_CACHE_TTL as safety net)
+- Invalidation: Mode of Payment on_update / on_trash drops every company map,
+  Company on_update / on_trash drops its own map, Account on_update / on_trash /
+  after_rename drops the map of its company (first Cash / Bank account fallbacks)
+
+POS Payment Method has no account column in ERPNext v15, so the POS Profile
+does not change the account of a mode of payment.
+"""
+
+from __future__ import unicode_literals
+import frappe
+
+
+ACCOUNTS_CACHE_KEY = "posa_payment_accounts|{0}"
+ACCOUNTS_CACHE_TTL = 24 * 60 * 60
+
+
+# =============================================================================
+# RESOLVER
+# =============================================================================
+
+def get_payment_account(company, mode_of_payment, any_account=False):
+    """
+    Account of a mode of payment for a company.
+
+    Priority:
+    1. Mode of Payment Account (company-specific)
+    2. Company default cash / bank account
+    3. any_account only: first Cash / Bank ledger of the company
+
+    Returns:
+        str: Account name or None
+    """
+    accounts = get_company_accounts(company)
+    fallbacks = ["default_cash", "default_bank"]
+    if any_account:
+        fallbacks += ["any_cash", "any_bank"]
+
+    account = accounts["modes"].get(mode_of_payment)
+    for fallback in fallbacks:
+        account = account or accounts[fallback]
+
+    return account or None
+
+
+def get_payment_accounts(company, modes_of_payment, any_account=False):
+    """Accounts of several modes of payment: {mode_of_payment: account} (unresolved ones left out)."""
+    accounts = {}
+    for mode_of_payment in modes_of_payment:
+        account = get_payment_account(company, mode_of_payment, any_account)
+        if account:
+            accounts[mode_of_payment] = account
+    return accounts
+
+
+def get_company_accounts(company):
+    """
+    Cached account map of a company:
+    {modes: {mode_of_payment: account}, default_cash, default_bank, any_cash, any_bank}
+    """
+    cache_key = ACCOUNTS_CACHE_KEY.format(company)
+    try:
+        accounts = frappe.cache().get_value(cache_key)
+        if accounts is not None:
+            return accounts
+    except Exception:
+        # Graceful degradation - build from the database (no logging needed)
+        pass
+
+    accounts = _build_company_accounts(company)
+
+    try:
+        frappe.cache().set_value(cache_key, accounts, expires_in_sec=ACCOUNTS_CACHE_TTL)
+    except Exception:
+        # Graceful degradation - not cached (no logging needed)
+        pass
+
+    return accounts
+
+
+def _build_company_accounts(company):
+    """Account map of a company in one query."""
+    accounts = {
+        "modes": {},
+        "default_cash": None,
+        "default_bank": None,
+        "any_cash": None,
+        "any_bank": None,
+    }
+    if not company:
+        return accounts
+
+    for row in frappe.db.sql("""
+        SELECT 'modes' AS kind, parent AS mode_of_payment, default_account AS account
+        FROM `tabMode of Payment Account`
+        WHERE company = %(company)s AND IFNULL(default_account, '') != ''
+        UNION ALL
+        SELECT 'default_cash', NULL, default_cash_account
+        FROM `tabCompany`
+        WHERE name = %(company)s
+        UNION ALL
+        SELECT 'default_bank', NULL, default_bank_account
+        FROM `tabCompany`
+        WHERE name = %(company)s
+        UNION ALL
+        (SELECT 'any_cash', NULL, name
+        FROM `tabAccount`
+        WHERE company = %(company)s AND account_type = 'Cash' AND is_group = 0
+        ORDER BY lft LIMIT 1)
+        UNION ALL
+        (SELECT 'any_bank', NULL, name
+        FROM `tabAccount`
+        WHERE company = %(company)s AND account_type = 'Bank' AND is_group = 0
+        ORDER BY lft LIMIT 1)
+    """, {"company": company}, as_dict=1):
+        if row.kind == "modes":
+            accounts["modes"].setdefault(row.mode_of_payment, row.account)
+        else:
+            accounts[row.kind] = row.account or None
+
+    return accounts
+
+
+# =============================================================================
+# INVALIDATION (Mode of Payment / Company / Account doc_events)
+# =============================================================================
+
+def on_mode_of_payment_change(doc, method=None):
+    """Mode of Payment on_update / on_trash: its accounts may belong to any company."""
+    try:
+        frappe.cache().delete_keys(ACCOUNTS_CACHE_KEY.format(""))
+    except Exception:
+        frappe.log_error("[[payment_accounts.py]] on_mode_of_payment_change")
+
+
+def on_company_change(doc, method=None):
+    """Company on_update / on_trash: default cash / bank accounts."""
+    try:
+        frappe.cache().delete_value(ACCOUNTS_CACHE_KEY.format(doc.name))
+    except Exception:
+        frappe.log_error("[[payment_accounts.py]] on_company_change")
+
+
+def on_account_change(doc, method=None, old_name=None, new_name=None, merge=False):
+    """Account on_update / on_trash / after_rename: first Cash / Bank account of its company."""
+    try:
+        frappe.cache().delete_value(ACCOUNTS_CACHE_KEY.format(doc.company))
+    except Exception:
+        frappe.log_error("[[payment_accounts.py]] on_account_change")
@@ -18,6 +18,7 @@ import json
 import frappe
 from frappe import _
 from frappe.utils import flt, nowdate
+from posawesome.api import payment_accounts
 
 # Import ERPNext's native Payment Entry functions
 from erpnext.accounts.doctype.payment_entry.payment_entry import get_payment_entry
@@ -29,7 +30,7 @@ def create_payment_entry_for_invoice(invoice_name, payment_data):
     Create and submit Payment Entry for a submitted Sales Invoice (Settlement)
 
     Uses ERPNext's native get_payment_entry() to create Payment Entry
-    following the standard ERPNext workflow.
+    following the standard ERPNext workflow (see _create_payment_entries).
 
     Args:
         invoice_name (str): Sales Invoice name
@@ -55,96 +56,7 @@ def create_payment_entry_for_invoice(invoice_name, payment_data):
         if isinstance(payment_data, str):
             payment_data = json.loads(payment_data)
 
-        # Validate invoice exists
-        if not frappe.db.exists("Sales Invoice", invoice_name):
-            frappe.throw(_("Sales Invoice {0} not found").format(invoice_name))
-
-        # Get invoice document
-        invoice = frappe.get_doc("Sales Invoice", invoice_name)
-
-        # Validate invoice is submitted
-        if invoice.docstatus != 1:
-            frappe.throw(_("Sales Invoice {0} is not submitted").format(invoice_name))
-
-        # Validate invoice is not a return invoice
-        if invoice.is_return:
-            frappe.throw(_("Cannot create payment for return invoice"))
-
-        # Validate payment amount
-        payment_amount = flt(payment_data.get("amount") or 0, 2)
-        if payment_amount <= 0:
-            frappe.throw(_("Payment amount must be greater than zero"))
-
-        # Validate outstanding amount
-        outstanding_amount = flt(invoice.outstanding_amount or 0, 2)
-        if payment_amount > outstanding_amount:
-            frappe.throw(
-                _("Payment amount ({0}) cannot exceed outstanding amount ({1})").format(
-                    payment_amount, outstanding_amount
-                )
-            )
-
-        # Use ERPNext's native get_payment_entry to create Payment Entry
-        # This creates a Payment Entry with all standard fields populated
-        payment_entry = get_payment_entry("Sales Invoice", invoice_name)
-
-        # Set payment method
-        if payment_data.get("mode_of_payment"):
-            payment_entry.mode_of_payment = payment_data["mode_of_payment"]
-
-        # Set payment amounts
-        payment_entry.paid_amount = payment_amount
-        payment_entry.received_amount = payment_amount
-
-        # Set payment account
-        # Priority: 1. Provided account, 2. Account from mode_of_payment, 3. Default from Payment Entry
-        if payment_data.get("account"):
-            # Use provided account
-            if payment_entry.payment_type == "Receive":
-                payment_entry.paid_to = payment_data["account"]
-            else:
-                payment_entry.paid_from = payment_data["account"]
-        elif payment_data.get("mode_of_payment"):
-            # Try to get account from mode_of_payment
-            account = _get_payment_account(
-                payment_data["mode_of_payment"],
-                invoice.company,
-                payment_data.get("pos_profile"),
-            )
-            if account:
-                if payment_entry.payment_type == "Receive":
-                    payment_entry.paid_to = account
-                else:
-                    payment_entry.paid_from = account
-
-        # Update reference allocated_amount to match payment amount
-        # This ensures only the settlement amount is allocated, not the full outstanding
-        if payment_entry.references:
-            for reference in payment_entry.references:
-                if reference.reference_doctype == "Sales Invoice" and reference.reference_name == invoice_name:
-                    # Set allocated amount to payment amount (not full outstanding)
-                    reference.allocated_amount = payment_amount
-                    break
-
-        # Set posting date to today
-        payment_entry.posting_date = nowdate()
-        payment_entry.reference_date = nowdate()
-
-        # Set missing values (this will recalculate amounts based on allocated_amount)
-        payment_entry.set_missing_values()
-        payment_entry.set_missing_ref_details()
-
-        # Validate Payment Entry
-        payment_entry.validate()
-
-        # Save Payment Entry
-        payment_entry.insert()
-
-        # Submit Payment Entry
-        payment_entry.submit()
-
-        # Return created Payment Entry
-        return payment_entry.as_dict()
+        return _create_payment_entries([{"invoice_name": invoice_name, "payments": [payment_data]}])[0]
 
     except frappe.ValidationError:
         # Re-raise validation errors as-is
@@ -159,6 +71,9 @@ def create_payment_entry_for_multiple_payments(invoice_name, payments_list):
     """
     Create Payment Entry for multiple payment methods (split payment)
 
+    One Payment Entry per payment method, created in a single batch:
+    the invoice is loaded once and all accounts are resolved in one query.
+
     Args:
         invoice_name (str): Sales Invoice name
         payments_list (list|str): List of payment dictionaries, each with:
@@ -178,64 +93,195 @@ def create_payment_entry_for_multiple_payments(invoice_name, payments_list):
         if not isinstance(payments_list, list):
             frappe.throw(_("payments_list must be a list"))
 
-        # Validate invoice
-        if not frappe.db.exists("Sales Invoice", invoice_name):
+        return _create_payment_entries([{"invoice_name": invoice_name, "payments": payments_list}])
+
+    except frappe.ValidationError:
+        raise
+    except Exception as e:
+        frappe.log_error(f"[[payment_entry.py]] create_payment_entry_for_multiple_payments")
+        frappe.throw(_("Error creating payment entries"))
+
+
+@frappe.whitelist()
+def create_payment_entries_for_invoices(settlements):
+    """
+    Bulk settlement: Payment Entries for several invoices (e.g. all debts of a customer)
+
+    All entries are created in the same transaction - if one fails, none is kept.
+
+    Args:
+        settlements (list|str): List of dictionaries, each with:
+            - invoice_name: Sales Invoice name
+            - payments: List of payments (same format as create_payment_entry_for_multiple_payments)
+
+    Returns:
+        list: List of created Payment Entry documents (in settlements order)
+
+    Example:
+        settlements = [
+            {"invoice_name": "ACC-SINV-0001", "payments": [{"mode_of_payment": "Cash", "amount": 50}]},
+            {"invoice_name": "ACC-SINV-0002", "payments": [{"mode_of_payment": "Cash", "amount": 80}]}
+        ]
+    """
+    try:
+        # Parse settlements if it's a string
+        if isinstance(settlements, str):
+            settlements = json.loads(settlements)
+
+        if not isinstance(settlements, list):
+            frappe.throw(_("settlements must be a list"))
+
+        return _create_payment_entries(settlements)
+
+    except frappe.ValidationError:
+        raise
+    except Exception as e:
+        frappe.log_error(f"[[payment_entry.py]] create_payment_entries_for_invoices")
+        frappe.throw(_("Error creating payment entries"))
+
+
+def _create_payment_entries(settlements):
+    """
+    Create and submit Payment Entries for [{invoice_name, payments}] in one batch.
+
+    - All invoices are loaded and validated in one query (exists, submitted,
+      not a return, total payments <= outstanding) before anything is created
+    - Accounts of all payment methods come from the cached company account map
+    - get_payment_entry() runs once per invoice; entries of further payment
+      methods are copies of that first entry, whose reference details
+      (outstanding amount) are reloaded once the previous entries are in
+    - Each entry is submitted on insert (docstatus = 1): one validation pass
+      instead of validate(), insert() and submit()
+
+    Runs in the caller's transaction: any error rolls back every entry.
+    """
+    # Normalize: positive payments per invoice, request order kept
+    planned = []
+    for settlement in settlements:
+        invoice_name = settlement.get("invoice_name")
+        payments = [
+            dict(p, amount=flt(p.get("amount") or 0, 2))
+            for p in (settlement.get("payments") or [])
+            if flt(p.get("amount") or 0, 2) > 0
+        ]
+        if not invoice_name:
+            frappe.throw(_("Sales Invoice is required"))
+        if not payments:
+            frappe.throw(_("Payment amount must be greater than zero"))
+        planned.append((invoice_name, payments))
+
+    invoice_names = list({invoice_name for invoice_name, _payments in planned})
+    invoices = {
+        row.name: row
+        for row in frappe.get_all(
+            "Sales Invoice",
+            filters={"name": ["in", invoice_names]},
+            fields=["name", "docstatus", "is_return", "outstanding_amount", "company"],
+        )
+    }
+
+    # Shared validation of the whole batch
+    total_by_invoice = {}
+    for invoice_name, payments in planned:
+        total_by_invoice[invoice_name] = total_by_invoice.get(invoice_name, 0) + sum(
+            p["amount"] for p in payments)
+
+    for invoice_name, total_payment in total_by_invoice.items():
+        invoice = invoices.get(invoice_name)
+
+        # Validate invoice exists
+        if not invoice:
             frappe.throw(_("Sales Invoice {0} not found").format(invoice_name))
 
-        invoice = frappe.get_doc("Sales Invoice", invoice_name)
+        # Validate invoice is submitted
         if invoice.docstatus != 1:
             frappe.throw(_("Sales Invoice {0} is not submitted").format(invoice_name))
 
-        # Calculate total payment amount
-        total_payment = sum(flt(p.get("amount") or 0, 2) for p in payments_list)
-        outstanding_amount = flt(invoice.outstanding_amount or 0, 2)
+        # Validate invoice is not a return invoice
+        if invoice.is_return:
+            frappe.throw(_("Cannot create payment for return invoice"))
 
-        if total_payment > outstanding_amount:
+        # Validate outstanding amount
+        outstanding_amount = flt(invoice.outstanding_amount or 0, 2)
+        if flt(total_payment, 2) > outstanding_amount:
             frappe.throw(
-                _("Total payment amount ({0}) cannot exceed outstanding amount ({1})").format(
-                    total_payment, outstanding_amount
+                _("Payment amount ({0}) cannot exceed outstanding amount ({1})").format(
+                    flt(total_payment, 2), outstanding_amount
                 )
             )
 
-        # Create Payment Entry for each payment method
-        created_entries = []
-        remaining_outstanding = outstanding_amount
+    # Accounts of all payment methods (cached company account map)
+    modes_by_company = {}
+    for invoice_name, payments in planned:
+        for payment in payments:
+            if payment.get("mode_of_payment") and not payment.get("account"):
+                modes_by_company.setdefault(invoices[invoice_name].company, set()).add(
+                    payment["mode_of_payment"])
 
-        for payment_data in payments_list:
-            payment_amount = flt(payment_data.get("amount") or 0, 2)
-            if payment_amount <= 0:
-                continue
+    accounts = {
+        company: _get_payment_accounts(modes, company)
+        for company, modes in modes_by_company.items()
+    }
 
-            # Create Payment Entry for this payment method
-            # Use the remaining outstanding amount as the limit
-            payment_data_copy = payment_data.copy()
-            payment_data_copy["amount"] = min(payment_amount, remaining_outstanding)
+    created_entries = []
+    for invoice_name, payments in planned:
+        company = invoices[invoice_name].company
 
-            entry = create_payment_entry_for_invoice(invoice_name, payment_data_copy)
-            created_entries.append(entry)
+        # Use ERPNext's native get_payment_entry once per invoice
+        # This creates a Payment Entry with all standard fields populated
+        template = get_payment_entry("Sales Invoice", invoice_name)
+        entries = [template] + [frappe.copy_doc(template) for _p in payments[1:]]
 
-            # Update remaining outstanding
-            remaining_outstanding -= payment_amount
-            if remaining_outstanding <= 0:
-                break
+        for payment_entry, payment_data in zip(entries, payments):
+            payment_amount = payment_data["amount"]
 
-        return created_entries
+            # Set payment method
+            if payment_data.get("mode_of_payment"):
+                payment_entry.mode_of_payment = payment_data["mode_of_payment"]
 
-    except frappe.ValidationError:
-        raise
-    except Exception as e:
-        frappe.log_error(f"[[payment_entry.py]] create_payment_entry_for_multiple_payments")
-        frappe.throw(_("Error creating payment entries"))
+            # Set payment amounts
+            payment_entry.paid_amount = payment_amount
+            payment_entry.received_amount = payment_amount
+
+            # Set payment account
+            # Priority: 1. Provided account, 2. Account from mode_of_payment, 3. Default from Payment Entry
+            account = payment_data.get("account") or accounts.get(company, {}).get(
+                payment_data.get("mode_of_payment"))
+            if account:
+                if payment_entry.payment_type == "Receive":
+                    payment_entry.paid_to = account
+                else:
+                    payment_entry.paid_from = account
+
+            # Update reference allocated_amount to match payment amount
+            # This ensures only the settlement amount is allocated, not the full outstanding
+            for reference in payment_entry.references or []:
+                if reference.reference_doctype == "Sales Invoice" and reference.reference_name == invoice_name:
+                    # Set allocated amount to payment amount (not full outstanding)
+                    reference.allocated_amount = payment_amount
+                    break
+
+            # Set posting date to today
+            payment_entry.posting_date = nowdate()
+            payment_entry.reference_date = nowdate()
+
+            # Set missing values (this will recalculate amounts based on allocated_amount)
+            # force: copies carry the outstanding amount read before the previous entries
+            payment_entry.set_missing_values()
+            payment_entry.set_missing_ref_details(force=True)
+
+            # Submit on insert - validate() and before_submit() run once
+            payment_entry.docstatus = 1
+            payment_entry.insert()
+
+            created_entries.append(payment_entry.as_dict())
+
+    return created_entries
 
 
 def _get_payment_account(mode_of_payment, company, pos_profile=None):
     """
-    Get payment account for mode of payment
-
-    Priority:
-    1. Mode of Payment Account (company-specific)
-    2. POS Payment Method account (if pos_profile provided)
-    3. Company default cash/bank account
+    Get payment account for mode of payment (see _get_payment_accounts)
 
     Args:
         mode_of_payment (str): Mode of Payment name
@@ -245,38 +291,31 @@ def _get_payment_account(mode_of_payment, company, pos_profile=None):
     Returns:
         str: Account name or None
     """
-    try:
-        # Try Mode of Payment Account (company-specific)
-        account = frappe.db.get_value(
-            "Mode of Payment Account",
-            {"parent": mode_of_payment, "company": company},
-            "default_account",
-        )
-        if account:
-            return account
-
-        # Try POS Payment Method account (if pos_profile provided)
-        if pos_profile:
-            account = frappe.db.get_value(
-                "POS Payment Method",
-                {"parent": pos_profile, "mode_of_payment": mode_of_payment},
-                "account",
-            )
-            if account:
-                return account
+    return _get_payment_accounts([mode_of_payment], company, pos_profile).get(mode_of_payment)
 
-        # Try company default cash account
-        cash_account = frappe.db.get_value("Company", company, "default_cash_account")
-        if cash_account:
-            return cash_account
 
-        # Try company default bank account
-        bank_account = frappe.db.get_value("Company", company, "default_bank_account")
-        if bank_account:
-            return bank_account
+def _get_payment_accounts(modes_of_payment, company, pos_profile=None):
+    """
+    Get payment accounts for several modes of payment
+    Resolved from the cached company account map (payment_accounts.py)
 
-        return None
+    Priority:
+    1. Mode of Payment Account (company-specific)
+    2. Company default cash/bank account
 
-    except Exception:
-        return None
+    POS Payment Method has no account column in ERPNext v15, so pos_profile
+    does not change the result; it is kept for callers.
 
+    Args:
+        modes_of_payment (iterable): Mode of Payment names
+        company (str): Company name
+        pos_profile (str, optional): POS Profile name
+
+    Returns:
+        dict: {mode_of_payment: account} (modes without any account are left out)
+    """
+    try:
+        return payment_accounts.get_payment_accounts(company, [m for m in modes_of_payment if m])
+
+    except Exception:
+        return {}
@@ -13,6 +13,7 @@ FRAPPE API PATTERN:
 
 from __future__ import unicode_literals
 import frappe
+from posawesome.api import payment_accounts
 
 
 @frappe.whitelist()
@@ -201,76 +202,12 @@ def get_profile_warehouses(profile_name):
 def get_payment_account(mode_of_payment, company):
     """
     Get account for mode of payment
+    Resolved from the cached company account map (payment_accounts.py):
+    Mode of Payment Account, company default cash / bank, first Cash / Bank ledger
     """
     try:
-        # Try to get account from Mode of Payment Account table
-        account = frappe.db.get_value(
-            "Mode of Payment Account",
-            {"parent": mode_of_payment, "company": company},
-            "default_account"
-        )
-
-        if account:
-            result = {"account": account}
-            return result
-
-        # Try to get account from POS Payment Method
-        account = frappe.db.get_value(
-            "POS Payment Method",
-            {"mode_of_payment": mode_of_payment},
-            "account"
-        )
-
-        if account:
-            result = {"account": account}
-            return result
-
-        # Try to get company's default cash account
-        cash_account = frappe.db.get_value(
-            "Company",
-            company,
-            "default_cash_account"
-        )
-
-        if cash_account:
-            result = {"account": cash_account}
-            return result
-
-        # Try to get company's default bank account
-        bank_account = frappe.db.get_value(
-            "Company",
-            company,
-            "default_bank_account"
-        )
-
-        if bank_account:
-            result = {"account": bank_account}
-            return result
-
-        # Try to get any cash account for the company
-        cash_account = frappe.db.get_value(
-            "Account",
-            {"account_type": "Cash", "company": company, "is_group": 0},
-            "name"
-        )
-
-        if cash_account:
-            result = {"account": cash_account}
-            return result
-
-        # Try to get any bank account for the company
-        bank_account = frappe.db.get_value(
-            "Account",
-            {"account_type": "Bank", "company": company, "is_group": 0},
-            "name"
-        )
-
-        if bank_account:
-            result = {"account": bank_account}
-            return result
-
-        result = {"account": ""}
-        return result
+        account = payment_accounts.get_payment_account(company, mode_of_payment, any_account=True)
+        return {"account": account or ""}
 
     except Exception:
         # Graceful degradation - return empty account (no logging needed)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Raw Redis helpers shared by the POS Awesome caches and indexes
+(item_index, search_backend, shift_totals, generation_lru).
+
+RedisWrapper overrides hset/hget/sadd/... to pickle values and prefix keys
+itself, so these modules talk to Redis through plain pipeline commands on
+site-prefixed keys.
+
+INDEX REBUILDS (item_index, search_backend):
+A full rebuild writes into temporary keys (BuildWriter) and swaps them in with
+RENAME in one MULTI/EXEC (swap_in), so searches keep using the previous index
+meanwhile. The doc_events record what they change while a rebuild runs and the
+rebuild replays it after the swap (the rebuild may have read those rows before).
+"""
+
+from __future__ import unicode_literals
+import frappe
+
+
+def make_key(name):
+    """Site-prefixed Redis key (raw redis commands bypass RedisWrapper prefixing)."""
+    return frappe.cache().make_key(name)
+
+
+def pipeline():
+    """Raw (non transactional) Redis pipeline."""
+    return frappe.cache().pipeline(transaction=False)
+
+
+def decode(value):
+    """Redis replies are bytes - decode to str (None and str pass through)."""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class BuildWriter(object):
+    """Pipelined writes to the temporary keys of a rebuild (build_key.format(name)), remembering the names."""
+
+    def __init__(self, build_key):
+        self.build_key = build_key
+        self.names = set()
+        self.pipe = pipeline()
+
+    def _target(self, name):
+        self.names.add(name)
+        return make_key(self.build_key.format(name))
+
+    def hset(self, name, field, value):
+        self.pipe.hset(self._target(name), field, value)
+
+    def sadd(self, name, member):
+        self.pipe.sadd(self._target(name), member)
+
+    def set(self, name, value):
+        self.pipe.set(self._target(name), value)
+
+    def flush(self):
+        self.pipe.execute()
+
+
+def swap_in(writer, live_prefixes, exclude_prefix=None):
+    """
+    Replace a live index by the keys of a BuildWriter in one MULTI/EXEC.
+    Live keys starting with one of live_prefixes that were not rebuilt are dropped
+    (keys starting with exclude_prefix - the temporary keys - are kept).
+    """
+    exclude_prefix = decode(make_key(exclude_prefix)) if exclude_prefix else None
+    new_keys = {decode(make_key(name)) for name in writer.names}
+
+    pipe = frappe.cache().pipeline(transaction=True)
+    for live_prefix in live_prefixes:
+        for key in frappe.cache().get_keys(live_prefix) or []:
+            key = decode(key)
+            if key not in new_keys and not (exclude_prefix and key.startswith(exclude_prefix)):
+                pipe.delete(key)
+    for name in writer.names:
+        pipe.rename(make_key(writer.build_key.format(name)), make_key(name))
+    pipe.execute()
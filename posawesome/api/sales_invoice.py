@@ -4,10 +4,14 @@ Sales Invoice API - ERPNext Native Workflow Only
 Following ERPNext sales_invoice.py approach: __islocal -> insert() -> submit()
 """
 from __future__ import unicode_literals
+import base64
+import copy
 import json
 import frappe
 from frappe import _
-from frappe.utils import flt
+from frappe.utils import cint, flt, get_datetime
+from posawesome.api.customer_names import get_customer_names
+from posawesome.api import shift_totals
 
 
 # ===== DRAFT OPERATIONS =====
@@ -65,6 +69,8 @@ def get_draft_invoices(pos_opening_shift=None):
         filters = {
             "is_pos": 1,
             "docstatus": 0,
+            # Not invoices accepted for background submission (submit_invoice_async)
+            "posa_submit_status": ["is", "not set"],
         }
 
         if pos_opening_shift:
@@ -144,77 +150,132 @@ def delete_invoice(invoice_name):
 
 # ===== RETURN HELPERS =====
 
+# Sales Invoice Item fields returned with returnable invoices (get_invoices_for_return)
+RETURN_ITEM_FIELDS = [
+    "name", "item_code", "item_name", "qty", "rate", "amount", "stock_qty",
+    "discount_percentage", "discount_amount", "uom", "warehouse",
+    "price_list_rate", "conversion_factor"
+]
+
+# Materialized returned balances, kept up to date by update_returned_balances()
+# on submit / cancel of every return (backfilled by patches/v15/backfill_returned_balances.py):
+# - Sales Invoice.posa_returned_amount: total returned amount (positive)
+# - Sales Invoice Item.posa_returned_qty: returned qty of the original row (positive)
+RETURN_BALANCE_CUSTOM_FIELDS = {
+    "Sales Invoice": [{
+        "fieldname": "posa_returned_amount",
+        "label": "Returned Amount",
+        "fieldtype": "Currency",
+        "options": "currency",
+        "insert_after": "posa_is_printed",
+        "read_only": 1,
+        "allow_on_submit": 1,
+        "no_copy": 1,
+        "print_hide": 1,
+    }],
+    "Sales Invoice Item": [{
+        "fieldname": "posa_returned_qty",
+        "label": "Returned Qty",
+        "fieldtype": "Float",
+        "insert_after": "posa_row_id",
+        "read_only": 1,
+        "allow_on_submit": 1,
+        "no_copy": 1,
+        "print_hide": 1,
+    }],
+}
+
+# Returned amount of an invoice `si` (positive)
+RETURNED_AMOUNT_COLUMN = "IFNULL(si.posa_returned_amount, 0)"
+
+
+def update_returned_balances(return_doc, sign=1):
+    """
+    Apply a return invoice to the returned balances of its original invoice.
+    Called with sign=1 on submit and sign=-1 on cancel of the return.
+
+    Updates are increments done in SQL, so concurrent returns against the same
+    invoice are serialized by the row locks of the current transaction.
+    Return rows without sales_invoice_item (legacy returns) are booked on the
+    first original row with the same item_code.
+    """
+    if not (return_doc.get("is_return") and return_doc.get("return_against")):
+        return
+
+    original_invoice = return_doc.return_against
+
+    # Return grand totals and quantities are negative
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice`
+        SET posa_returned_amount = IFNULL(posa_returned_amount, 0) + %(amount)s
+        WHERE name = %(name)s
+    """, {"amount": -sign * flt(return_doc.grand_total), "name": original_invoice})
+
+    returned_by_row = {}
+    returned_by_item_code = {}
+    for item in return_doc.get("items") or []:
+        returned_qty = -sign * flt(item.qty)
+        if item.get("sales_invoice_item"):
+            returned_by_row[item.sales_invoice_item] = returned_by_row.get(
+                item.sales_invoice_item, 0) + returned_qty
+        else:
+            returned_by_item_code[item.item_code] = returned_by_item_code.get(
+                item.item_code, 0) + returned_qty
+
+    if returned_by_item_code:
+        first_rows = {}
+        for row in frappe.db.sql("""
+            SELECT name, item_code
+            FROM `tabSales Invoice Item`
+            WHERE parent = %(parent)s AND parenttype = 'Sales Invoice'
+            AND item_code IN %(item_codes)s
+            ORDER BY idx
+        """, {"parent": original_invoice, "item_codes": tuple(returned_by_item_code)}, as_dict=1):
+            first_rows.setdefault(row.item_code, row.name)
+
+        for item_code, returned_qty in returned_by_item_code.items():
+            if item_code in first_rows:
+                row_name = first_rows[item_code]
+                returned_by_row[row_name] = returned_by_row.get(row_name, 0) + returned_qty
+
+    if returned_by_row:
+        # One UPDATE for all rows: CASE name WHEN <row> THEN <qty> ...
+        params = {"parent": original_invoice, "rows": tuple(returned_by_row)}
+        cases = []
+        for i, (row_name, returned_qty) in enumerate(returned_by_row.items()):
+            params[f"row_{i}"] = row_name
+            params[f"qty_{i}"] = returned_qty
+            cases.append(f"WHEN %(row_{i})s THEN %(qty_{i})s")
+
+        frappe.db.sql(f"""
+            UPDATE `tabSales Invoice Item`
+            SET posa_returned_qty = IFNULL(posa_returned_qty, 0) + (CASE name {" ".join(cases)} ELSE 0 END)
+            WHERE parent = %(parent)s AND parenttype = 'Sales Invoice'
+            AND name IN %(rows)s
+        """, params)
+
+    frappe.clear_document_cache("Sales Invoice", original_invoice)
+
+
 def calculate_return_stats(invoice_name):
     """
     Calculate remaining returnable amounts for an invoice.
+    Reads the materialized posa_returned_amount / posa_returned_qty columns
+    (two indexed lookups, no aggregation over the returns).
 
     Returns dict with:
     - remaining_returnable_amount: Total amount still available for return
     - items: List of items with per-item return stats
     """
     try:
-        # Get original invoice
-        invoice = frappe.get_doc("Sales Invoice", invoice_name)
-
-        # Get all return invoices against this invoice
-        return_invoices = frappe.get_all(
-            "Sales Invoice",
-            filters={
-                "return_against": invoice_name,
-                "docstatus": 1,  # Only submitted returns
-                "is_return": 1
-            },
-            fields=["name", "grand_total"]
-        )
-
-        # Calculate total already returned amount
-        total_returned_amount = sum([flt(r.grand_total)
-                                    for r in return_invoices])
-
-        # Calculate remaining amount (note: return amounts are negative)
-        remaining_amount = flt(invoice.grand_total) + \
-            flt(total_returned_amount)
-
-        # Calculate per-item return stats
-        items_stats = []
-
-        for item in invoice.items:
-            # Get all returned quantities for this item
-            returned_items = frappe.db.sql("""
-                SELECT SUM(qty) as total_returned_qty
-                FROM `tabSales Invoice Item`
-                WHERE parent IN (
-                    SELECT name FROM `tabSales Invoice`
-                    WHERE return_against = %s
-                    AND docstatus = 1
-                    AND is_return = 1
-                )
-                AND item_code = %s
-            """, (invoice_name, item.item_code), as_dict=1)
-
-            # Note: returned qty is negative, so we need to negate it
-            total_returned_qty = -1 * \
-                flt(returned_items[0].total_returned_qty) if returned_items and returned_items[0].total_returned_qty else 0
-
-            # Calculate remaining returnable quantity
-            remaining_qty = flt(item.qty) - flt(total_returned_qty)
-
-            items_stats.append({
-                "item_code": item.item_code,
-                "item_name": item.item_name,
-                "original_qty": flt(item.qty),
-                "already_returned_qty": flt(total_returned_qty),
-                "remaining_returnable_qty": max(0, remaining_qty),
-                # For frontend compatibility
-                "max_returnable_qty": max(0, remaining_qty)
-            })
+        totals = frappe.db.sql(f"""
+            SELECT si.name, si.grand_total, {RETURNED_AMOUNT_COLUMN} AS returned_amount
+            FROM `tabSales Invoice` si
+            WHERE si.name = %s
+        """, (invoice_name,), as_dict=1)
 
-        return {
-            "remaining_returnable_amount": max(0, remaining_amount),
-            "total_returned_amount": abs(total_returned_amount),
-            "original_amount": flt(invoice.grand_total),
-            "items": items_stats
-        }
+        stats, _items = _get_return_stats_batch(totals)
+        return stats[invoice_name]
 
     except Exception:
         # Graceful degradation - return zero values (no logging needed)
@@ -226,10 +287,79 @@ def calculate_return_stats(invoice_name):
         }
 
 
+def _get_return_stats_batch(invoices):
+    """
+    Return stats for many invoices in one query over their rows.
+
+    Args:
+        invoices: rows with name, grand_total, returned_amount
+
+    Returns:
+        tuple: ({invoice: stats in calculate_return_stats() shape},
+                {invoice: [original item rows with RETURN_ITEM_FIELDS]})
+    """
+    names = [inv.name for inv in invoices]
+    items_by_invoice = {name: [] for name in names}
+    returned_qty_by_row = {}
+
+    if names:
+        for item in frappe.db.sql(f"""
+            SELECT parent, {", ".join(RETURN_ITEM_FIELDS)},
+                IFNULL(posa_returned_qty, 0) AS returned_qty
+            FROM `tabSales Invoice Item`
+            WHERE parent IN %(names)s AND parenttype = 'Sales Invoice'
+            ORDER BY parent, idx
+        """, {"names": tuple(names)}, as_dict=1):
+            returned_qty_by_row[item.name] = flt(item.pop("returned_qty"))
+            items_by_invoice[item.pop("parent")].append(item)
+
+    stats = {}
+    for inv in invoices:
+        grand_total = flt(inv.grand_total)
+        total_returned_amount = flt(inv.returned_amount)
+        remaining_amount = grand_total - total_returned_amount
+
+        stats[inv.name] = {
+            "remaining_returnable_amount": max(0, remaining_amount),
+            "total_returned_amount": abs(total_returned_amount),
+            "original_amount": grand_total,
+            "items": _build_item_return_stats(items_by_invoice[inv.name], returned_qty_by_row)
+        }
+
+    return stats, items_by_invoice
+
+
+def _build_item_return_stats(original_items, returned_qty_by_row):
+    """Per-row return stats from original rows and their materialized returned qty."""
+    items_stats = []
+    for item in original_items:
+        total_returned_qty = flt(returned_qty_by_row.get(item.name, 0))
+
+        # Calculate remaining returnable quantity
+        remaining_qty = flt(item.qty) - total_returned_qty
+
+        items_stats.append({
+            "item_code": item.item_code,
+            "item_name": item.item_name,
+            "sales_invoice_item": item.name,
+            "original_qty": flt(item.qty),
+            "already_returned_qty": total_returned_qty,
+            "remaining_returnable_qty": max(0, remaining_qty),
+            # For frontend compatibility
+            "max_returnable_qty": max(0, remaining_qty)
+        })
+
+    return items_stats
+
+
 # ===== GET RETURN OPERATIONS =====
 
+# Max invoices per return search page
+MAX_RETURN_PAGE_LENGTH = 200
+
+
 @frappe.whitelist()
-def get_invoices_for_return(invoice_name=None, company=None, pos_profile=None):
+def get_invoices_for_return(invoice_name=None, company=None, pos_profile=None, start=0, page_length=50):
     """
     Search invoices for return operations
 
@@ -244,66 +374,69 @@ def get_invoices_for_return(invoice_name=None, company=None, pos_profile=None):
     - Unpaid invoices (outstanding_amount == grand_total) are allowed for return
     - Partial returns are allowed (ERPNext native behavior)
     - Invoice may have status "Paid", "Partly Paid", or "Unpaid" with remaining returnable amount
-    - Final filter is remaining_returnable_amount > 0 (which includes unpaid invoices)
+    - Final filter is remaining_returnable_amount > 0 (which includes unpaid invoices),
+      applied in SQL so every page is full
+    - Paginated with start / page_length (max MAX_RETURN_PAGE_LENGTH); return stats of
+      the whole page are read from the materialized returned balances in one query
+      (_get_return_stats_batch)
     """
     try:
         # Build filters
-        filters = {
-            "docstatus": 1,  # Only submitted invoices
-            "is_return": 0,  # Not already a return
-            "is_pos": 1,     # Only POS invoices
-            # NOTE: Do NOT filter by status - allow partial returns
+        # NOTE: Do NOT filter by status - allow partial returns
+        conditions = [
+            "si.docstatus = 1",  # Only submitted invoices
+            "si.is_return = 0",  # Not already a return
+            "si.is_pos = 1",     # Only POS invoices
+        ]
+        params = {
+            "start": max(cint(start), 0),
+            "page_length": min(max(cint(page_length) or 50, 1), MAX_RETURN_PAGE_LENGTH),
         }
 
         # Add company filter if provided
         if company:
-            filters["company"] = company
+            conditions.append("si.company = %(company)s")
+            params["company"] = company
 
         # Add pos_profile filter if provided
         if pos_profile:
             # FRAPPE STANDARD: Extract name from dict if needed
             if isinstance(pos_profile, dict):
-                filters["pos_profile"] = pos_profile.get('name')
+                params["pos_profile"] = pos_profile.get('name')
             else:
-                filters["pos_profile"] = pos_profile
+                params["pos_profile"] = pos_profile
+            conditions.append("si.pos_profile = %(pos_profile)s")
 
         # Add invoice name search if provided
         if invoice_name:
-            filters["name"] = ["like", f"%{invoice_name}%"]
-
-        # Get invoices
-        invoices = frappe.get_all(
-            "Sales Invoice",
-            filters=filters,
-            fields=[
-                "name", "customer", "grand_total",
-                "outstanding_amount", "paid_amount", "posting_date", "posting_time", "currency",
-                "status", "pos_profile"
-            ],
-            order_by="posting_date desc, creation desc",
-            limit=50
-        )
+            conditions.append("si.name LIKE %(invoice_name)s")
+            params["invoice_name"] = f"%{invoice_name}%"
+
+        # Get invoices with remaining returnable amount > 0 (materialized posa_returned_amount)
+        invoices = frappe.db.sql(f"""
+            SELECT
+                si.name, si.customer, si.grand_total,
+                si.outstanding_amount, si.paid_amount, si.posting_date, si.posting_time, si.currency,
+                si.status, si.pos_profile,
+                {RETURNED_AMOUNT_COLUMN} AS returned_amount
+            FROM `tabSales Invoice` si
+            WHERE {" AND ".join(conditions)}
+            AND si.grand_total - {RETURNED_AMOUNT_COLUMN} > 0
+            ORDER BY si.posting_date DESC, si.creation DESC
+            LIMIT %(page_length)s OFFSET %(start)s
+        """, params, as_dict=1)
 
         # FRAPPE FRAMEWORK STANDARD: Process all invoices (paid, partly paid, or unpaid)
-        # Filter by remaining_returnable_amount > 0 instead of payment status
         # This allows returning unpaid invoices (credit sales) as well
+        all_stats, all_items = _get_return_stats_batch(invoices)
         returnable_invoices = []
 
         for invoice in invoices:
-            # Calculate return stats
-            return_stats = calculate_return_stats(invoice["name"])
+            return_stats = all_stats[invoice.name]
+            invoice.pop("returned_amount", None)
 
-            # Only include invoices with remaining returnable amount > 0
             if return_stats["remaining_returnable_amount"] > 0:
-                items = frappe.get_all(
-                    "Sales Invoice Item",
-                    filters={"parent": invoice["name"]},
-                    fields=[
-                        "name", "item_code", "item_name", "qty", "rate", "amount", "stock_qty",
-                        "discount_percentage", "discount_amount", "uom", "warehouse",
-                        "price_list_rate", "conversion_factor"
-                    ]
-                )
+                items = all_items[invoice.name]
 
                 # Enrich items with return stats
                 items_dict = {item["item_code"]: item for item in items}
@@ -367,115 +500,180 @@ def get_invoices_for_return(invoice_name=None, company=None, pos_profile=None):
 
 # ===== SETTLEMENT OPERATIONS =====
 
+# Max invoices per settlement page
+MAX_SETTLEMENT_PAGE_LENGTH = 200
+
+
 @frappe.whitelist()
-def get_settlement_invoices(pos_profile=None, pos_opening_shift=None, user=None):
+def get_settlement_invoices(pos_profile=None, pos_opening_shift=None, user=None, cursor=None, page_length=50):
     """
     GET - Get submitted invoices that are Unpaid or Partly Paid for settlement
-    Returns list of invoices with outstanding_amount > 0
+    Returns invoices with outstanding_amount > 0, newest first
 
     FRAPPE STANDARD: pos_profile and pos_opening_shift can be dict or string
     Privacy: Filter by pos_profile, posa_pos_opening_shift, and owner (same pattern as print list)
+
+    The outstanding filter runs in SQL and pages are keyset-paginated over
+    (creation, name) DESC, served by the posa_settlement_index
+    (pos_profile, owner, creation) index - every page is full, whatever the
+    number of paid invoices.
+
+    Args:
+        cursor: next_cursor from the previous page (None for the first page)
+        page_length: invoices per page (max MAX_SETTLEMENT_PAGE_LENGTH)
+
+    Returns:
+        dict: {invoices: [...], next_cursor: str or None}
     """
     try:
-        # FRAPPE STANDARD: Handle string or dict parameters
-        if isinstance(pos_profile, dict):
-            pos_profile_name = pos_profile.get('name')
-        else:
-            pos_profile_name = pos_profile
+        query = _build_settlement_query(pos_profile, pos_opening_shift, user)
+        if not query:
+            return {"invoices": [], "next_cursor": None}
+
+        conditions, params = query
+        page_length = min(cint(page_length) or 50, MAX_SETTLEMENT_PAGE_LENGTH)
+        # One extra row tells whether there is a next page
+        params["limit"] = page_length + 1
+
+        last_key = _decode_settlement_cursor(cursor)
+        if last_key:
+            params["cursor_creation"], params["cursor_name"] = last_key
+            conditions.append("""(si.creation < %(cursor_creation)s
+                OR (si.creation = %(cursor_creation)s AND si.name < %(cursor_name)s))""")
+
+        invoices = frappe.db.sql(f"""
+            SELECT
+                si.name, si.customer, si.posting_date, si.posting_time, si.grand_total,
+                si.currency, si.outstanding_amount, si.status, si.creation
+            FROM `tabSales Invoice` si
+            WHERE {" AND ".join(conditions)}
+            ORDER BY si.creation DESC, si.name DESC
+            LIMIT %(limit)s
+        """, params, as_dict=1)
+
+        next_cursor = None
+        if len(invoices) > page_length:
+            invoices = invoices[:page_length]
+            last = invoices[-1]
+            next_cursor = _encode_settlement_cursor(last.creation, last.name)
+
+        # Customer names of the whole page in one query (customer_names.py)
+        customer_names = get_customer_names(invoice.customer for invoice in invoices)
 
-        if isinstance(pos_opening_shift, dict):
-            pos_opening_shift_name = pos_opening_shift.get('name')
-        else:
-            pos_opening_shift_name = pos_opening_shift
+        result = []
+        for invoice in invoices:
+            outstanding = flt(invoice.outstanding_amount)
 
-        # Use session user if not specified
-        if not user:
-            user = frappe.session.user
+            # Calculate invoice status (Unpaid or Partly Paid)
+            invoice_status = invoice.get("status")
+            if not invoice_status:
+                # Calculate status following ERPNext logic
+                grand_total = flt(invoice.get("grand_total", 0))
 
-        if not pos_profile_name:
-            return []
+                # Check payment status
+                if abs(outstanding) >= abs(grand_total) * 0.99:  # Unpaid
+                    invoice_status = "Unpaid"
+                else:  # Partially paid
+                    invoice_status = "Partly Paid"
 
-        # Build filters - same privacy pattern as print list
-        filters = {
-            "is_pos": 1,
-            "pos_profile": pos_profile_name,
-            "owner": user,
-            "docstatus": 1,  # Only submitted invoices
-            "is_return": 0,  # Not return invoices
-        }
+            result.append({
+                "name": invoice.name,
+                "customer": invoice.customer,
+                "customer_name": customer_names.get(invoice.customer, invoice.customer),
+                "posting_date": invoice.posting_date,
+                "posting_time": invoice.posting_time,
+                "grand_total": flt(invoice.grand_total or 0),
+                "outstanding_amount": outstanding,
+                "currency": invoice.currency,
+                "invoice_status": invoice_status,
+            })
 
-        # Add pos_opening_shift filter if provided
-        if pos_opening_shift_name:
-            filters["posa_pos_opening_shift"] = pos_opening_shift_name
+        return {"invoices": result, "next_cursor": next_cursor}
 
-        # FRAPPE STANDARD: Fetch invoices with all required fields
-        invoices = frappe.get_all(
-            "Sales Invoice",
-            filters=filters,
-            fields=[
-                "name",
-                "customer",
-                "posting_date",
-                "posting_time",
-                "grand_total",
-                "currency",
-                "outstanding_amount",
-                "paid_amount",
-                "status",
-                "posa_pos_opening_shift",
-                "pos_profile",
-                "owner",
-            ],
-            order_by="creation desc",
-            limit=50,
-        )
+    except Exception:
+        # Graceful degradation - return empty page (no logging needed)
+        return {"invoices": [], "next_cursor": None}
 
-        # Filter invoices where outstanding_amount > 0 (Unpaid or Partly Paid)
-        result = []
-        for invoice in invoices:
-            outstanding = flt(invoice.get("outstanding_amount", 0))
-            
-            # Only include invoices with outstanding amount > 0
-            if outstanding > 0:
-                # Get customer name
-                customer_name = invoice.customer
-                if invoice.customer:
-                    try:
-                        customer_name = frappe.get_value(
-                            "Customer", invoice.customer, "customer_name") or invoice.customer
-                    except:
-                        customer_name = invoice.customer
-
-                # Calculate invoice status (Unpaid or Partly Paid)
-                invoice_status = invoice.get("status")
-                if not invoice_status:
-                    # Calculate status following ERPNext logic
-                    outstanding_amount = flt(invoice.get("outstanding_amount", 0))
-                    grand_total = flt(invoice.get("grand_total", 0))
 
-                    # Check payment status
-                    if abs(outstanding_amount) >= abs(grand_total) * 0.99:  # Unpaid
-                        invoice_status = "Unpaid"
-                    else:  # Partially paid
-                        invoice_status = "Partly Paid"
-
-                result.append({
-                    "name": invoice.name,
-                    "customer": invoice.customer,
-                    "customer_name": customer_name,
-                    "posting_date": invoice.posting_date,
-                    "posting_time": invoice.posting_time,
-                    "grand_total": flt(invoice.grand_total or 0),
-                    "outstanding_amount": outstanding,
-                    "currency": invoice.currency,
-                    "invoice_status": invoice_status,
-                })
+@frappe.whitelist()
+def get_settlement_invoices_count(pos_profile=None, pos_opening_shift=None, user=None):
+    """
+    GET - Number of invoices available for settlement (same filters as get_settlement_invoices)
+    """
+    try:
+        query = _build_settlement_query(pos_profile, pos_opening_shift, user)
+        if not query:
+            return 0
 
-        return result
+        conditions, params = query
+        return cint(frappe.db.sql(f"""
+            SELECT COUNT(*)
+            FROM `tabSales Invoice` si
+            WHERE {" AND ".join(conditions)}
+        """, params)[0][0])
 
     except Exception:
-        # Graceful degradation - return empty list (no logging needed)
-        return []
+        # Graceful degradation - return zero (no logging needed)
+        return 0
+
+
+def _build_settlement_query(pos_profile, pos_opening_shift, user):
+    """
+    WHERE conditions and params of the settlement list, None without a POS Profile.
+    Same privacy pattern as the print list: profile, owner and (optionally) shift.
+    """
+    # FRAPPE STANDARD: Handle string or dict parameters
+    if isinstance(pos_profile, dict):
+        pos_profile_name = pos_profile.get('name')
+    else:
+        pos_profile_name = pos_profile
+
+    if isinstance(pos_opening_shift, dict):
+        pos_opening_shift_name = pos_opening_shift.get('name')
+    else:
+        pos_opening_shift_name = pos_opening_shift
+
+    if not pos_profile_name:
+        return None
+
+    conditions = [
+        "si.pos_profile = %(pos_profile)s",
+        "si.owner = %(user)s",
+        "si.is_pos = 1",
+        "si.docstatus = 1",           # Only submitted invoices
+        "si.is_return = 0",           # Not return invoices
+        "si.outstanding_amount > 0",  # Unpaid or Partly Paid
+    ]
+    params = {
+        "pos_profile": pos_profile_name,
+        # Use session user if not specified
+        "user": user or frappe.session.user,
+    }
+
+    # Add pos_opening_shift filter if provided
+    if pos_opening_shift_name:
+        conditions.append("si.posa_pos_opening_shift = %(pos_opening_shift)s")
+        params["pos_opening_shift"] = pos_opening_shift_name
+
+    return conditions, params
+
+
+def _encode_settlement_cursor(creation, name):
+    """Opaque cursor for get_settlement_invoices(): the sort key of the last row."""
+    payload = json.dumps([str(creation), name])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_settlement_cursor(cursor):
+    """Decode a get_settlement_invoices() cursor, None for a missing or malformed cursor (first page)."""
+    if not cursor:
+        return None
+    try:
+        creation, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return get_datetime(creation), name
+    except Exception:
+        # Malformed cursor - restart from the first page (no logging needed)
+        return None
 
 
 # ===== PRINT INVOICES =====
@@ -543,17 +741,13 @@ def get_print_invoices(pos_profile=None, pos_opening_shift=None, user=None):
             limit=50,
         )
 
-        # Get customer names and determine invoice status
+        # Customer names of the whole list in one query (customer_names.py)
+        customer_names = get_customer_names(invoice.customer for invoice in invoices)
+
+        # Determine invoice status
         result = []
         for invoice in invoices:
-            # Get customer name
-            customer_name = invoice.customer
-            if invoice.customer:
-                try:
-                    customer_name = frappe.get_value(
-                        "Customer", invoice.customer, "customer_name") or invoice.customer
-                except:
-                    customer_name = invoice.customer
+            customer_name = customer_names.get(invoice.customer, invoice.customer)
 
             # Calculate invoice status (like get_invoices_for_return)
             invoice_status = invoice.get("status")
@@ -651,19 +845,23 @@ def create_and_submit_invoice(invoice_doc):
     """
     Create and submit Sales Invoice using ERPNext native workflow 100%.
 
-    This follows the exact same flow as ERPNext's sales_invoice.py:
+    This follows the same flow as ERPNext's sales_invoice.py:
     1. frappe.get_doc() - Create document from dict
     2. doc.set_missing_values() - Fill missing values (native)
-    3. doc.validate() - Full validation (native)
-    4. doc.insert() - Save draft (native)
-    5. doc.submit() - Submit document (native)
+    3. POS checks (profile company / address, return payments sign)
+    4. Submit on insert (native): docstatus = 1 then insert() / save()
+
+    Step 4 is the fast path: Frappe runs validate() and before_submit() once,
+    then on_update() and on_submit(). The former separate validate(), insert()
+    and submit() calls validated the same document three times.
+    See posawesome/benchmarks.py for the query count per submission.
 
     No custom logic - only ERPNext native methods!
 
     This is for the __islocal scenario:
     - Invoice stays local (__islocal = 1) during all operations
     - When Print is clicked, send entire doc to server
-    - Server: uses native workflow to insert() then submit() immediately
+    - Server: inserts the document directly as submitted
 
     Args:
         invoice_doc (dict): Complete Sales Invoice document as JSON/dict
@@ -672,162 +870,283 @@ def create_and_submit_invoice(invoice_doc):
         dict: Submitted invoice as dict
     """
     try:
-        # Parse invoice_doc if it's a string
-        if isinstance(invoice_doc, str):
-            invoice_doc = json.loads(invoice_doc)
+        doc = _prepare_pos_invoice(invoice_doc)
+        _submit_pos_invoice(doc)
 
-        # Check if this is an existing draft invoice (following POS-Awesome-V15 logic)
-        invoice_name = invoice_doc.get("name")
-
-        # Determine invoice type for logging
-        invoice_type = "Sales_Mode"
-        if invoice_doc.get("is_return"):
-            invoice_type = "Return_Invoice" if invoice_doc.get(
-                "return_against") else "Quick_Return"
-
-        # Following POS-Awesome-V15 submit_invoice logic exactly:
-        # If invoice name exists and document exists in DB, load and update it
-        if invoice_name and frappe.db.exists("Sales Invoice", invoice_name):
-            doc = frappe.get_doc("Sales Invoice", invoice_name)
-            # Check if it's a draft (docstatus = 0) - only update drafts
-            if doc.docstatus == 0:
-                # Update existing draft (Frappe's update() replaces child tables when passed as list)
-                doc.update(invoice_doc)
-            else:
-                # If already submitted, create new invoice (don't update submitted invoices)
-                doc = frappe.get_doc(invoice_doc)
+        # Return the submitted document
+        return doc.as_dict()
+
+    except frappe.ValidationError as e:
+        # Handle validation errors with short titles to avoid Error Log title overflow
+        error_message = str(e)
+        if len(error_message) > 120:
+            error_message = error_message[:120] + "..."
+
+        frappe.log_error(f"[[sales_invoice.py]] create_and_submit_invoice")
+        frappe.throw(_(error_message))
+    except Exception:
+        frappe.log_error(f"[[sales_invoice.py]] create_and_submit_invoice")
+        frappe.throw(_("Error creating and submitting invoice"))
+
+
+def _prepare_pos_invoice(invoice_doc):
+    """
+    Build the Sales Invoice document of create_and_submit_invoice() with POS
+    flags, defaults and POS checks applied (steps 1-3, nothing saved).
+    """
+    # Parse invoice_doc if it's a string
+    if isinstance(invoice_doc, str):
+        invoice_doc = json.loads(invoice_doc)
+
+    # Check if this is an existing draft invoice (following POS-Awesome-V15 logic)
+    invoice_name = invoice_doc.get("name")
+
+    # Determine invoice type for logging
+    invoice_type = "Sales_Mode"
+    if invoice_doc.get("is_return"):
+        invoice_type = "Return_Invoice" if invoice_doc.get(
+            "return_against") else "Quick_Return"
+
+    # Following POS-Awesome-V15 submit_invoice logic exactly:
+    # If invoice name exists and document exists in DB, load and update it
+    if invoice_name and frappe.db.exists("Sales Invoice", invoice_name):
+        doc = frappe.get_doc("Sales Invoice", invoice_name)
+        # Check if it's a draft (docstatus = 0) - only update drafts
+        if doc.docstatus == 0:
+            # Update existing draft (Frappe's update() replaces child tables when passed as list)
+            doc.update(invoice_doc)
+            doc.flags.posa_existing_draft = True
         else:
-            # Create new document from dict - using ERPNext native method
+            # If already submitted, create new invoice (don't update submitted invoices)
             doc = frappe.get_doc(invoice_doc)
+    else:
+        # Create new document from dict - using ERPNext native method
+        doc = frappe.get_doc(invoice_doc)
 
-        # Set POS flags (following POS-Awesome-V15 pattern)
-        doc.is_pos = 1
-        doc.update_stock = 1
-        doc.flags.from_pos_page = True
+    # Set POS flags (following POS-Awesome-V15 pattern)
+    doc.is_pos = 1
+    doc.update_stock = 1
+    doc.flags.from_pos_page = True
 
-        # VALIDATION: If this is a return invoice, validate against over-refunds
-        if doc.is_return and doc.return_against:
-            validate_return_limits(doc)
+    # VALIDATION: If this is a return invoice, validate against over-refunds
+    if doc.is_return and doc.return_against:
+        validate_return_limits(doc)
 
-        # Step 1: Use ERPNext native set_missing_values() - fills all default values
-        # This is called from SellingController and sets customer, warehouse, etc.
-        doc.set_missing_values()
+    # Step 1: Use ERPNext native set_missing_values() - fills all default values
+    # This is called from SellingController and sets customer, warehouse, etc.
+    doc.set_missing_values()
 
-        # VALIDATION: Check if invoice company and company_address match POS Profile settings
-        if doc.pos_profile:
-            pos_profile_name = doc.pos_profile
-            if isinstance(pos_profile_name, dict):
-                pos_profile_name = pos_profile_name.get('name')
-
-            if pos_profile_name:
-                pos_profile_doc = frappe.get_cached_doc(
-                    "POS Profile", pos_profile_name)
-
-                # Check company match
-                if doc.company and pos_profile_doc.company and doc.company != pos_profile_doc.company:
-                    frappe.throw(
-                        "اسم الشركة في الفاتورة غير مطابق لاعداد نقطة البيع")
-
-                # Check company_address match
-                if doc.company_address and pos_profile_doc.company_address and doc.company_address != pos_profile_doc.company_address:
-                    frappe.throw(
-                        "عنوان الشركة في الفاتورة غير مطابق لاعداد نقطة البيع")
-
-        # Ensure company_address is valid for the company (fixes validation errors on return invoices)
-        # This validates that company_address exists and is linked to the correct company
-        if doc.company_address and doc.company:
-            from frappe.contacts.doctype.address.address import get_company_address
-            # Check if current company_address is valid (linked to this company)
-            is_valid = frappe.db.exists(
-                "Dynamic Link",
-                {
-                    "parent": doc.company_address,
-                    "parenttype": "Address",
-                    "link_doctype": "Company",
-                    "link_name": doc.company,
-                },
-            )
-            if not is_valid:
-                # Invalid address - get correct company address or clear it
-                company_addr = get_company_address(doc.company)
-                if company_addr:
-                    doc.company_address = company_addr.get(
-                        "company_address", "")
-                else:
-                    doc.company_address = ""
-
-        # For return invoices, payments should be negative amounts (following POS-Awesome-V15 and ERPNext requirement)
-        # MUST be done AFTER set_missing_values() but BEFORE validate() because validate() calls verify_payment_amount_is_negative()
-        # ERPNext's verify_payment_amount_is_negative() requires negative amounts for return invoices
-        if doc.is_return and doc.payments:
-            for payment in doc.payments:
-                # Convert positive amounts to negative (skip zero amounts)
-                if payment.amount > 0:
-                    payment.amount = -abs(payment.amount)
-                elif payment.amount == 0:
-                    # Skip zero amounts - they will be removed or ignored
-                    continue
-                # Ensure base_amount is also negative if it exists
-                if hasattr(payment, 'base_amount') and payment.base_amount is not None:
-                    if payment.base_amount > 0:
-                        payment.base_amount = -abs(payment.base_amount)
-                    elif payment.base_amount == 0:
-                        payment.base_amount = 0
-
-            # Filter out zero-amount payments for return invoices
-            # For return invoices with unpaid original invoices, payments may be empty (0)
-            # This is valid - ERPNext will automatically reduce outstanding_amount of original invoice
-            doc.payments = [p for p in doc.payments if p.amount != 0]
-
-            # Update paid amounts (will be negative for returns, or 0 if no payments)
-            # Handle None values in base_amount to avoid TypeError
-            # If payments list is empty (return of unpaid invoice), paid_amount = 0
-            # ERPNext will automatically adjust outstanding_amount of original invoice on submission
+    # VALIDATION: Check if invoice company and company_address match POS Profile settings
+    if doc.pos_profile:
+        pos_profile_name = doc.pos_profile
+        if isinstance(pos_profile_name, dict):
+            pos_profile_name = pos_profile_name.get('name')
+
+        if pos_profile_name:
+            pos_profile_doc = frappe.get_cached_doc(
+                "POS Profile", pos_profile_name)
+
+            # Check company match
+            if doc.company and pos_profile_doc.company and doc.company != pos_profile_doc.company:
+                frappe.throw(
+                    "اسم الشركة في الفاتورة غير مطابق لاعداد نقطة البيع")
+
+            # Check company_address match
+            if doc.company_address and pos_profile_doc.company_address and doc.company_address != pos_profile_doc.company_address:
+                frappe.throw(
+                    "عنوان الشركة في الفاتورة غير مطابق لاعداد نقطة البيع")
+
+    # Ensure company_address is valid for the company (fixes validation errors on return invoices)
+    # Memoized per company / address (_get_valid_company_address) - no Dynamic Link query per invoice
+    if doc.company_address and doc.company:
+        doc.company_address = _get_valid_company_address(doc.company, doc.company_address)
+
+    # For return invoices, payments should be negative amounts (following POS-Awesome-V15 and ERPNext requirement)
+    # MUST be done AFTER set_missing_values() but BEFORE validate() because validate() calls verify_payment_amount_is_negative()
+    # ERPNext's verify_payment_amount_is_negative() requires negative amounts for return invoices
+    if doc.is_return and doc.payments:
+        for payment in doc.payments:
+            # Convert positive amounts to negative (skip zero amounts)
+            if payment.amount > 0:
+                payment.amount = -abs(payment.amount)
+            elif payment.amount == 0:
+                # Skip zero amounts - they will be removed or ignored
+                continue
+            # Ensure base_amount is also negative if it exists
+            if hasattr(payment, 'base_amount') and payment.base_amount is not None:
+                if payment.base_amount > 0:
+                    payment.base_amount = -abs(payment.base_amount)
+                elif payment.base_amount == 0:
+                    payment.base_amount = 0
+
+        # Filter out zero-amount payments for return invoices
+        # For return invoices with unpaid original invoices, payments may be empty (0)
+        # This is valid - ERPNext will automatically reduce outstanding_amount of original invoice
+        doc.payments = [p for p in doc.payments if p.amount != 0]
+
+        # Update paid amounts (will be negative for returns, or 0 if no payments)
+        # Handle None values in base_amount to avoid TypeError
+        # If payments list is empty (return of unpaid invoice), paid_amount = 0
+        # ERPNext will automatically adjust outstanding_amount of original invoice on submission
+        if doc.payments:
+            doc.paid_amount = flt(sum(p.amount for p in doc.payments))
+        else:
+            # Return invoice with no payments (unpaid original invoice)
+            # paid_amount = 0, and ERPNext will reduce original invoice's outstanding_amount
+            doc.paid_amount = 0.0
+
+        if hasattr(doc, 'base_paid_amount'):
             if doc.payments:
-                doc.paid_amount = flt(sum(p.amount for p in doc.payments))
+                base_amounts = [
+                    flt(p.base_amount) if p.base_amount is not None else 0 for p in doc.payments]
+                doc.base_paid_amount = flt(sum(base_amounts))
             else:
-                # Return invoice with no payments (unpaid original invoice)
-                # paid_amount = 0, and ERPNext will reduce original invoice's outstanding_amount
-                doc.paid_amount = 0.0
-
-            if hasattr(doc, 'base_paid_amount'):
-                if doc.payments:
-                    base_amounts = [
-                        flt(p.base_amount) if p.base_amount is not None else 0 for p in doc.payments]
-                    doc.base_paid_amount = flt(sum(base_amounts))
-                else:
-                    doc.base_paid_amount = 0.0
+                doc.base_paid_amount = 0.0
 
-        # Note: Partial payment validation is handled in frontend (Payments.js)
-        # Frontend prevents submission if partial payment is not allowed
-        # No need to validate here - frontend validation is sufficient
+    # Note: Partial payment validation is handled in frontend (Payments.js)
+    # Frontend prevents submission if partial payment is not allowed
+    # No need to validate here - frontend validation is sufficient
 
-        # Step 2: Use ERPNext native validate() - full validation
-        # This validates customer, items, taxes, payments, etc.
-        # For return invoices, this will call verify_payment_amount_is_negative() which requires negative amounts
-        doc.validate()
+    return doc
 
-        # Step 3: Save document (insert for new, save for existing draft)
-        # Check if this is an existing draft by checking if doc has name and docstatus = 0
-        is_existing_draft = doc.name and doc.docstatus == 0
 
-        if is_existing_draft:
-            # For existing draft, just save (already loaded and updated above)
-            # Following POS-Awesome-V15: doc.update() already handled child tables
-            doc.save()
-            invoice_name = doc.name
-        else:
-            # For new invoice, use insert() - save draft
-            # This saves the document and sets docstatus = 0
-            doc.insert()
-            invoice_name = doc.name
+def _submit_pos_invoice(doc):
+    """
+    Submit a prepared POS invoice with a single validation pass (step 4).
 
-        # Step 4: Use ERPNext native submit() - submit document
-        # This runs before_submit() then on_submit() hooks
-        doc.submit()
+    Setting docstatus = 1 before insert() / save() is Frappe's submit-on-insert:
+    validate() and before_submit() run once, then on_update() and on_submit().
+    For return invoices validate() calls verify_payment_amount_is_negative(),
+    so payments must already be negative (_prepare_pos_invoice).
+    """
+    doc.docstatus = 1
+    if doc.flags.posa_existing_draft:
+        # Existing draft loaded and updated by _prepare_pos_invoice()
+        # (Following POS-Awesome-V15: doc.update() already handled child tables)
+        doc.save()
+    else:
+        doc.insert()
 
-        # Return the submitted document
-        return doc.as_dict()
+    return doc
+
+
+# Company address memo (see _get_valid_company_address)
+COMPANY_ADDRESS_CACHE_PREFIX = "posa_company_address|"
+COMPANY_ADDRESS_CACHE_KEY = COMPANY_ADDRESS_CACHE_PREFIX + "{0}|{1}"
+COMPANY_ADDRESS_CACHE_TTL = 300
+
+
+def _get_valid_company_address(company, company_address):
+    """
+    company_address if it is linked to company, otherwise the company's default
+    address ("" when it has none).
+
+    Memoized in Redis per (company, address) for COMPANY_ADDRESS_CACHE_TTL seconds:
+    POS profiles submit with the same address all day, so the Dynamic Link
+    check runs once per profile address instead of once per invoice.
+    Address changes drop the memo (on_address_change).
+    """
+    cache_key = COMPANY_ADDRESS_CACHE_KEY.format(company, company_address)
+    try:
+        cached = frappe.cache().get_value(cache_key)
+        if cached is not None:
+            return cached
+    except Exception:
+        # Graceful degradation - check in the database (no logging needed)
+        pass
+
+    # Check if current company_address is valid (linked to this company)
+    is_valid = frappe.db.exists(
+        "Dynamic Link",
+        {
+            "parent": company_address,
+            "parenttype": "Address",
+            "link_doctype": "Company",
+            "link_name": company,
+        },
+    )
+    if is_valid:
+        valid_address = company_address
+    else:
+        # Invalid address - get correct company address or clear it
+        from frappe.contacts.doctype.address.address import get_company_address
+        company_addr = get_company_address(company)
+        valid_address = company_addr.get("company_address", "") if company_addr else ""
+
+    try:
+        frappe.cache().set_value(cache_key, valid_address or "", expires_in_sec=COMPANY_ADDRESS_CACHE_TTL)
+    except Exception:
+        # Graceful degradation - not memoized (no logging needed)
+        pass
+
+    return valid_address or ""
+
+
+def on_address_change(doc, method=None):
+    """Address on_update / on_trash / after_rename: links and company defaults may have changed."""
+    try:
+        frappe.cache().delete_keys(COMPANY_ADDRESS_CACHE_PREFIX)
+    except Exception:
+        frappe.log_error("[[sales_invoice.py]] on_address_change")
+
+
+# ===== ASYNC SUBMISSION =====
+# POS Profile "Submit Invoices in Background" (posa_async_invoice_submit):
+# the invoice is durably accepted as a draft carrying the client's idempotency key
+# (posa_client_uuid, unique) and returned immediately; submission with GL / stock
+# posting runs in a background worker. The client follows posa_submit_status
+# through the "posa_invoice_submit_status" realtime event or get_invoice_submit_status().
+
+SUBMIT_STATUS_EVENT = "posa_invoice_submit_status"
+
+
+@frappe.whitelist()
+def submit_invoice_async(invoice_doc, client_uuid):
+    """
+    Accept an invoice for background submission.
+
+    Idempotent on client_uuid: a retry with the same key returns the invoice
+    created by the first call (re-queued if its submission failed) - the unique
+    posa_client_uuid column makes duplicates impossible even for concurrent retries.
+
+    Args:
+        invoice_doc (dict): Complete Sales Invoice document as JSON/dict
+        client_uuid (str): Idempotency key generated by the client per invoice
+
+    Returns:
+        dict: {name, client_uuid, status, grand_total}
+    """
+    try:
+        if not client_uuid:
+            frappe.throw(_("Client UUID is required"))
+
+        existing = _get_async_invoice(client_uuid)
+        if existing:
+            return _requeue_if_failed(existing)
+
+        doc = _prepare_pos_invoice(invoice_doc)
+        _validate_async_shift(doc.get("posa_pos_opening_shift"))
+        doc.posa_client_uuid = client_uuid
+        doc.posa_submit_status = "Queued"
+        doc.posa_submit_error = None
+
+        try:
+            # Draft insert validates once - the cashier gets validation errors immediately
+            if doc.flags.posa_existing_draft:
+                doc.save()
+            else:
+                doc.insert()
+        except frappe.UniqueValidationError:
+            # Concurrent retry won the race on posa_client_uuid
+            frappe.db.rollback()
+            existing = _get_async_invoice(client_uuid)
+            if not existing:
+                raise
+            return _requeue_if_failed(existing)
+
+        _enqueue_invoice_submission(doc.name)
+
+        return _submit_status(doc)
 
     except frappe.ValidationError as e:
         # Handle validation errors with short titles to avoid Error Log title overflow
@@ -835,13 +1154,302 @@ def create_and_submit_invoice(invoice_doc):
         if len(error_message) > 120:
             error_message = error_message[:120] + "..."
 
-        frappe.log_error(f"[[sales_invoice.py]] create_and_submit_invoice")
+        frappe.log_error(f"[[sales_invoice.py]] submit_invoice_async")
         frappe.throw(_(error_message))
     except Exception:
-        frappe.log_error(f"[[sales_invoice.py]] create_and_submit_invoice")
+        frappe.log_error(f"[[sales_invoice.py]] submit_invoice_async")
         frappe.throw(_("Error creating and submitting invoice"))
 
 
+@frappe.whitelist()
+def get_invoice_submit_status(client_uuids):
+    """
+    GET - Submission status of async invoices (polling fallback of the realtime event)
+
+    Args:
+        client_uuids: list (or JSON list) of idempotency keys
+
+    Returns:
+        list: [{name, client_uuid, status, error, grand_total}] of the current user's invoices
+    """
+    try:
+        client_uuids = frappe.parse_json(client_uuids) if isinstance(
+            client_uuids, str) else client_uuids
+        if not client_uuids:
+            return []
+
+        return frappe.get_all(
+            "Sales Invoice",
+            filters={
+                "posa_client_uuid": ["in", client_uuids],
+                "owner": frappe.session.user,
+            },
+            fields=[
+                "name",
+                "posa_client_uuid as client_uuid",
+                "posa_submit_status as status",
+                "posa_submit_error as error",
+                "grand_total",
+            ],
+        )
+
+    except Exception:
+        # Graceful degradation - return empty list (no logging needed)
+        return []
+
+
+def process_async_invoice(invoice_name, user=None):
+    """
+    Background job: submit an accepted invoice (GL / stock posting).
+    On failure the draft is kept with posa_submit_status = "Failed" and the error,
+    so the cashier can retry with the same client_uuid.
+    """
+    doc = frappe.get_doc("Sales Invoice", invoice_name)
+    if doc.docstatus != 0 or doc.posa_submit_status != "Queued":
+        # Already processed (duplicate job or manual submit)
+        return
+
+    try:
+        # The shift may have been closed while the invoice was queued
+        _validate_async_shift(doc.get("posa_pos_opening_shift"))
+
+        # Returns accepted concurrently may together exceed the remaining quantities
+        if doc.is_return and doc.return_against:
+            validate_return_limits(doc)
+
+        doc.posa_submit_status = "Submitted"
+        doc.flags.from_pos_page = True
+        doc.submit()
+        frappe.db.commit()
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"[[sales_invoice.py]] process_async_invoice")
+
+        error_message = str(e)
+        if len(error_message) > 140:
+            error_message = error_message[:140] + "..."
+
+        frappe.db.set_value("Sales Invoice", invoice_name, {
+            "posa_submit_status": "Failed",
+            "posa_submit_error": error_message,
+        }, update_modified=False)
+        frappe.db.commit()
+        doc.reload()
+
+    _publish_submit_status(doc, user or doc.owner)
+
+
+def _get_async_invoice(client_uuid):
+    return frappe.db.get_value(
+        "Sales Invoice",
+        {"posa_client_uuid": client_uuid},
+        ["name", "docstatus", "owner", "grand_total", "posa_client_uuid",
+         "posa_submit_status", "posa_submit_error", "posa_pos_opening_shift"],
+        as_dict=1,
+    )
+
+
+def _requeue_if_failed(invoice):
+    """Retry of an accepted invoice: queue it again only if its submission failed."""
+    if invoice.owner != frappe.session.user:
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+    if invoice.docstatus == 0 and invoice.posa_submit_status == "Failed":
+        _validate_async_shift(invoice.posa_pos_opening_shift)
+        frappe.db.set_value("Sales Invoice", invoice.name, {
+            "posa_submit_status": "Queued",
+            "posa_submit_error": None,
+        }, update_modified=False)
+        invoice.posa_submit_status = "Queued"
+        _enqueue_invoice_submission(invoice.name)
+
+    return _submit_status(invoice)
+
+
+def _validate_async_shift(shift):
+    """Async invoices are only accepted / submitted into a shift that is still open."""
+    # Locked database read (not the document cache) - workers must see a shift closed meanwhile
+    if shift and frappe.db.get_value("POS Opening Shift", shift, "status", for_update=True) != "Open":
+        frappe.throw(_("Cannot submit invoice into closed shift {0}").format(shift))
+
+
+def _enqueue_invoice_submission(invoice_name):
+    frappe.enqueue(
+        "posawesome.api.sales_invoice.process_async_invoice",
+        queue="short",
+        job_id=f"posa_submit_invoice|{invoice_name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        invoice_name=invoice_name,
+        user=frappe.session.user,
+    )
+
+
+def _submit_status(invoice):
+    return {
+        "name": invoice.name,
+        "client_uuid": invoice.posa_client_uuid,
+        "status": invoice.posa_submit_status,
+        "error": invoice.get("posa_submit_error"),
+        "grand_total": flt(invoice.grand_total),
+    }
+
+
+def _publish_submit_status(doc, user):
+    try:
+        frappe.publish_realtime(SUBMIT_STATUS_EVENT, _submit_status(doc), user=user)
+    except Exception:
+        # Graceful degradation - clients fall back to polling (no logging needed)
+        pass
+
+
+# ===== OFFLINE SYNC =====
+# Invoices captured by a till while the branch link was down, replayed in bulk.
+# Deduplicated on the client's idempotency key (posa_client_uuid, unique - see ASYNC SUBMISSION)
+
+# Max invoices per sync call - the client drains its backlog in chunks of this size
+MAX_OFFLINE_SYNC_BATCH = 100
+
+# frappe.flags where on_submit hooks collect work applied after commit (shift_totals, item_index):
+# a savepoint rollback doesn't undo them, so a failed invoice restores them
+AFTER_COMMIT_FLAGS = shift_totals.SHIFT_TOTALS_FLAGS + ("posa_catalog_stock_refresh",)
+
+
+@frappe.whitelist()
+def sync_offline_invoices(invoices):
+    """
+    POST - Submit a batch of locally captured invoices, in order.
+
+    Each invoice runs inside its own savepoint: a failing invoice is rolled back
+    alone and reported, the rest of the batch is still submitted.
+    Already synced keys (retry of a batch whose response was lost) are
+    reported as "Duplicate" with the existing invoice - never submitted twice.
+
+    Args:
+        invoices: list (or JSON list) of {client_uuid, invoice_doc}, oldest first
+                  (at most MAX_OFFLINE_SYNC_BATCH)
+
+    Returns:
+        list: [{client_uuid, status: Submitted | Duplicate | Failed, name, error}]
+              in request order
+    """
+    invoices = frappe.parse_json(invoices) if isinstance(invoices, str) else invoices
+    if not invoices:
+        return []
+
+    if len(invoices) > MAX_OFFLINE_SYNC_BATCH:
+        frappe.throw(_("At most {0} invoices per sync").format(MAX_OFFLINE_SYNC_BATCH))
+
+    # Keys already on the server - one query for the whole batch
+    client_uuids = [entry.get("client_uuid") for entry in invoices if entry.get("client_uuid")]
+    synced = {}
+    if client_uuids:
+        for row in frappe.get_all(
+            "Sales Invoice",
+            filters={"posa_client_uuid": ["in", client_uuids]},
+            fields=["name", "posa_client_uuid", "docstatus", "owner"],
+        ):
+            synced[row.posa_client_uuid] = row
+
+    results = []
+    for entry in invoices:
+        client_uuid = entry.get("client_uuid")
+
+        if not client_uuid:
+            results.append(_offline_result(None, "Failed", error=_("Client UUID is required")))
+            continue
+
+        existing = synced.get(client_uuid)
+        if existing:
+            if existing.owner != frappe.session.user:
+                results.append(_offline_result(client_uuid, "Failed", error=_("Not permitted")))
+            elif existing.docstatus == 1:
+                results.append(_offline_result(client_uuid, "Duplicate", existing.name))
+            else:
+                # Accepted earlier but not submitted - submit the existing draft
+                results.append(_sync_offline_invoice(client_uuid, existing_name=existing.name))
+            continue
+
+        result = _sync_offline_invoice(client_uuid, invoice_doc=entry.get("invoice_doc"))
+        results.append(result)
+        # Same key twice in one batch
+        if result["status"] == "Submitted":
+            synced[client_uuid] = frappe._dict(
+                name=result["name"], docstatus=1, owner=frappe.session.user)
+
+    return results
+
+
+def _sync_offline_invoice(client_uuid, invoice_doc=None, existing_name=None):
+    """Submit one offline invoice inside a savepoint, return its result."""
+    savepoint = "posa_offline_sync"
+    after_commit_flags = {flag: copy.deepcopy(frappe.flags.get(flag)) for flag in AFTER_COMMIT_FLAGS}
+    frappe.db.savepoint(savepoint)
+    try:
+        if existing_name:
+            doc = frappe.get_doc("Sales Invoice", existing_name)
+            doc.flags.posa_existing_draft = True
+            doc.flags.from_pos_page = True
+            if doc.is_return and doc.return_against:
+                validate_return_limits(doc)
+        else:
+            if isinstance(invoice_doc, str):
+                invoice_doc = json.loads(invoice_doc)
+            # Never load / update a server draft by name - offline invoices are always new
+            invoice_doc = dict(invoice_doc or {}, name=None)
+            doc = _prepare_pos_invoice(invoice_doc)
+            doc.posa_client_uuid = client_uuid
+            # Keep the capture time of the till, not the sync time
+            if doc.posting_date:
+                doc.set_posting_time = 1
+
+        _validate_offline_shift(doc)
+
+        doc.posa_submit_status = "Submitted"
+        doc.posa_submit_error = None
+        _submit_pos_invoice(doc)
+        frappe.db.release_savepoint(savepoint)
+
+        return _offline_result(client_uuid, "Submitted", doc.name)
+
+    except Exception as e:
+        frappe.db.rollback(save_point=savepoint)
+        frappe.clear_messages()
+        # Deltas queued by the hooks of the rolled back invoice (shift ledger, stock refresh)
+        for flag, value in after_commit_flags.items():
+            if value is None:
+                frappe.flags.pop(flag, None)
+            else:
+                frappe.flags[flag] = value
+
+        error_message = str(e)
+        if len(error_message) > 140:
+            error_message = error_message[:140] + "..."
+
+        return _offline_result(client_uuid, "Failed", existing_name, error_message)
+
+
+def _validate_offline_shift(doc):
+    """Offline invoices can't land in a shift that was closed meanwhile."""
+    if doc.get("posa_pos_opening_shift"):
+        # Locked read - a shift closed during the batch can't take its remaining invoices
+        shift_status = frappe.db.get_value(
+            "POS Opening Shift", doc.posa_pos_opening_shift, "status", for_update=True)
+        if shift_status != "Open":
+            frappe.throw(_("Cannot submit offline invoice into closed shift {0}").format(
+                doc.posa_pos_opening_shift))
+
+
+def _offline_result(client_uuid, status, name=None, error=None):
+    return {
+        "client_uuid": client_uuid,
+        "status": status,
+        "name": name,
+        "error": error,
+    }
+
+
 def validate_return_limits(return_doc):
     """
     Validate that return invoice doesn't exceed remaining returnable amounts.
@@ -873,25 +1481,46 @@ def validate_return_limits(return_doc):
                 title=_("Return Amount Exceeded")
             )
 
-        # Check per-item quantities
-        items_stats_dict = {item["item_code"]: item for item in stats["items"]}
+        # Check per-item quantities: linked rows against their original row,
+        # unlinked rows against the remaining qty of all rows with the same item_code
+        stats_by_row = {item["sales_invoice_item"]: item for item in stats["items"]}
+        remaining_by_item_code = {}
+        for item_stats in stats["items"]:
+            remaining_by_item_code[item_stats["item_code"]] = remaining_by_item_code.get(
+                item_stats["item_code"], 0) + flt(item_stats["remaining_returnable_qty"])
 
+        return_qty_by_row = {}
+        return_qty_by_item_code = {}
         for item in return_doc.items:
-            if item.item_code in items_stats_dict:
-                item_stats = items_stats_dict[item.item_code]
-                return_qty = abs(flt(item.qty))
-                max_qty = flt(item_stats["remaining_returnable_qty"])
-
-                if return_qty > max_qty + 0.001:  # Allow 0.001 rounding tolerance
-                    frappe.throw(
-                        _("Return quantity {0} for item {1} exceeds remaining returnable quantity {2}").format(
-                            return_qty,
-                            item.item_code,
-                            max_qty
-                        ),
-                        title=_("Return Quantity Exceeded")
-                    )
+            if item.get("sales_invoice_item") in stats_by_row:
+                return_qty_by_row[item.sales_invoice_item] = return_qty_by_row.get(
+                    item.sales_invoice_item, 0) + abs(flt(item.qty))
+            elif item.item_code in remaining_by_item_code:
+                return_qty_by_item_code[item.item_code] = return_qty_by_item_code.get(
+                    item.item_code, 0) + abs(flt(item.qty))
+
+        limits = [
+            (stats_by_row[row]["item_code"], return_qty, flt(stats_by_row[row]["remaining_returnable_qty"]))
+            for row, return_qty in return_qty_by_row.items()
+        ] + [
+            (item_code, return_qty, remaining_by_item_code[item_code])
+            for item_code, return_qty in return_qty_by_item_code.items()
+        ]
+
+        for item_code, return_qty, max_qty in limits:
+            if return_qty > max_qty + 0.001:  # Allow 0.001 rounding tolerance
+                frappe.throw(
+                    _("Return quantity {0} for item {1} exceeds remaining returnable quantity {2}").format(
+                        return_qty,
+                        item_code,
+                        max_qty
+                    ),
+                    title=_("Return Quantity Exceeded")
+                )
 
+    except frappe.ValidationError:
+        # Limit exceeded - block the return
+        raise
     except Exception:
         # Don't block submission if validation check fails (no logging needed)
         pass
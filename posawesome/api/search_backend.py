@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Search Backend for POS Awesome
+
+Pluggable text search used by item search (item.py) and customer search
+(customer.py) instead of leading-wildcard LIKE '%x%', which can never use an index.
+
+BACKENDS (site_config.json: "posa_search_backend"):
+- "ngram"    : (default, "auto") Redis trigram index (items: item_index.py, customers:
+               this module). Same substring semantics as LIKE '%x%'.
+- "fulltext" : opt-in MariaDB FULLTEXT index on the posa_search_text column. Boolean
+               mode matches word prefixes, not substrings ("ana" finds "Banana Split"
+               with LIKE / ngram, not with fulltext). Falls back to ngram until the
+               index exists.
+- "like"     : legacy LIKE '%x%' search (no index)
+
+Every backend answers get_search_condition() with an SQL condition for the
+caller's WHERE clause, or None when it cannot answer (the caller keeps its LIKE search).
+
+ARABIC TEXT:
+All indexed and searched text goes through normalize_text(): lower case, tashkeel and
+tatweel removed, alef variants (أ إ آ ٱ) -> ا, alef maksura ى -> ي, ta marbuta ة -> ه.
+The normalized tokens are stored in the hidden posa_search_text field of Item and
+Customer (set on validate), which is what the FULLTEXT index covers.
+
+REDIS LAYOUT (ngram backend, customers):
+- posa_search_meta|<doctype>           -> JSON {"built_at": ...} (index readiness flag)
+- posa_search_rows|<doctype>           -> hash name -> JSON {"text": ..., "tokens": [...]}
+- posa_search_token|<doctype>|<trigram> -> set of names containing the trigram
+- posa_search_build|<doctype>|...      -> rebuild in progress: temporary keys, running
+                                          flag and the names changed meanwhile (dirty)
+
+The daily rebuild writes temporary keys swapped in atomically (redis_utils.swap_in),
+so searches keep using the previous index, then replays the rows changed while it ran.
+Searches whose rarest trigram matches more than NGRAM_CANDIDATE_LIMIT rows are too
+broad for the index and fall back to LIKE.
+"""
+
+from __future__ import unicode_literals
+import json
+import re
+import frappe
+from frappe.utils import now
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe, decode as _decode
+from posawesome.api.redis_utils import BuildWriter, swap_in
+
+
+SEARCH_TEXT_FIELD = "posa_search_text"
+FULLTEXT_INDEX_NAME = "posa_search_text"
+
+# InnoDB does not index words shorter than innodb_ft_min_token_size (default 3)
+FULLTEXT_MIN_TOKEN_LENGTH = 3
+
+NGRAM_LENGTH = 3
+# Larger candidate sets fall back to LIKE instead of building a huge IN list
+NGRAM_CANDIDATE_LIMIT = 1000
+
+META_KEY = "posa_search_meta|{0}"
+ROWS_KEY = "posa_search_rows|{0}"
+TOKEN_KEY = "posa_search_token|{0}|{1}"
+FULLTEXT_READY_KEY = "posa_search_fulltext_ready|{0}"
+
+# Full rebuild (per doctype): temporary keys, running flag, names changed meanwhile
+BUILD_PREFIX = "posa_search_build|{0}|"
+REBUILDING_KEY = BUILD_PREFIX + "running"
+DIRTY_KEY = BUILD_PREFIX + "dirty"
+# Running flag expiry - a crashed rebuild stops recording changes after this
+REBUILD_TIMEOUT = 2 * 60 * 60
+
+# Fields folded into posa_search_text, per doctype
+SEARCH_FIELDS = {
+    "Item": ["name", "item_name"],
+    "Customer": ["name", "customer_name", "mobile_no"],
+}
+
+# Custom fields holding the normalized search text (created by the search index patch)
+SEARCH_TEXT_CUSTOM_FIELDS = {
+    doctype: [{
+        "fieldname": SEARCH_TEXT_FIELD,
+        "label": "Search Text",
+        "fieldtype": "Small Text",
+        "insert_after": insert_after,
+        "hidden": 1,
+        "read_only": 1,
+        "no_copy": 1,
+        "print_hide": 1,
+        "report_hide": 1,
+    }]
+    for doctype, insert_after in (("Item", "description"), ("Customer", "posa_referral_company"))
+}
+
+# Tashkeel (harakat, tanween, shadda, sukun, superscript alef) and tatweel
+_ARABIC_MARKS = re.compile("[\u064b-\u0652\u0670\u0640]")
+_ARABIC_LETTERS = str.maketrans({
+    "\u0623": "\u0627",  # alef with hamza above -> alef
+    "\u0625": "\u0627",  # alef with hamza below -> alef
+    "\u0622": "\u0627",  # alef with madda -> alef
+    "\u0671": "\u0627",  # alef wasla -> alef
+    "\u0649": "\u064a",  # alef maksura -> ya
+    "\u0629": "\u0647",  # ta marbuta -> ha
+})
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# =============================================================================
+# SECTION 1: TEXT NORMALIZATION
+# =============================================================================
+
+def normalize_text(value):
+    """Normalize text for indexing and searching (case, Arabic letter variants, diacritics)."""
+    text = str(value or "").strip().lower()
+    return _ARABIC_MARKS.sub("", text).translate(_ARABIC_LETTERS)
+
+
+def tokenize(value):
+    """Split normalized text into word tokens (order kept, duplicates removed)."""
+    return list(dict.fromkeys(_WORD.findall(normalize_text(value))))
+
+
+def ngrams(text):
+    """All overlapping NGRAM_LENGTH-character substrings of an already normalized string."""
+    return {text[i:i + NGRAM_LENGTH] for i in range(len(text) - NGRAM_LENGTH + 1)}
+
+
+def build_search_text(values):
+    """Normalized, de-duplicated tokens of all values, as stored in posa_search_text."""
+    tokens = []
+    for value in values:
+        tokens.extend(tokenize(value))
+    return " ".join(dict.fromkeys(tokens))
+
+
+def set_search_text(doc, method=None):
+    """Item / Customer validate: refresh the normalized posa_search_text field."""
+    if not doc.meta.has_field(SEARCH_TEXT_FIELD):
+        return
+
+    doc.set(SEARCH_TEXT_FIELD, build_search_text(_search_values(doc)))
+
+
+def _search_values(doc):
+    """Values of one document folded into its search text (items include barcodes)."""
+    values = [doc.get(field) for field in SEARCH_FIELDS[doc.doctype]]
+    if doc.doctype == "Item":
+        values.extend(b.barcode for b in doc.get("barcodes", []) if b.barcode)
+    return values
+
+
+# =============================================================================
+# SECTION 2: BACKEND SELECTION
+# =============================================================================
+
+def get_backend_name(doctype):
+    """
+    Resolve the configured backend for a doctype ("fulltext", "ngram" or "like").
+    FULLTEXT changes substring matching into word-prefix matching, so it is only
+    used when configured explicitly - "auto" (default) keeps substring search.
+    """
+    configured = (frappe.conf.get("posa_search_backend") or "auto").lower()
+
+    if configured == "like":
+        return "like"
+
+    if configured == "fulltext" and _fulltext_ready(doctype):
+        return "fulltext"
+
+    return "ngram"
+
+
+def get_search_condition(doctype, search_value, params, table=None):
+    """
+    SQL condition matching search_value with the configured backend.
+
+    Args:
+        doctype: "Item" or "Customer"
+        search_value: Raw search text
+        params: Named query params dict, extended in place
+        table: Table prefix for column names (e.g. "`tabItem`"), None for unqualified
+
+    Returns:
+        str|None: Condition for the WHERE clause, None to keep the caller's LIKE search
+    """
+    try:
+        backend = get_backend_name(doctype)
+        if backend == "fulltext":
+            return _fulltext_condition(doctype, search_value, params, table)
+        if backend == "ngram":
+            return _ngram_condition(doctype, search_value, params, table)
+        return None
+
+    except Exception:
+        # Graceful degradation - caller uses its LIKE search (no logging needed)
+        return None
+
+
+def _column(table, column):
+    return f"{table}.{column}" if table else column
+
+
+# =============================================================================
+# SECTION 3: FULLTEXT BACKEND (MariaDB)
+# =============================================================================
+
+def _fulltext_ready(doctype):
+    """True when the FULLTEXT index exists on tab<doctype> (checked once per hour)."""
+    if frappe.db.db_type != "mariadb":
+        return False
+
+    try:
+        cache_key = FULLTEXT_READY_KEY.format(doctype)
+        ready = frappe.cache().get_value(cache_key)
+        if ready is None:
+            ready = bool(frappe.db.sql(
+                f"SHOW INDEX FROM `tab{doctype}` WHERE Key_name = %s", (FULLTEXT_INDEX_NAME,)))
+            frappe.cache().set_value(cache_key, ready, expires_in_sec=3600)
+        return ready
+
+    except Exception:
+        # Graceful degradation - use the ngram backend (no logging needed)
+        return False
+
+
+def _fulltext_condition(doctype, search_value, params, table):
+    """
+    MATCH ... AGAINST in boolean mode: every token must appear as a word prefix.
+    Tokens shorter than the InnoDB minimum are not in the index; they are checked
+    with LIKE on the (already narrowed) rows instead.
+    """
+    tokens = tokenize(search_value)
+    long_tokens = [t for t in tokens if len(t) >= FULLTEXT_MIN_TOKEN_LENGTH]
+    short_tokens = [t for t in tokens if len(t) < FULLTEXT_MIN_TOKEN_LENGTH]
+    if not long_tokens:
+        return None
+
+    column = _column(table, SEARCH_TEXT_FIELD)
+    prefix = f"posa_ft_{doctype.lower()}"
+
+    params[prefix] = " ".join(f"+{token}*" for token in long_tokens)
+    conditions = [f"MATCH({column}) AGAINST (%({prefix})s IN BOOLEAN MODE)"]
+
+    for i, token in enumerate(short_tokens):
+        params[f"{prefix}_short_{i}"] = f"%{token}%"
+        conditions.append(f"{column} LIKE %({prefix}_short_{i})s")
+
+    return "(" + " AND ".join(conditions) + ")"
+
+
+def add_fulltext_index(doctype):
+    """Create the FULLTEXT index on posa_search_text (MariaDB only, idempotent)."""
+    if frappe.db.db_type != "mariadb":
+        return
+
+    if frappe.db.sql(f"SHOW INDEX FROM `tab{doctype}` WHERE Key_name = %s", (FULLTEXT_INDEX_NAME,)):
+        return
+
+    frappe.db.sql_ddl(
+        f"ALTER TABLE `tab{doctype}` ADD FULLTEXT INDEX `{FULLTEXT_INDEX_NAME}` (`{SEARCH_TEXT_FIELD}`)")
+    frappe.cache().delete_value(FULLTEXT_READY_KEY.format(doctype))
+
+
+def backfill_search_text(doctype, chunk_size=1000):
+    """Fill posa_search_text for existing rows (patch / manual repair)."""
+    fields = SEARCH_FIELDS[doctype]
+
+    barcodes = {}
+    if doctype == "Item":
+        for row in frappe.db.sql("""
+            SELECT parent, barcode FROM `tabItem Barcode`
+            WHERE parenttype = 'Item' AND IFNULL(barcode, '') != ''
+        """, as_dict=True):
+            barcodes.setdefault(row.parent, []).append(row.barcode)
+
+    rows = frappe.db.sql(
+        f"SELECT {', '.join(f'`{f}`' for f in fields)} FROM `tab{doctype}`", as_dict=True)
+
+    updates = {}
+    for row in rows:
+        values = [row.get(f) for f in fields] + barcodes.get(row.name, [])
+        updates[row.name] = {SEARCH_TEXT_FIELD: build_search_text(values)}
+
+    frappe.db.bulk_update(doctype, updates, chunk_size=chunk_size, update_modified=False)
+
+
+# =============================================================================
+# SECTION 4: NGRAM BACKEND (Redis)
+# =============================================================================
+
+def _ngram_condition(doctype, search_value, params, table):
+    """`name IN (...)` from the trigram index; None when the index cannot answer."""
+    if doctype == "Item":
+        # Items share the catalog index (item_index.py)
+        from posawesome.api import item_index
+        names = item_index.match_codes(search_value)
+    else:
+        names = match_names(doctype, search_value)
+
+    if names is None or len(names) > NGRAM_CANDIDATE_LIMIT:
+        return None
+
+    if not names:
+        return "1 = 0"
+
+    prefix = f"posa_ng_{doctype.lower()}"
+    placeholders = []
+    for i, name in enumerate(names):
+        params[f"{prefix}_{i}"] = name
+        placeholders.append(f"%({prefix}_{i})s")
+
+    return f"{_column(table, 'name')} IN ({', '.join(placeholders)})"
+
+
+def match_names(doctype, search_value):
+    """
+    Names whose indexed text contains the normalized search value.
+
+    Returns:
+        list|None: Matching names, None when the index cannot answer
+                   (not built yet, search shorter than NGRAM_LENGTH or too broad).
+    """
+    needle = normalize_text(search_value)
+    if len(needle) < NGRAM_LENGTH or not _ngram_ready(doctype):
+        return None
+
+    # The intersection is bounded by the rarest trigram: too broad when even that one is large
+    token_keys = [_key(TOKEN_KEY.format(doctype, t)) for t in ngrams(needle)]
+    pipe = _pipe()
+    for token_key in token_keys:
+        pipe.scard(token_key)
+    if min(pipe.execute()) > NGRAM_CANDIDATE_LIMIT:
+        return None
+
+    candidates = sorted(_decode(c) for c in _pipe().sinter(token_keys).execute()[0])
+    if not candidates:
+        return []
+
+    # Trigram intersection is a superset - verify the substring on the stored text
+    rows = _pipe().hmget(_key(ROWS_KEY.format(doctype)), candidates).execute()[0]
+    return [
+        name for name, row in zip(candidates, rows)
+        if row and needle in json.loads(row)["text"]
+    ]
+
+
+def _ngram_ready(doctype):
+    """True if the trigram index of a doctype is built; enqueue a build otherwise."""
+    if _ngram_exists(doctype):
+        return True
+
+    enqueue_ngram_rebuild(doctype)
+    return False
+
+
+def _ngram_exists(doctype):
+    return bool(_pipe().exists(_key(META_KEY.format(doctype))).execute()[0])
+
+
+def enqueue_ngram_rebuild(doctype="Customer"):
+    """Enqueue a full trigram index rebuild for a doctype (deduplicated per site)."""
+    try:
+        frappe.enqueue(
+            "posawesome.api.search_backend.rebuild_ngram_index",
+            queue="long",
+            job_id=f"posa_search_rebuild::{frappe.local.site}::{doctype}",
+            deduplicate=True,
+            doctype=doctype,
+        )
+    except Exception:
+        # Silent fail - searches keep using LIKE (no logging needed)
+        pass
+
+
+def rebuild_ngram_index(doctype="Customer"):
+    """
+    Rebuild the trigram index of a doctype from the database.
+    Runs in a background job (queue=long) and from the daily scheduler.
+
+    The new index is written to temporary keys and swapped in atomically, then the
+    rows changed by the doc_events while it was built are replayed on it.
+    """
+    build_prefix = BUILD_PREFIX.format(doctype)
+    try:
+        # Leftovers of an interrupted rebuild (temporary keys, dirty names)
+        frappe.cache().delete_keys(build_prefix)
+        _pipe().set(_key(REBUILDING_KEY.format(doctype)), now(), ex=REBUILD_TIMEOUT).execute()
+
+        fields = SEARCH_FIELDS[doctype]
+        rows = frappe.db.sql(
+            f"SELECT {', '.join(f'`{f}`' for f in fields)} FROM `tab{doctype}`", as_dict=True)
+
+        built = BuildWriter(build_prefix + "k|{0}")
+        for row in rows:
+            indexed, tokens = _make_ngram_row([row.get(f) for f in fields])
+            built.hset(ROWS_KEY.format(doctype), row.name, indexed)
+            for token in tokens:
+                built.sadd(TOKEN_KEY.format(doctype, token), row.name)
+        built.set(META_KEY.format(doctype), json.dumps({"built_at": now(), "rows": len(rows)}))
+        built.flush()
+
+        swap_in(built, [META_KEY.format(doctype), ROWS_KEY.format(doctype), TOKEN_KEY.format(doctype, "")])
+        _pipe().delete(_key(REBUILDING_KEY.format(doctype))).execute()
+        _replay_dirty(doctype)
+
+    except Exception:
+        frappe.log_error("[[search_backend.py]] rebuild_ngram_index")
+        try:
+            frappe.cache().delete_keys(build_prefix)
+        except Exception:
+            # Graceful degradation - the running flag expires after REBUILD_TIMEOUT (no logging needed)
+            pass
+
+
+def _replay_dirty(doctype):
+    """Re-index the rows changed while the rebuild ran (it may have read them before the change)."""
+    names = _pipe().smembers(_key(DIRTY_KEY.format(doctype))).delete(
+        _key(DIRTY_KEY.format(doctype))).execute()[0]
+
+    fields = SEARCH_FIELDS[doctype]
+    for name in names or []:
+        name = _decode(name)
+        _remove_ngram_row(doctype, name)
+        row = frappe.db.get_value(doctype, name, fields, as_dict=True)
+        if row:
+            pipe = _pipe()
+            _write_ngram_row(pipe, doctype, name, [row.get(f) for f in fields])
+            pipe.execute()
+
+
+def _record_dirty(doctype, names):
+    """While a rebuild runs, remember the changed rows (replayed after its swap)."""
+    names = [name for name in names if name]
+    if not names or not _pipe().exists(_key(REBUILDING_KEY.format(doctype))).execute()[0]:
+        return
+
+    _pipe().sadd(_key(DIRTY_KEY.format(doctype)), *names).execute()
+
+
+def rebuild_ngram_indexes():
+    """Daily scheduler: rebuild the trigram indexes kept by this module."""
+    rebuild_ngram_index("Customer")
+
+
+def on_customer_change(doc, method=None):
+    """Customer on_update / on_trash: refresh the indexed row."""
+    try:
+        _record_dirty(doc.doctype, [doc.name])
+        if not _ngram_exists(doc.doctype):
+            return
+
+        _remove_ngram_row(doc.doctype, doc.name)
+        if method == "on_trash":
+            return
+
+        pipe = _pipe()
+        _write_ngram_row(pipe, doc.doctype, doc.name, [doc.get(f) for f in SEARCH_FIELDS[doc.doctype]])
+        pipe.execute()
+
+    except Exception:
+        frappe.log_error("[[search_backend.py]] on_customer_change")
+
+
+def on_rename(doc, method=None, old_name=None, new_name=None, merge=False):
+    """Item / Customer after_rename: the name is part of the search text."""
+    try:
+        if doc.meta.has_field(SEARCH_TEXT_FIELD):
+            renamed = frappe.get_doc(doc.doctype, new_name)
+            frappe.db.set_value(
+                doc.doctype, new_name, SEARCH_TEXT_FIELD,
+                build_search_text(_search_values(renamed)), update_modified=False)
+
+        if doc.doctype in SEARCH_FIELDS and doc.doctype != "Item":
+            _record_dirty(doc.doctype, [old_name, new_name])
+
+        if doc.doctype in SEARCH_FIELDS and doc.doctype != "Item" and _ngram_exists(doc.doctype):
+            _remove_ngram_row(doc.doctype, old_name)
+            on_customer_change(frappe.get_doc(doc.doctype, new_name), "on_update")
+
+    except Exception:
+        frappe.log_error("[[search_backend.py]] on_rename")
+
+
+def _write_ngram_row(pipe, doctype, name, values):
+    """Queue the stored text and trigram memberships of one row on a pipeline."""
+    indexed, tokens = _make_ngram_row(values)
+    pipe.hset(_key(ROWS_KEY.format(doctype)), name, indexed)
+    for token in tokens:
+        pipe.sadd(_key(TOKEN_KEY.format(doctype, token)), name)
+
+
+def _make_ngram_row(values):
+    """Stored JSON row (normalized text + tokens, used for removal) and trigrams of one row."""
+    text = " ".join(normalize_text(v) for v in values if v)
+    tokens = set()
+    for value in values:
+        tokens.update(ngrams(normalize_text(value)))
+
+    tokens = sorted(tokens)
+    return json.dumps({"text": text, "tokens": tokens}), tokens
+
+
+def _remove_ngram_row(doctype, name):
+    """Remove one row and its trigram memberships (uses tokens stored on the row)."""
+    if not name:
+        return
+
+    row = _pipe().hget(_key(ROWS_KEY.format(doctype)), name).execute()[0]
+    if not row:
+        return
+
+    pipe = _pipe()
+    pipe.hdel(_key(ROWS_KEY.format(doctype)), name)
+    for token in json.loads(row).get("tokens", []):
+        pipe.srem(_key(TOKEN_KEY.format(doctype, token)), name)
+    pipe.execute()
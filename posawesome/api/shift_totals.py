@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Shift Payment Totals Ledger for POS Awesome
+
+Running per-shift, per-mode-of-payment totals so that get_payment_totals()
+(polled by the Navbar of every till) is a single keyed read instead of a full
+recompute of the shift through _calculate_payment_totals().
+
+CACHE LAYOUT (all keys are site-prefixed through frappe.cache().make_key()):
+- posa_shift_totals|<opening shift>      -> hash mode_of_payment -> amount,
+                                            plus READY_FIELD (seed token) once seeded
+- posa_shift_totals_gen|<opening shift>  -> change counter (bumped by every delta)
+- posa_payment_totals|<profile>|<user>   -> JSON get_payment_totals() result (short TTL)
+- posa_payment_totals_stats              -> hash hits / misses / invalidations
+
+UPDATES (hooks.py doc_events, applied after commit):
+- Sales Invoice on_submit / on_cancel   -> +/- payment amounts (cash minus change_amount)
+- Payment Entry on_submit / on_cancel   -> +/- allocated amounts of referenced shift invoices
+
+Same rules as _calculate_payment_totals() (the single source of truth), which is
+still used to seed a cold ledger, by the closing shift and by the hourly
+reconciliation job. Races between a seed and a delta drop the ledger (the next
+read re-seeds it) instead of counting a payment twice or not at all:
+- a delta flushed while a seed recomputes moves the change counter, the seed
+  discards itself
+- a seed written after a delta was queued (the transaction may already be in
+  the recompute) changes the seed token, the flush drops the ledger instead of
+  applying the delta (WATCH on the ledger while checking the token)
+Pending deltas live in frappe.flags until commit and are discarded on rollback.
+
+REALTIME:
+After the deltas are applied, the new totals are pushed to the shift's cashier
+with the "posa_payment_totals" realtime event (Navbar.js).
+
+RESULT CACHE:
+get_payment_totals() results are cached per (POS Profile, user) - one open shift
+each - for posa_payment_totals_cache_ttl seconds (site config, default 5, 0 = off).
+The entry is dropped after commit whenever a delta for that shift is applied.
+"""
+
+from __future__ import unicode_literals
+import json
+import frappe
+from frappe.utils import cint, flt
+from redis.exceptions import WatchError
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe, decode as _decode
+
+
+TOTALS_KEY = "posa_shift_totals|{0}"
+GENERATION_KEY = "posa_shift_totals_gen|{0}"
+READY_FIELD = "__ready__"
+RESULT_KEY = "posa_payment_totals|{0}|{1}"
+STATS_KEY = "posa_payment_totals_stats"
+
+DEFAULT_RESULT_TTL = 5
+
+# Ledgers of idle / closed shifts expire; a later read re-seeds
+TOTALS_TTL = 24 * 60 * 60
+
+# Differences below this are rounding noise for the reconciliation job
+RECONCILE_TOLERANCE = 0.01
+
+# frappe.flags holding the deltas of the current transaction (see _queue_deltas)
+SHIFT_TOTALS_FLAGS = ("posa_shift_totals_pending", "posa_shift_totals_invalid", "posa_shift_totals_seeds")
+
+
+# =============================================================================
+# SECTION 1: READ
+# =============================================================================
+
+def get_shift_totals(pos_opening_shift, pos_profile):
+    """
+    Payment totals of a shift: {mode_of_payment: amount}.
+    Keyed read of the ledger; seeds it with a full recompute when cold.
+    """
+    try:
+        values = _pipe().hgetall(_key(TOTALS_KEY.format(pos_opening_shift))).execute()[0]
+        values = {_decode(k): _decode(v) for k, v in values.items()}
+
+        if READY_FIELD in values:
+            values.pop(READY_FIELD)
+            return {mode: flt(amount) for mode, amount in values.items()}
+
+        return seed_shift_totals(pos_opening_shift, pos_profile)
+
+    except Exception:
+        # Graceful degradation - recompute from the database (no logging needed)
+        return _recompute(pos_opening_shift, pos_profile)
+
+
+def seed_shift_totals(pos_opening_shift, pos_profile):
+    """Recompute a shift's totals and store them as its ledger."""
+    key = _key(TOTALS_KEY.format(pos_opening_shift))
+    generation_key = _key(GENERATION_KEY.format(pos_opening_shift))
+
+    generation = _pipe().get(generation_key).execute()[0]
+    totals = _recompute(pos_opening_shift, pos_profile)
+
+    # New token per seed: deltas queued against an older seed are not applied to this one
+    mapping = {READY_FIELD: frappe.generate_hash(length=12)}
+    mapping.update({mode: flt(amount) for mode, amount in totals.items() if mode})
+
+    pipe = _pipe()
+    pipe.delete(key)
+    pipe.hset(key, mapping=mapping)
+    pipe.expire(key, TOTALS_TTL)
+    pipe.get(generation_key)
+    current_generation = pipe.execute()[-1]
+
+    # A delta landed while recomputing - it may or may not be in `totals`
+    # (deltas queued before this seed and flushed after it are dropped by _apply_deltas)
+    if current_generation != generation:
+        _pipe().delete(key).execute()
+
+    return totals
+
+
+def _recompute(pos_opening_shift, pos_profile):
+    from posawesome.posawesome.doctype.pos_closing_shift.pos_closing_shift import (
+        _calculate_payment_totals,
+    )
+    return _calculate_payment_totals(pos_opening_shift, pos_profile)
+
+
+# =============================================================================
+# SECTION 1.1: RESULT CACHE (get_payment_totals)
+# =============================================================================
+
+def get_cached_result(pos_profile, user):
+    """Cached get_payment_totals() result for (profile, user), None on miss or when disabled."""
+    try:
+        if _result_ttl() <= 0:
+            return None
+
+        value = _pipe().get(_key(RESULT_KEY.format(pos_profile, user))).execute()[0]
+        _pipe().hincrby(_key(STATS_KEY), "hits" if value else "misses", 1).execute()
+        return json.loads(value) if value else None
+
+    except Exception:
+        # Graceful degradation - compute without cache (no logging needed)
+        return None
+
+
+def set_cached_result(pos_profile, user, result):
+    """Store a get_payment_totals() result for (profile, user) with the configured TTL."""
+    try:
+        ttl = _result_ttl()
+        if ttl > 0:
+            _pipe().set(_key(RESULT_KEY.format(pos_profile, user)), json.dumps(result), ex=ttl).execute()
+
+    except Exception:
+        # Silent fail - next call computes again (no logging needed)
+        pass
+
+
+@frappe.whitelist()
+def get_payment_totals_cache_stats(reset=False):
+    """Hit / miss / invalidation counters of the get_payment_totals() result cache."""
+    frappe.only_for("System Manager")
+
+    pipe = _pipe()
+    pipe.hgetall(_key(STATS_KEY))
+    if cint(reset):
+        pipe.delete(_key(STATS_KEY))
+    values = pipe.execute()[0]
+
+    stats = {_decode(k): cint(_decode(v)) for k, v in values.items()}
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "invalidations": stats.get("invalidations", 0),
+        "hit_ratio": flt(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "ttl": _result_ttl(),
+    }
+
+
+def _result_ttl():
+    return cint(frappe.conf.get("posa_payment_totals_cache_ttl", DEFAULT_RESULT_TTL))
+
+
+# =============================================================================
+# SECTION 2: INCREMENTAL UPDATES (doc_events)
+# =============================================================================
+
+def on_sales_invoice_change(doc, method=None):
+    """Sales Invoice on_submit / on_cancel: apply the invoice payments to its shift."""
+    try:
+        shift = doc.get("posa_pos_opening_shift")
+        if not shift or not doc.get("payments"):
+            return
+
+        sign = -1 if method == "on_cancel" else 1
+        cash_mode_of_payment = _get_cash_mode_of_payment(shift)
+        change_amount = flt(doc.change_amount)
+
+        deltas = {}
+        for payment in doc.payments:
+            amount = flt(payment.amount)
+            # Change returned to the customer is subtracted from cash (same as _calculate_payment_totals)
+            if payment.mode_of_payment == cash_mode_of_payment:
+                amount -= change_amount
+            deltas[payment.mode_of_payment] = deltas.get(payment.mode_of_payment, 0) + sign * amount
+
+        _queue_deltas(shift, deltas)
+
+    except Exception:
+        # Silent fail - ledger is re-seeded by the reconciliation job (no logging needed)
+        _queue_invalidate(doc.get("posa_pos_opening_shift"))
+
+
+def on_payment_entry_change(doc, method=None):
+    """Payment Entry on_submit / on_cancel: apply allocations to shift invoices."""
+    shifts = set()
+    try:
+        if doc.payment_type != "Receive":
+            return
+
+        allocations = {}
+        for ref in doc.get("references", []):
+            if ref.reference_doctype == "Sales Invoice" and ref.reference_name:
+                allocations.setdefault(ref.reference_name, []).append(flt(ref.allocated_amount))
+
+        if not allocations:
+            return
+
+        invoice_shifts = dict(frappe.db.sql("""
+            SELECT name, posa_pos_opening_shift
+            FROM `tabSales Invoice`
+            WHERE name IN %(invoices)s
+            AND IFNULL(posa_pos_opening_shift, '') != ''
+        """, {"invoices": tuple(allocations)}))
+
+        sign = -1 if method == "on_cancel" else 1
+        for invoice, amounts in allocations.items():
+            shift = invoice_shifts.get(invoice)
+            if not shift:
+                continue
+            shifts.add(shift)
+            _queue_deltas(shift, {doc.mode_of_payment: sign * sum(amounts)})
+
+    except Exception:
+        # Silent fail - ledger is re-seeded by the reconciliation job (no logging needed)
+        for shift in shifts:
+            _queue_invalidate(shift)
+
+
+def _queue_deltas(shift, deltas):
+    """Collect deltas per shift and apply them once the transaction commits."""
+    pending = frappe.flags.get("posa_shift_totals_pending")
+    if pending is None:
+        # Callbacks of the current transaction (a rollback drops the after_commit one)
+        pending = frappe.flags.posa_shift_totals_pending = {}
+        frappe.db.after_commit.add(_flush_deltas)
+        frappe.db.after_rollback.add(_discard_deltas)
+
+    if shift not in pending:
+        # Seed the deltas apply to - read before the transaction commits
+        frappe.flags.setdefault("posa_shift_totals_seeds", {})[shift] = _get_seed_token(shift)
+
+    shift_deltas = pending.setdefault(shift, {})
+    for mode_of_payment, amount in deltas.items():
+        if mode_of_payment:
+            shift_deltas[mode_of_payment] = shift_deltas.get(mode_of_payment, 0) + flt(amount)
+
+
+def _queue_invalidate(shift):
+    """Drop a shift's ledger after commit (next read re-seeds it)."""
+    if shift:
+        _queue_deltas(shift, {})
+        frappe.flags.setdefault("posa_shift_totals_invalid", set()).add(shift)
+
+
+def _discard_deltas():
+    """After-rollback callback: the deltas of the rolled back transaction never happened."""
+    for flag in SHIFT_TOTALS_FLAGS:
+        frappe.flags.pop(flag, None)
+
+
+def _flush_deltas():
+    """
+    After-commit callback: bump the change counter, apply the deltas, then push
+    the new totals to the shift's cashier (posa_payment_totals realtime event).
+    """
+    pending = frappe.flags.pop("posa_shift_totals_pending", None) or {}
+    invalid = frappe.flags.pop("posa_shift_totals_invalid", None) or set()
+    seeds = frappe.flags.pop("posa_shift_totals_seeds", None) or {}
+
+    owners = {}
+    try:
+        pipe = _pipe()
+        for shift, deltas in pending.items():
+            key = _key(TOTALS_KEY.format(shift))
+            generation_key = _key(GENERATION_KEY.format(shift))
+
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, TOTALS_TTL)
+
+            # Drop the cached get_payment_totals() result of the shift's cashier
+            owner = frappe.get_cached_value("POS Opening Shift", shift, ["pos_profile", "user"])
+            if owner:
+                owners[shift] = owner
+                pipe.delete(_key(RESULT_KEY.format(*owner)))
+                pipe.hincrby(_key(STATS_KEY), "invalidations", 1)
+
+            if shift in invalid:
+                pipe.delete(key)
+        pipe.execute()
+
+        # After the counter moved: a seed running meanwhile discards itself
+        for shift, deltas in pending.items():
+            if shift not in invalid:
+                _apply_deltas(shift, deltas, seeds.get(shift))
+
+    except Exception:
+        # Silent fail - reconciliation job heals the ledger (no logging needed)
+        pass
+
+    for shift, (pos_profile, user) in owners.items():
+        _publish_totals(shift, pos_profile, user)
+
+
+def _apply_deltas(shift, deltas, seed_token):
+    """
+    Add committed deltas to the ledger seeded before they were queued.
+    A ledger (re)seeded since then may already include them: it is dropped instead.
+    """
+    key = _key(TOTALS_KEY.format(shift))
+    pipe = frappe.cache().pipeline(transaction=True)
+    try:
+        pipe.watch(key)
+        if _decode(pipe.hget(key, READY_FIELD)) != seed_token:
+            pipe.unwatch()
+            _pipe().delete(key).execute()
+            return
+
+        # Not seeded - the next read seeds it from the database
+        if not seed_token:
+            return
+
+        pipe.multi()
+        for mode_of_payment, amount in deltas.items():
+            pipe.hincrbyfloat(key, mode_of_payment, amount)
+        pipe.expire(key, TOTALS_TTL)
+        pipe.execute()
+
+    except WatchError:
+        # Re-seeded while applying
+        _pipe().delete(key).execute()
+    finally:
+        pipe.reset()
+
+
+def _get_seed_token(shift):
+    try:
+        return _decode(_pipe().hget(_key(TOTALS_KEY.format(shift)), READY_FIELD).execute()[0])
+    except Exception:
+        # Graceful degradation - unknown seed, the flush drops a seeded ledger (no logging needed)
+        return None
+
+
+def _publish_totals(shift, pos_profile, user):
+    """
+    Realtime push of a shift's totals to its cashier (Navbar subscribes instead of polling).
+    Totals are sent only when the ledger is seeded; otherwise the client refetches.
+    """
+    try:
+        message = {"pos_opening_shift": shift, "pos_profile": pos_profile}
+
+        values = _pipe().hgetall(_key(TOTALS_KEY.format(shift))).execute()[0]
+        values = {_decode(k): flt(_decode(v)) for k, v in values.items()}
+        if READY_FIELD in values:
+            values.pop(READY_FIELD)
+            cash_mode_of_payment = _get_cash_mode_of_payment(shift)
+            message["cash_total"] = flt(values.get(cash_mode_of_payment, 0.0))
+            message["non_cash_total"] = sum(
+                amount for mode, amount in values.items() if mode != cash_mode_of_payment)
+
+        frappe.publish_realtime("posa_payment_totals", message, user=user)
+
+    except Exception:
+        # Silent fail - Navbar fallback polling picks the totals up (no logging needed)
+        pass
+
+
+# =============================================================================
+# SECTION 3: RECONCILIATION (scheduler)
+# =============================================================================
+
+def reconcile_open_shifts():
+    """
+    Hourly: compare the ledger of every open shift with a full recompute.
+    Mismatches are logged and the ledger is re-seeded.
+    """
+    try:
+        shifts = frappe.get_all(
+            "POS Opening Shift",
+            filters={"docstatus": 1, "status": "Open"},
+            fields=["name", "pos_profile"],
+        )
+
+        for shift in shifts:
+            values = _pipe().hgetall(_key(TOTALS_KEY.format(shift.name))).execute()[0]
+            values = {_decode(k): flt(_decode(v)) for k, v in values.items()}
+            if READY_FIELD not in values:
+                continue
+            values.pop(READY_FIELD)
+
+            expected = {m: flt(a) for m, a in _recompute(shift.name, shift.pos_profile).items() if m}
+            modes = set(values) | set(expected)
+            if any(abs(values.get(m, 0) - expected.get(m, 0)) > RECONCILE_TOLERANCE for m in modes):
+                frappe.log_error(
+                    title="[[shift_totals.py]] reconcile_open_shifts",
+                    message=f"Shift {shift.name}: ledger {values} != recomputed {expected}",
+                )
+                seed_shift_totals(shift.name, shift.pos_profile)
+
+    except Exception:
+        frappe.log_error("[[shift_totals.py]] reconcile_open_shifts")
+
+
+# =============================================================================
+# SECTION 4: HELPERS
+# =============================================================================
+
+def _get_cash_mode_of_payment(shift):
+    """Cash mode of payment of the shift's POS Profile (default "Cash")."""
+    pos_profile = frappe.get_cached_value("POS Opening Shift", shift, "pos_profile")
+    return frappe.get_cached_value("POS Profile", pos_profile, "posa_cash_mode_of_payment") or "Cash"
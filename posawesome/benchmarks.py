@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+POS Awesome benchmarks (developer tool, not used by the app).
+
+Invoice submission - query count and time per submission, legacy flow vs fast path:
+
+    bench --site <site> execute posawesome.benchmarks.benchmark_invoice_submission \
+        --kwargs "{'invoice_name': 'ACC-SINV-2026-00001', 'runs': 20}"
+
+Offline sync - drain a simulated offline backlog through sync_offline_invoices():
+
+    bench --site <site> execute posawesome.benchmarks.simulate_offline_backlog \
+        --kwargs "{'invoice_name': 'ACC-SINV-2026-00001', 'count': 2000}"
+
+invoice_name is a submitted POS Sales Invoice of an open shift used as the template: each run submits
+copies of it and rolls back, so nothing is kept in the database.
+
+Offer evaluation - cost of matching carts as the number of active offers grows:
+
+    bench --site <site> execute posawesome.benchmarks.benchmark_offer_evaluation \
+        --kwargs "{'offer_counts': [10, 100, 1000, 5000], 'carts': 500}"
+
+Offer solver - best price assignment of large baskets, cold and memoized:
+
+    bench --site <site> execute posawesome.benchmarks.benchmark_offer_solver \
+        --kwargs "{'line_counts': [10, 100, 1000], 'offer_count': 2000}"
+"""
+
+from __future__ import unicode_literals
+import copy
+import random
+import time
+import uuid
+import frappe
+from frappe.utils import flt
+from posawesome.api import offer_index, offer_solver, sales_invoice
+from posawesome.posawesome.doctype.pos_offer import pos_offer
+
+
+# =============================================================================
+# INVOICE SUBMISSION
+# =============================================================================
+
+def benchmark_invoice_submission(invoice_name, runs=10):
+    """
+    Compare create_and_submit_invoice() flows on copies of invoice_name.
+
+    - legacy: set_missing_values(), validate(), insert(), submit() and an
+      uncached company address check (the flow before the fast path)
+    - fast: _prepare_pos_invoice() + _submit_pos_invoice() (single validation,
+      memoized company address)
+
+    Returns:
+        dict: {flow: {queries, median_ms, max_ms}} - queries per submission
+    """
+    template = _invoice_template(invoice_name)
+    runs = max(1, int(runs))
+
+    results = {}
+    for flow, submit in (("legacy", _submit_legacy), ("fast", _submit_fast)):
+        # Warm-up run (imports, meta and document caches) is not measured
+        _measure(submit, template)
+
+        queries, timings = [], []
+        for _i in range(runs):
+            query_count, elapsed = _measure(submit, template)
+            queries.append(query_count)
+            timings.append(elapsed)
+
+        timings.sort()
+        results[flow] = {
+            "queries": max(queries),
+            "median_ms": flt(timings[len(timings) // 2] * 1000, 2),
+            "max_ms": flt(timings[-1] * 1000, 2),
+        }
+
+    print(frappe.as_json(results))
+    return results
+
+
+def _submit_legacy(invoice_doc):
+    """Flow of create_and_submit_invoice() before the fast path (three validations)."""
+    _clear_company_address_memo(invoice_doc)
+    doc = sales_invoice._prepare_pos_invoice(invoice_doc)
+    doc.validate()
+    doc.insert()
+    doc.submit()
+
+
+def _submit_fast(invoice_doc):
+    doc = sales_invoice._prepare_pos_invoice(invoice_doc)
+    sales_invoice._submit_pos_invoice(doc)
+
+
+def _measure(submit, template):
+    """Run one submission, return (query count, seconds). Always rolled back."""
+    query_count = [0]
+    sql = frappe.db.sql
+
+    def counting_sql(*args, **kwargs):
+        query_count[0] += 1
+        return sql(*args, **kwargs)
+
+    frappe.db.sql = counting_sql
+    try:
+        started = time.perf_counter()
+        submit(copy.deepcopy(template))
+        elapsed = time.perf_counter() - started
+    finally:
+        del frappe.db.sql
+        frappe.db.rollback()
+
+    return query_count[0], elapsed
+
+
+# =============================================================================
+# OFFLINE SYNC
+# =============================================================================
+
+def simulate_offline_backlog(invoice_name, count=1000, batch_size=None, resend_ratio=0.1):
+    """
+    Stand-in for a till draining its offline backlog.
+
+    Captures `count` copies of invoice_name with client UUIDs, syncs them in
+    batches of batch_size (default MAX_OFFLINE_SYNC_BATCH), then re-sends
+    resend_ratio of the batches as a lost-response retry would. Everything is
+    rolled back at the end.
+
+    Returns:
+        dict: invoices/second, result counts per status and whether every
+              re-sent invoice was reported as a Duplicate
+    """
+    template = _invoice_template(invoice_name)
+    count = max(1, int(count))
+    batch_size = max(1, min(int(batch_size or sales_invoice.MAX_OFFLINE_SYNC_BATCH),
+                            sales_invoice.MAX_OFFLINE_SYNC_BATCH))
+
+    backlog = [
+        {"client_uuid": str(uuid.uuid4()), "invoice_doc": copy.deepcopy(template)}
+        for _i in range(count)
+    ]
+    batches = [backlog[i:i + batch_size] for i in range(0, count, batch_size)]
+    resent = batches[:int(len(batches) * flt(resend_ratio))]
+
+    statuses = {}
+    resent_duplicates = 0
+    try:
+        started = time.perf_counter()
+        for batch in batches:
+            for result in sales_invoice.sync_offline_invoices(copy.deepcopy(batch)):
+                statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        elapsed = time.perf_counter() - started
+
+        for batch in resent:
+            for result in sales_invoice.sync_offline_invoices(copy.deepcopy(batch)):
+                resent_duplicates += result["status"] == "Duplicate"
+    finally:
+        frappe.db.rollback()
+
+    resent_count = sum(len(batch) for batch in resent)
+    results = {
+        "invoices": count,
+        "batch_size": batch_size,
+        "seconds": flt(elapsed, 2),
+        "invoices_per_second": flt(count / elapsed, 1) if elapsed else 0,
+        "statuses": statuses,
+        "resent": resent_count,
+        "resent_all_duplicates": resent_duplicates == resent_count,
+    }
+
+    print(frappe.as_json(results))
+    return results
+
+
+def _invoice_template(invoice_name):
+    """New-invoice dict built from a submitted POS invoice (as sent by the POS page)."""
+    source = frappe.get_doc("Sales Invoice", invoice_name)
+    if not source.is_pos:
+        frappe.throw("Benchmark template must be a POS Sales Invoice")
+
+    template = frappe.copy_doc(source).as_dict(no_default_fields=True)
+    template["doctype"] = "Sales Invoice"
+    template["posting_date"] = frappe.utils.nowdate()
+    template["posting_time"] = frappe.utils.nowtime()
+    template.pop("name", None)
+    return template
+
+
+def _clear_company_address_memo(invoice_doc):
+    if invoice_doc.get("company") and invoice_doc.get("company_address"):
+        frappe.cache().delete_value(sales_invoice.COMPANY_ADDRESS_CACHE_KEY.format(
+            invoice_doc["company"], invoice_doc["company_address"]))
+
+
+# =============================================================================
+# OFFER EVALUATION
+# =============================================================================
+
+OFFER_BENCH_ITEMS = 5000
+OFFER_BENCH_GROUPS = 50
+OFFER_BENCH_BRANDS = 50
+OFFER_BENCH_CUSTOMERS = 1000
+
+
+def benchmark_offer_evaluation(offer_counts=(10, 100, 1000, 5000), carts=200, lines=10):
+    """
+    Match the same carts against growing sets of synthetic active offers.
+
+    - indexed: offer_index.match_offers() on the compiled index (get_offers path)
+    - linear: check_offer_applicable_for_data() over every offer (the per-offer
+      evaluation the index replaces)
+
+    Offers and carts are generated in memory (fixed seed), nothing touches the
+    database. Customer group offers are left out: they need a Customer lookup.
+
+    Returns:
+        dict: {offer_count: {indexed_us, linear_us, matched, same_result}} -
+              microseconds per cart and average matched offers per cart
+    """
+    rng = random.Random(42)
+    cart_list = [_synthetic_cart(rng, max(1, int(lines))) for _i in range(max(1, int(carts)))]
+
+    results = {}
+    for offer_count in offer_counts:
+        offers = _synthetic_offers(rng, int(offer_count))
+        index = offer_index.compile_offers(offers)
+        rows = [frappe._dict(index["offers"][name]) for name in index["order"]]
+
+        started = time.perf_counter()
+        indexed = [offer_index.match_offers(index, cart["items"], cart["customer"])
+                   for cart in cart_list]
+        indexed_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        linear = []
+        for cart in cart_list:
+            total_qty = sum(flt(item["qty"]) for item in cart["items"])
+            linear.append([offer for offer in rows
+                           if pos_offer.check_offer_applicable_for_data(offer, cart, total_qty)])
+        linear_elapsed = time.perf_counter() - started
+
+        results[offer_count] = {
+            "indexed_us": flt(indexed_elapsed / len(cart_list) * 1e6, 1),
+            "linear_us": flt(linear_elapsed / len(cart_list) * 1e6, 1),
+            "matched": flt(sum(len(matched) for matched in indexed) / len(cart_list), 2),
+            "same_result": all(
+                [offer.name for offer in a] == [offer.name for offer in b]
+                for a, b in zip(indexed, linear)
+            ),
+        }
+
+    print(frappe.as_json(results))
+    return results
+
+
+def benchmark_offer_solver(line_counts=(10, 100, 500, 1000), offer_count=1000, carts=50):
+    """
+    Solve synthetic baskets with offer_solver.solve().
+
+    - cold_us: first solve of a cart (memo cleared)
+    - memo_us: same cart again (memoized per cart signature)
+
+    Offers are matched against each basket through the compiled index first
+    (matched = offers handed to the solver). Nothing touches the database.
+
+    Returns:
+        dict: {line_count: {cold_us, memo_us, matched}} - microseconds per basket
+    """
+    rng = random.Random(7)
+    offers = _synthetic_offers(rng, int(offer_count))
+    for offer in offers:
+        offer.stackable = rng.choice([0, 1])
+    index = offer_index.compile_offers(offers)
+
+    results = {}
+    for line_count in line_counts:
+        baskets = [_synthetic_cart(rng, int(line_count)) for _i in range(max(1, int(carts)))]
+        applicable = [offer_index.match_offers(index, basket["items"], basket["customer"])
+                      for basket in baskets]
+
+        offer_solver._memo.clear()
+        started = time.perf_counter()
+        for basket, matched in zip(baskets, applicable):
+            offer_solver.solve(basket["items"], matched)
+        cold_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for basket, matched in zip(baskets, applicable):
+            offer_solver.solve(basket["items"], matched)
+        memo_elapsed = time.perf_counter() - started
+
+        results[line_count] = {
+            "cold_us": flt(cold_elapsed / len(baskets) * 1e6, 1),
+            "memo_us": flt(memo_elapsed / len(baskets) * 1e6, 1),
+            "matched": flt(sum(len(matched) for matched in applicable) / len(baskets), 1),
+        }
+
+    print(frappe.as_json(results))
+    return results
+
+
+def _synthetic_offers(rng, count):
+    """
+    Active offers spread over items, groups, brands and customers (offer order).
+    A profile has at most one grand_total offer (POSOffer.check_duplicate_offers).
+    """
+    offers = []
+    for i in range(count):
+        offer_type = "grand_total" if i == 0 else rng.choice(
+            ["item_code", "item_code", "item_group", "brand", "customer"])
+        offer = frappe._dict({
+            "name": "BENCH-OFFER-{0:05d}".format(i),
+            "title": "Bench Offer {0}".format(i),
+            "offer_type": offer_type,
+            "discount_type": "Discount Percentage",
+            "discount_percentage": rng.choice([5, 10, 15, 20]),
+            "auto": rng.choice([0, 1]),
+            "min_qty": rng.choice([0, 0, 2, 5]),
+            "max_qty": rng.choice([0, 0, 20]),
+            "min_amt": rng.choice([0, 0, 100]),
+            "max_amt": rng.choice([0, 0, 5000]),
+        })
+        if offer_type == "item_code":
+            offer.item_code = _bench_item(rng.randrange(OFFER_BENCH_ITEMS))
+        elif offer_type == "item_group":
+            offer.item_group = "BENCH-GROUP-{0}".format(rng.randrange(OFFER_BENCH_GROUPS))
+        elif offer_type == "brand":
+            offer.brand = "BENCH-BRAND-{0}".format(rng.randrange(OFFER_BENCH_BRANDS))
+        elif offer_type == "customer":
+            offer.customer = "BENCH-CUSTOMER-{0}".format(rng.randrange(OFFER_BENCH_CUSTOMERS))
+        offers.append(offer)
+
+    offers.sort(key=lambda offer: (-offer.auto, -offer.discount_percentage, offer.title))
+    return offers
+
+
+def _synthetic_cart(rng, lines):
+    items = []
+    for _i in range(lines):
+        item = rng.randrange(OFFER_BENCH_ITEMS)
+        items.append({
+            "item_code": _bench_item(item),
+            "item_group": "BENCH-GROUP-{0}".format(item % OFFER_BENCH_GROUPS),
+            "brand": "BENCH-BRAND-{0}".format(item % OFFER_BENCH_BRANDS),
+            "qty": rng.randint(1, 4),
+            "rate": rng.choice([5, 20, 80, 250]),
+        })
+    return {"customer": "BENCH-CUSTOMER-{0}".format(rng.randrange(OFFER_BENCH_CUSTOMERS)), "items": items}
+
+
+def _bench_item(item):
+    return "BENCH-ITEM-{0:05d}".format(item)
@@ -26,8 +26,99 @@ doctype_js = {
 
 doc_events = {
     "Sales Invoice": {
-        "before_cancel": "posawesome.posawesome.api.before_cancel.before_cancel",
+        # Shift check and returned balances release (posawesome/api/before_cancel.py)
+        "before_cancel": "posawesome.api.before_cancel.before_cancel",
+        # Returned balances of the original invoice (posawesome/api/on_submit.py)
+        # and shift payment totals ledger (posawesome/api/shift_totals.py)
+        "on_submit": [
+            "posawesome.api.on_submit.on_submit",
+            "posawesome.api.shift_totals.on_sales_invoice_change",
+        ],
+        "on_cancel": "posawesome.api.shift_totals.on_sales_invoice_change",
     },
+    "Payment Entry": {
+        "on_submit": "posawesome.api.shift_totals.on_payment_entry_change",
+        "on_cancel": "posawesome.api.shift_totals.on_payment_entry_change",
+    },
+    # Item catalog index (posawesome/api/item_index.py) and search text (posawesome/api/search_backend.py)
+    "Item": {
+        "validate": "posawesome.api.search_backend.set_search_text",
+        "on_update": "posawesome.api.item_index.on_item_change",
+        "on_trash": "posawesome.api.item_index.on_item_change",
+        "after_rename": [
+            "posawesome.api.item_index.on_item_rename",
+            "posawesome.api.search_backend.on_rename",
+        ],
+    },
+    # Customer search text and ngram index (posawesome/api/search_backend.py)
+    # customer name resolver LRU (posawesome/api/customer_names.py)
+    # and offer customer attribute LRU (posawesome/api/customer_attributes.py)
+    "Customer": {
+        "validate": "posawesome.api.search_backend.set_search_text",
+        "on_update": [
+            "posawesome.api.search_backend.on_customer_change",
+            "posawesome.api.customer_names.on_customer_change",
+            "posawesome.api.customer_attributes.on_customer_change",
+        ],
+        "on_trash": [
+            "posawesome.api.search_backend.on_customer_change",
+            "posawesome.api.customer_names.on_customer_change",
+            "posawesome.api.customer_attributes.on_customer_change",
+        ],
+        "after_rename": [
+            "posawesome.api.search_backend.on_rename",
+            "posawesome.api.customer_names.on_rename",
+            "posawesome.api.customer_attributes.on_rename",
+        ],
+    },
+    # Mode of payment account map (posawesome/api/payment_accounts.py)
+    "Mode of Payment": {
+        "on_update": "posawesome.api.payment_accounts.on_mode_of_payment_change",
+        "on_trash": "posawesome.api.payment_accounts.on_mode_of_payment_change",
+    },
+    "Company": {
+        "on_update": "posawesome.api.payment_accounts.on_company_change",
+        "on_trash": "posawesome.api.payment_accounts.on_company_change",
+    },
+    "Account": {
+        "on_update": "posawesome.api.payment_accounts.on_account_change",
+        "on_trash": "posawesome.api.payment_accounts.on_account_change",
+        "after_rename": "posawesome.api.payment_accounts.on_account_change",
+    },
+    # Company address memo (posawesome/api/sales_invoice.py)
+    "Address": {
+        "on_update": "posawesome.api.sales_invoice.on_address_change",
+        "on_trash": "posawesome.api.sales_invoice.on_address_change",
+        "after_rename": "posawesome.api.sales_invoice.on_address_change",
+    },
+    # Compiled offer index (posawesome/api/offer_index.py)
+    "POS Offer": {
+        "on_update": "posawesome.api.offer_index.on_offer_change",
+        "on_trash": "posawesome.api.offer_index.on_offer_change",
+    },
+    "Item Price": {
+        "on_update": "posawesome.api.item_index.on_item_price_change",
+        "on_trash": "posawesome.api.item_index.on_item_price_change",
+    },
+    # Compiled barcode rules (posawesome/api/item.py)
+    "POS Profile": {
+        "on_update": "posawesome.api.item.clear_barcode_rules_cache",
+        "on_trash": "posawesome.api.item.clear_barcode_rules_cache",
+    },
+    "Stock Ledger Entry": {
+        "on_submit": "posawesome.api.item_index.on_stock_ledger_change",
+        "on_cancel": "posawesome.api.item_index.on_stock_ledger_change",
+    },
+}
+
+scheduler_events = {
+    "hourly": [
+        "posawesome.api.shift_totals.reconcile_open_shifts",
+    ],
+    "daily": [
+        "posawesome.api.item_index.rebuild_catalog_index",
+        "posawesome.api.search_backend.rebuild_ngram_indexes",
+    ],
 }
 
 permission_query_conditions = {
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Composite index for loading the active offers of a POS Profile
+(api/offer_index.py): seek on company, then the pos_profile values of the
+query (the profile, '' or NULL); disable and the valid_from / valid_upto range
+are checked from the index entries.
+"""
+
+import frappe
+
+
+def execute():
+    frappe.db.add_index(
+        "POS Offer",
+        ["company", "pos_profile", "disable", "valid_from", "valid_upto"],
+        "posa_offer_profile_index",
+    )
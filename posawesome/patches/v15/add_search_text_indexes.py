@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Add the normalized posa_search_text field to Item and Customer, backfill it,
+add its FULLTEXT index (MariaDB) and rebuild the Redis ngram indexes.
+
+The fields are also in fixtures/custom_field.json, but fixtures are synced after
+post_model_sync patches, so they are created here first.
+"""
+
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from posawesome.api import item_index, search_backend
+
+
+def execute():
+    create_custom_fields(search_backend.SEARCH_TEXT_CUSTOM_FIELDS, update=True)
+
+    for doctype in search_backend.SEARCH_TEXT_CUSTOM_FIELDS:
+        frappe.clear_cache(doctype=doctype)
+        search_backend.backfill_search_text(doctype)
+        search_backend.add_fulltext_index(doctype)
+
+    # Tokens are now Arabic-normalized - rebuild the trigram indexes
+    item_index.enqueue_rebuild()
+    search_backend.enqueue_ngram_rebuild("Customer")
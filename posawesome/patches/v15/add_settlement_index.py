@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Composite index for the settlement list (sales_invoice.get_settlement_invoices):
+equality on pos_profile / owner, then keyset pagination over creation DESC.
+"""
+
+import frappe
+
+
+def execute():
+    frappe.db.add_index("Sales Invoice", ["pos_profile", "owner", "creation"], "posa_settlement_index")
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and contributors
+# For license information, please see license.txt
+
+"""
+Add the materialized returned balances (Sales Invoice.posa_returned_amount and
+Sales Invoice Item.posa_returned_qty) and backfill them from the submitted returns.
+
+Set-based and idempotent: every value is recomputed from the submitted returns
+(invoices whose returns were all cancelled go back to 0), so the patch can be
+re-run. Return rows without sales_invoice_item (legacy returns) are booked on
+the first original row with the same item_code, like update_returned_balances().
+"""
+
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from posawesome.api.sales_invoice import RETURN_BALANCE_CUSTOM_FIELDS
+
+
+def execute():
+    create_custom_fields(RETURN_BALANCE_CUSTOM_FIELDS, update=True)
+    for doctype in RETURN_BALANCE_CUSTOM_FIELDS:
+        frappe.clear_cache(doctype=doctype)
+
+    # Returned amount per original invoice (return grand totals are negative),
+    # 0 for invoices without submitted returns - only changed rows are written
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice` si
+        LEFT JOIN (
+            SELECT return_against, -SUM(grand_total) AS returned_amount
+            FROM `tabSales Invoice`
+            WHERE docstatus = 1 AND is_return = 1 AND IFNULL(return_against, '') != ''
+            GROUP BY return_against
+        ) r ON r.return_against = si.name
+        SET si.posa_returned_amount = IFNULL(r.returned_amount, 0)
+        WHERE IFNULL(si.posa_returned_amount, 0) != IFNULL(r.returned_amount, 0)
+    """)
+
+    # Reset every returned quantity before adding the quantities of the submitted returns
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice Item`
+        SET posa_returned_qty = 0
+        WHERE parenttype = 'Sales Invoice' AND IFNULL(posa_returned_qty, 0) != 0
+    """)
+
+    # Linked return rows (sales_invoice_item)
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice Item` oi
+        INNER JOIN (
+            SELECT ri.sales_invoice_item, -SUM(ri.qty) AS returned_qty
+            FROM `tabSales Invoice Item` ri
+            INNER JOIN `tabSales Invoice` r ON r.name = ri.parent
+            WHERE r.docstatus = 1 AND r.is_return = 1
+            AND IFNULL(r.return_against, '') != ''
+            AND IFNULL(ri.sales_invoice_item, '') != ''
+            GROUP BY ri.sales_invoice_item
+        ) x ON x.sales_invoice_item = oi.name
+        SET oi.posa_returned_qty = IFNULL(oi.posa_returned_qty, 0) + x.returned_qty
+        WHERE oi.parenttype = 'Sales Invoice'
+    """)
+
+    # Unlinked return rows: first original row with the same item_code
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice Item` oi
+        INNER JOIN (
+            SELECT r.return_against, ri.item_code, -SUM(ri.qty) AS returned_qty
+            FROM `tabSales Invoice Item` ri
+            INNER JOIN `tabSales Invoice` r ON r.name = ri.parent
+            WHERE r.docstatus = 1 AND r.is_return = 1
+            AND IFNULL(r.return_against, '') != ''
+            AND IFNULL(ri.sales_invoice_item, '') = ''
+            GROUP BY r.return_against, ri.item_code
+        ) x ON x.return_against = oi.parent AND x.item_code = oi.item_code
+        INNER JOIN (
+            SELECT fi.parent, fi.item_code, MIN(fi.idx) AS idx
+            FROM `tabSales Invoice Item` fi
+            INNER JOIN `tabSales Invoice` r ON r.return_against = fi.parent
+            WHERE r.docstatus = 1 AND r.is_return = 1 AND fi.parenttype = 'Sales Invoice'
+            GROUP BY fi.parent, fi.item_code
+        ) f ON f.parent = oi.parent AND f.item_code = oi.item_code AND f.idx = oi.idx
+        SET oi.posa_returned_qty = IFNULL(oi.posa_returned_qty, 0) + x.returned_qty
+        WHERE oi.parenttype = 'Sales Invoice'
+    """)
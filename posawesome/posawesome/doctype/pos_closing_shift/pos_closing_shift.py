@@ -8,6 +8,8 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import flt, cint
 from datetime import datetime, time as dtime, timedelta
+from posawesome.api import shift_totals
+from posawesome.api.customer_names import get_customer_names
 
 
 # =============================================================================
@@ -81,6 +83,34 @@ class POSClosingShift(Document):
                     title=_("Invalid Opening Entry"),
                 )
 
+            # Validate no invoice of the shift is still being submitted in background
+            # (POS Profile posa_async_invoice_submit - sales_invoice.submit_invoice_async)
+            # Related to: section_break_1 (pos_opening_shift)
+            if frappe.db.exists("Sales Invoice", {
+                "posa_pos_opening_shift": self.pos_opening_shift,
+                "docstatus": 0,
+                "posa_submit_status": "Queued",
+            }):
+                frappe.throw(
+                    _("Some invoices of this shift are still being submitted, please try again shortly"),
+                    title=_("Invoices In Progress"),
+                )
+
+            # Validate no accepted invoice failed its background submission
+            # (would stay a draft of a closed shift - retry or delete it first)
+            # Related to: section_break_1 (pos_opening_shift)
+            failed_invoices = frappe.get_all("Sales Invoice", filters={
+                "posa_pos_opening_shift": self.pos_opening_shift,
+                "docstatus": 0,
+                "posa_submit_status": "Failed",
+            }, pluck="name")
+            if failed_invoices:
+                frappe.throw(
+                    _("Invoices {0} of this shift failed to submit, please retry or delete them before closing").format(
+                        ", ".join(failed_invoices)),
+                    title=_("Failed Invoices"),
+                )
+
             # Update payment reconciliation difference values
             # Calculates difference = closing_amount - expected_amount for each payment method
             # Related to: section_break_4 (payment_reconciliation)
@@ -213,6 +243,15 @@ class POSClosingShift(Document):
             self.delete_draft_invoices()
 
             opening_entry.save()
+
+            # Tell the cashier's tills the shift is closed (Navbar.js reloads)
+            # Replaces the 2-second check_shift_is_open polling (kept as slow fallback)
+            frappe.publish_realtime(
+                "posa_shift_closed",
+                {"pos_opening_shift": self.pos_opening_shift, "pos_profile": self.pos_profile},
+                user=self.user,
+                after_commit=True,
+            )
         except Exception as e:
             frappe.log_error(f"[[pos_closing_shift.py]] on_submit")
             raise
@@ -257,7 +296,9 @@ class POSClosingShift(Document):
                 "Sales Invoice",
                 filters={
                     "posa_pos_opening_shift": self.pos_opening_shift,
-                    "docstatus": 0  # Draft only
+                    "docstatus": 0,  # Draft only
+                    # Keep invoices accepted for background submission (failed ones block validate)
+                    "posa_submit_status": ["is", "not set"],
                 },
                 fields=["name"]
             )
@@ -494,6 +535,12 @@ def get_payment_totals(pos_profile=None, user=None):
         if not user:
             user = frappe.session.user
 
+        # Short-TTL result cache per (profile, user), dropped on invoice / payment changes
+        cached = shift_totals.get_cached_result(pos_profile_name, user)
+        if cached is not None:
+            return cached
+        requested_profile = pos_profile_name
+
         # FRAPPE STANDARD: Re-fetch document from database if needed
         # Find current open shift for user
         open_shift = frappe.get_all(
@@ -510,7 +557,9 @@ def get_payment_totals(pos_profile=None, user=None):
         )
 
         if not open_shift:
-            return {"cash_total": 0.0, "non_cash_total": 0.0}
+            result = {"cash_total": 0.0, "non_cash_total": 0.0}
+            shift_totals.set_cached_result(requested_profile, user, result)
+            return result
 
         shift_name = open_shift[0].name
         pos_profile_name = open_shift[0].pos_profile
@@ -524,8 +573,9 @@ def get_payment_totals(pos_profile=None, user=None):
         if not cash_mode_of_payment:
             cash_mode_of_payment = "Cash"
 
-        # Calculate payment totals using helper (returns dict: {mode_of_payment: amount})
-        payment_totals = _calculate_payment_totals(
+        # Keyed read of the shift totals ledger (returns dict: {mode_of_payment: amount})
+        # Maintained on invoice / payment entry submit and cancel (posawesome/api/shift_totals.py)
+        payment_totals = shift_totals.get_shift_totals(
             shift_name, pos_profile_name)
 
         # Get cash total from dict
@@ -538,6 +588,7 @@ def get_payment_totals(pos_profile=None, user=None):
                 non_cash_total += flt(amount)
 
         result = {"cash_total": cash_total, "non_cash_total": non_cash_total}
+        shift_totals.set_cached_result(requested_profile, user, result)
 
         return result
 
@@ -1098,6 +1149,9 @@ def _get_pos_invoices_helper(pos_opening_shift):
                 "tax_amount": flt(tax.tax_amount or 0)
             })
 
+        # Customer names of the whole shift in one query (customer_names.py)
+        customer_names = get_customer_names(inv.customer for inv in invoices_data)
+
         # Build invoice dicts with all required fields
         # Single currency: POS Profile.currency only - no base_* or conversion_rate needed
         invoices = []
@@ -1108,6 +1162,7 @@ def _get_pos_invoices_helper(pos_opening_shift):
                 # Required for Sales Invoice Reference
                 "posting_date": invoice_row.posting_date,
                 "customer": invoice_row.customer,  # Required for Sales Invoice Reference
+                "customer_name": customer_names.get(invoice_row.customer, invoice_row.customer),
                 "grand_total": flt(invoice_row.grand_total or 0),
                 "net_total": flt(invoice_row.net_total or 0),
                 "total_qty": flt(invoice_row.total_qty or 0),
@@ -5,7 +5,8 @@
 from __future__ import unicode_literals
 import frappe
 from frappe.model.document import Document
-from frappe.utils import nowdate, flt
+from frappe.utils import nowdate, flt, cint
+from posawesome.api import customer_attributes, offer_index, offer_solver
 
 
 class POSOffer(Document):
@@ -211,13 +212,13 @@ def get_offers(invoice_data):
             existing_offers = {offer.get(
                 "offer_name") for offer in updated_invoice["posa_offers"] if offer.get("offer_name")}
 
-        for offer in applicable_offers:
-            # Skip if offer is already applied
-            if offer.get("name") in existing_offers:
-                continue
-
-            if apply_offer_by_type(offer, updated_invoice):
-                applied_offers.append(offer)
+        # Skip offers already applied, pick the best price assignment of the rest
+        # (posawesome/api/offer_solver.py stacking rules)
+        candidates = [offer for offer in applicable_offers
+                      if offer.get("name") not in existing_offers]
+        if candidates:
+            solution = offer_solver.solve(updated_invoice.get("items", []), candidates)
+            applied_offers = apply_offer_solution(candidates, solution, updated_invoice)
 
         out = {
             "enabled": True,
@@ -237,6 +238,48 @@ def get_offers(invoice_data):
         }
 
 
+@frappe.whitelist()
+def get_offers_delta(pos_profile, session_id, fingerprint=None, lines=None, removed=None,
+                     customer=None, reset=0, posting_date=None):
+    """
+    Incremental offer evaluation of a cart (posawesome/api/offer_index.py CART SESSIONS).
+
+    The client sends the full cart once with reset=1, then only the changed /
+    removed lines with the fingerprint of the last response.
+
+    Returns:
+        dict: {enabled, resync, fingerprint, added, removed, line_discounts,
+               additional_discount_percentage, transaction_offers, total_qty,
+               total_amount} - resync=True asks for a reset call
+    """
+    try:
+        if not check_offers_enabled_by_profile(pos_profile):
+            return {"enabled": False, "resync": False, "added": [], "removed": [], "line_discounts": {}}
+
+        lines = frappe.parse_json(lines) if isinstance(lines, str) else lines
+        removed = frappe.parse_json(removed) if isinstance(removed, str) else removed
+        company, warehouse = frappe.get_cached_value(
+            "POS Profile", pos_profile, ["company", "warehouse"])
+
+        result = offer_index.apply_cart_delta(
+            session_id, company, pos_profile, warehouse,
+            fingerprint=fingerprint,
+            lines=lines,
+            removed=removed,
+            customer=customer,
+            reset=cint(reset),
+            posting_date=posting_date,
+        )
+        result["enabled"] = True
+        return result
+
+    except frappe.ValidationError:
+        raise
+    except Exception:
+        frappe.log_error("[[pos_offer.py]] get_offers_delta")
+        return {"enabled": True, "resync": True}
+
+
 @frappe.whitelist()
 def get_applicable_offers(invoice_name):
     """Get applied offers from existing Sales Invoice"""
@@ -276,28 +319,10 @@ def get_offers_for_profile(profile):
         if not check_offers_enabled_by_profile(profile_name):
             return []
 
-        # Get applicable offers for POS Profile
-        pos_profile_doc = frappe.get_doc("POS Profile", profile_name)
-        company = pos_profile_doc.company
-        warehouse = pos_profile_doc.warehouse
-        date = nowdate()
-
-        offers = frappe.get_all(
-            "POS Offer",
-            fields=["name", "title", "description", "offer_type", "discount_type",
-                    "discount_percentage", "min_qty", "max_qty",
-                    "min_amt", "max_amt", "auto", "item_code", "item_group",
-                    "brand", "customer", "customer_group", "valid_from", "valid_upto"],
-            filters={
-                "disable": 0,
-                "company": company,
-                "pos_profile": ["in", [profile_name, ""]],
-                "warehouse": ["in", [warehouse, ""]],
-                "valid_from": ["<=", date],
-                "valid_upto": [">=", date]
-            },
-            order_by="auto desc, discount_percentage desc, title asc"
-        )
+        # Get applicable offers for POS Profile (compiled offer index)
+        company, warehouse = frappe.get_cached_value(
+            "POS Profile", profile_name, ["company", "warehouse"])
+        offers = offer_index.get_active_offers(company, profile_name, warehouse, nowdate())
 
         return offers or []
 
@@ -316,51 +341,27 @@ def check_offers_enabled_by_profile(profile):
         return False
 
     try:
-        pos_profile_doc = frappe.get_doc("POS Profile", profile)
-        return pos_profile_doc.get("posa_auto_fetch_offers")
+        return frappe.get_cached_value("POS Profile", profile, "posa_auto_fetch_offers")
     except:
         return False
 
 
 def get_applicable_offers_for_invoice_data(invoice_data):
-    """Get all offers that match invoice criteria"""
+    """
+    Get all offers that match invoice criteria.
+
+    Offers are matched in memory against the compiled offer index of the
+    company / profile / warehouse / posting date (posawesome/api/offer_index.py).
+    """
     try:
-        # Extract required data from invoice
-        company = invoice_data.get("company")
-        pos_profile = invoice_data.get("pos_profile")
-        warehouse = invoice_data.get("set_warehouse")
-        posting_date = invoice_data.get("posting_date") or nowdate()
-
-        # Calculate total quantity
-        total_qty = sum(flt(item.get("qty", 0))
-                        for item in invoice_data.get("items", []))
-        total_amount = sum(flt(item.get("qty", 0)) * flt(item.get("rate", 0))
-                           for item in invoice_data.get("items", []))
-        # Get applicable offers
-        offers = frappe.get_all(
-            "POS Offer",
-            filters={
-                "disable": 0,
-                "company": company,
-                "pos_profile": ["in", [pos_profile, ""]],
-                "warehouse": ["in", [warehouse, ""]],
-                "valid_from": ["<=", posting_date],
-                "valid_upto": [">=", posting_date],
-                "min_qty": ["<=", total_qty],
-                "max_qty": [">=", total_qty],
-                "min_amt": ["<=", total_amount],
-                "max_amt": [">=", total_amount]
-            },
-            order_by="auto desc, discount_percentage desc, title asc"
+        index = offer_index.get_offer_index(
+            invoice_data.get("company"),
+            invoice_data.get("pos_profile"),
+            invoice_data.get("set_warehouse"),
+            invoice_data.get("posting_date") or nowdate(),
         )
-
-        # Check applicable offers
-        applicable = []
-        for offer in offers:
-            if check_offer_applicable_for_data(offer, invoice_data, total_qty):
-                applicable.append(offer)
-
-        return applicable
+        return offer_index.match_offers(
+            index, invoice_data.get("items", []), invoice_data.get("customer"))
 
     except Exception:
         # Graceful degradation - return empty list (no logging needed)
@@ -465,13 +466,47 @@ def check_customer_group_match(offer, invoice_data):
         return False
 
     try:
-        customer_group = frappe.get_value(
-            "Customer", invoice_data.get("customer"), "customer_group")
-        return customer_group == offer.customer_group
+        attributes = customer_attributes.get_customer_attributes(invoice_data.get("customer"))
+        return attributes.customer_group == offer.customer_group
     except:
         return False
 
 
+def apply_offer_solution(offers, solution, invoice_data):
+    """
+    Write an offer_solver solution to invoice data: line discount_percentage,
+    additional_discount_percentage and posa_offers records.
+
+    Returns:
+        list: Applied offers (in offer order)
+    """
+    used = set(solution["transaction_offers"])
+    for item, line in zip(invoice_data.get("items", []), solution["lines"]):
+        if line["offers"]:
+            item["discount_percentage"] = flt(line["discount_percentage"])
+            used.update(line["offers"])
+
+    if solution["transaction_offers"]:
+        invoice_data["additional_discount_percentage"] = flt(
+            solution["additional_discount_percentage"])
+
+    applied = [offer for offer in offers if offer.get("name") in used]
+    if applied:
+        if not invoice_data.get("posa_offers"):
+            invoice_data["posa_offers"] = []
+        for offer in applied:
+            offer_type = offer.get("offer_type")
+            invoice_data["posa_offers"].append({
+                "offer_name": offer.get("name"),
+                "offer_type": offer_type,
+                "discount_percentage": offer.get("discount_percentage"),
+                # Same row_id as apply_discount_percentage_on_*: the targeted value
+                "row_id": offer.get(offer_type) if offer_type in offer_solver.ITEM_OFFER_TYPES else ""
+            })
+
+    return applied
+
+
 def apply_offer_by_type(offer, invoice_data):
     """Route offer to appropriate discount application function by type"""
     try:
@@ -17,7 +17,11 @@ const API_MAP = {
 		GET_DRAFTS: 'posawesome.api.sales_invoice.get_draft_invoices',
 		GET_PRINT_INVOICES: 'posawesome.api.sales_invoice.get_print_invoices',
 		GET_SETTLEMENT_INVOICES: 'posawesome.api.sales_invoice.get_settlement_invoices',
+		GET_SETTLEMENT_INVOICES_COUNT: 'posawesome.api.sales_invoice.get_settlement_invoices_count',
 		CREATE_PAYMENT_ENTRY: 'posawesome.api.sales_invoice.create_payment_entry_for_invoice',
+		SUBMIT_INVOICE_ASYNC: 'posawesome.api.sales_invoice.submit_invoice_async',
+		GET_INVOICE_SUBMIT_STATUS: 'posawesome.api.sales_invoice.get_invoice_submit_status',
+		SYNC_OFFLINE_INVOICES: 'posawesome.api.sales_invoice.sync_offline_invoices',
 	},
 
 	// Customer APIs (from Customer.vue, UpdateCustomer.vue, Payments.vue, NewAddress.vue)
@@ -42,8 +46,11 @@ const API_MAP = {
 	// Item APIs (from ItemsSelector.vue, Invoice.vue)
 	ITEM: {
 		GET_ITEMS: 'posawesome.api.item.get_items',
+		SEARCH_ITEMS: 'posawesome.api.item.search_items',
+		GET_ITEMS_DELTA: 'posawesome.api.item.get_items_delta',
 		GET_ITEMS_GROUPS: 'posawesome.api.item.get_items_groups',
 		GET_BARCODE_ITEM: 'posawesome.api.item.get_barcode_item',
+		GET_BARCODE_ITEMS: 'posawesome.api.item.get_barcode_items',
 		PROCESS_BATCH_SELECTION: 'posawesome.api.item.process_batch_selection',
 	},
 
@@ -54,6 +61,7 @@ const API_MAP = {
 		GET_OFFERS_FOR_PROFILE:
 			'posawesome.posawesome.doctype.pos_offer.pos_offer.get_offers_for_profile',
 		APPLY_OFFERS_TO_INVOICE: 'posawesome.posawesome.doctype.pos_offer.pos_offer.get_offers',
+		GET_OFFERS_DELTA: 'posawesome.posawesome.doctype.pos_offer.pos_offer.get_offers_delta',
 	},
 
 	// POS Opening Shift APIs (from OpeningDialog.vue, Pos.vue, Navbar.vue)
@@ -102,6 +110,8 @@ const API_MAP = {
 		CREATE_PAYMENT_ENTRY: 'posawesome.api.payment_entry.create_payment_entry_for_invoice',
 		CREATE_MULTIPLE_PAYMENTS:
 			'posawesome.api.payment_entry.create_payment_entry_for_multiple_payments',
+		CREATE_PAYMENT_ENTRIES_FOR_INVOICES:
+			'posawesome.api.payment_entry.create_payment_entries_for_invoices',
 	},
 
 	// POS Awesome APIs
@@ -264,10 +264,26 @@ export default {
 			// Fetch initial totals
 			this.fetchPaymentTotals();
 
-			// Set up interval to update totals (every 10 seconds - optimized with backend caching)
+			// Totals are pushed over realtime (posa_payment_totals) - polling is only a slow fallback
 			this.cashUpdateInterval = setInterval(() => {
 				this.fetchPaymentTotals();
-			}, 10000); // 10 seconds (backend caches for 5 seconds, so this is optimal)
+			}, 60000); // 60 seconds (backend caches for 5 seconds - posa_payment_totals_cache_ttl)
+		},
+
+		// Realtime: totals pushed after an invoice / payment entry of this shift is submitted or cancelled
+		handlePaymentTotalsEvent(data) {
+			if (!data || !this.pos_opening_shift || data.pos_opening_shift !== this.pos_opening_shift.name) {
+				return;
+			}
+
+			if (data.cash_total === undefined) {
+				// Ledger not seeded yet - fetch the totals
+				this.fetchPaymentTotals();
+				return;
+			}
+
+			this.totalCash = parseFloat(data.cash_total || 0) || 0;
+			this.totalNonCash = parseFloat(data.non_cash_total || 0) || 0;
 		},
 
 		changePage(key) {
@@ -563,10 +579,10 @@ export default {
 			// Initial ping
 			this.measurePing();
 
-			// Ping every 2 seconds
+			// Ping every 10 seconds (browser online/offline events give immediate connection changes)
 			this.pingInterval = setInterval(() => {
 				this.measurePing();
-			}, 2000);
+			}, 10000);
 		},
 		stopPingMonitoring() {
 			if (this.pingInterval) {
@@ -590,24 +606,8 @@ export default {
 					shift_name: shiftName,
 				},
 				callback: (r) => {
-				if (r.message && !r.message.is_open) {
-					// Specific shift is closed - reload page and clear cache
-					this.show_mesage({
-						color: 'error',
-							text: 'تم إغلاق الوردية. سيتم إعادة تحميل الصفحة...',
-						});
-
-						// Stop monitoring to prevent multiple reloads
-						this.stopShiftMonitoring();
-						this.stopPingMonitoring();
-
-						setTimeout(() => {
-							if (window.clearCacheAndReload) {
-								window.clearCacheAndReload();
-							} else {
-								location.reload();
-							}
-						}, 2000);
+					if (r.message && !r.message.is_open) {
+						this.handleShiftClosed();
 					}
 				},
 				error: () => {
@@ -619,6 +619,38 @@ export default {
 			});
 		},
 
+		// Specific shift is closed - reload page and clear cache
+		handleShiftClosed() {
+			if (this._shiftClosedHandled) {
+				return;
+			}
+			this._shiftClosedHandled = true;
+
+			this.show_mesage({
+				color: 'error',
+				text: 'تم إغلاق الوردية. سيتم إعادة تحميل الصفحة...',
+			});
+
+			// Stop monitoring to prevent multiple reloads
+			this.stopShiftMonitoring();
+			this.stopPingMonitoring();
+
+			setTimeout(() => {
+				if (window.clearCacheAndReload) {
+					window.clearCacheAndReload();
+				} else {
+					location.reload();
+				}
+			}, 2000);
+		},
+
+		// Realtime: posa_shift_closed is published by POS Closing Shift on_submit
+		handleShiftClosedEvent(data) {
+			if (data && this.pos_opening_shift && data.pos_opening_shift === this.pos_opening_shift.name) {
+				this.handleShiftClosed();
+			}
+		},
+
 		startShiftMonitoring() {
 			if (this.shiftMonitoringInterval) {
 				return;
@@ -631,10 +663,10 @@ export default {
 			// Check immediately
 			this.checkShiftStatusSimple();
 
-			// Check every 2 seconds (independent from ping)
+			// Shift closing is pushed over realtime (posa_shift_closed) - polling is only a slow fallback
 			this.shiftMonitoringInterval = setInterval(() => {
 				this.checkShiftStatusSimple();
-			}, 2000);
+			}, 30000);
 		},
 
 		stopShiftMonitoring() {
@@ -716,6 +748,12 @@ export default {
 				window.addEventListener('online', this.handleOnline);
 				window.addEventListener('offline', this.handleOffline);
 
+				// Realtime push from the server (shift closed, payment totals changed)
+				if (frappe.realtime) {
+					frappe.realtime.on('posa_shift_closed', this.handleShiftClosedEvent);
+					frappe.realtime.on('posa_payment_totals', this.handlePaymentTotalsEvent);
+				}
+
 				evntBus.on('show_mesage', (data) => {
 					this.show_mesage(data);
 				});
@@ -812,6 +850,12 @@ export default {
 			window.removeEventListener('offline', this.handleOffline);
 		}
 
+		// Clean up realtime subscriptions
+		if (frappe.realtime) {
+			frappe.realtime.off('posa_shift_closed', this.handleShiftClosedEvent);
+			frappe.realtime.off('posa_payment_totals', this.handlePaymentTotalsEvent);
+		}
+
 		// Clean up payment totals interval
 		if (this.cashUpdateInterval) {
 			clearInterval(this.cashUpdateInterval);
@@ -3,6 +3,12 @@ import { evntBus } from '../../bus';
 import format from '../../format';
 import Customer from './Customer.vue';
 import { API_MAP } from '../../api_mapper.js';
+import {
+	queueOfflineInvoice,
+	syncOfflineInvoices,
+	newClientUuid,
+	isNetworkFailure,
+} from '../../offline_invoices.js';
 
 const UI_CONFIG = {
 	SEARCH_MIN_LENGTH: 3,
@@ -64,6 +70,9 @@ export default {
 
 			isUpdatingTotals: false,
 			isPrinting: false, // Flag to prevent double-click on print button
+			// Background submission (POS Profile posa_async_invoice_submit): client_uuid -> { name }
+			pendingAsyncInvoices: {},
+			asyncPollTimer: null,
 			// Simple State Management
 			_itemOperationTimer: null,
 			_updatingFromAPI: false,
@@ -2746,6 +2755,25 @@ export default {
 				? `Updating draft: ${doc.name}`
 			: 'Creating new invoice';
 
+			// Idempotency key shared by every attempt of this invoice (online, background
+			// or offline replay), so the server never books it twice
+			if (!this.invoice_doc.posa_client_uuid) {
+				this.invoice_doc.posa_client_uuid = newClientUuid();
+			}
+			doc.posa_client_uuid = this.invoice_doc.posa_client_uuid;
+
+			// Branch link down (fast path - requests that get no response are captured too)
+			if (!navigator.onLine && this.pos_profile?.posa_allow_offline_invoices) {
+				this.captureOfflineInvoice(doc);
+				return;
+			}
+
+			// Background submission: accepted immediately, printed once submitted
+			if (this.pos_profile?.posa_async_invoice_submit) {
+				this.submitInvoiceAsync(doc);
+				return;
+			}
+
 			// Send to server for update + submit (if draft exists) or insert + submit (if new)
 			frappe.call({
 				method: 'posawesome.api.sales_invoice.create_and_submit_invoice',
@@ -2757,29 +2785,7 @@ export default {
 					this.isPrinting = false; // Re-enable print button
 
 					if (r.message?.name) {
-						const print_format = this.pos_profile?.posa_print_format;
-						const invoiceName = r.message.name;
-
-						// Wait for QR if required by POS Profile flag
-						let qrReady = true;
-						if (this.pos_profile?.posa_print_after_qr_ready) {
-							qrReady = await this.waitForQrCode(invoiceName);
-						}
-
-						if (!qrReady) {
-							evntBus.emit('show_mesage', {
-								text: 'لم يتم توليد رمز QR بعد، سيتم الطباعة بدون الرمز.',
-								color: 'warning',
-							});
-						}
-
-						// Open print window
-						const print_url = frappe.urllib.get_full_url(
-							`/printview?doctype=Sales%20Invoice&name=${invoiceName}&format=${print_format}&trigger_print=1&no_letterhead=0`,
-						);
-						window.open(print_url);
-
-						evntBus.emit('set_last_invoice', invoiceName);
+						await this.openInvoicePrint(r.message.name);
 
 						// Emit event to clear return invoice highlighting
 						evntBus.emit('invoice_submitted');
@@ -2802,7 +2808,98 @@ export default {
 						});
 					}
 				},
-				error: (err) => {
+				error: (err, textStatus) => {
+					// No response from the server: keep the invoice on the till (same client_uuid)
+					if (isNetworkFailure(err, textStatus) && this.pos_profile?.posa_allow_offline_invoices) {
+						this.captureOfflineInvoice(doc);
+						return;
+					}
+
+					evntBus.emit('hide_loading');
+					this.isPrinting = false; // Re-enable print button on error
+					evntBus.emit('show_mesage', {
+						text: err?.message || 'Failed to submit',
+						color: 'error',
+					});
+				},
+			});
+		},
+
+		// Open print window of a submitted invoice (waits for QR if required by POS Profile)
+		async openInvoicePrint(invoiceName) {
+			const print_format = this.pos_profile?.posa_print_format;
+
+			// Wait for QR if required by POS Profile flag
+			let qrReady = true;
+			if (this.pos_profile?.posa_print_after_qr_ready) {
+				qrReady = await this.waitForQrCode(invoiceName);
+			}
+
+			if (!qrReady) {
+				evntBus.emit('show_mesage', {
+					text: 'لم يتم توليد رمز QR بعد، سيتم الطباعة بدون الرمز.',
+					color: 'warning',
+				});
+			}
+
+			// Open print window
+			const print_url = frappe.urllib.get_full_url(
+				`/printview?doctype=Sales%20Invoice&name=${invoiceName}&format=${print_format}&trigger_print=1&no_letterhead=0`,
+			);
+			window.open(print_url);
+
+			evntBus.emit('set_last_invoice', invoiceName);
+		},
+
+		// ===== BACKGROUND SUBMISSION =====
+		// Invoice is accepted (draft + idempotency key) and the till is freed immediately;
+		// the worker submits it and the print window opens on the realtime event
+		// (or polling fallback). Retries reuse the same client_uuid - never a duplicate.
+		submitInvoiceAsync(doc) {
+			const client_uuid = doc.posa_client_uuid;
+
+			frappe.call({
+				method: API_MAP.SALES_INVOICE.SUBMIT_INVOICE_ASYNC,
+				args: {
+					invoice_doc: doc,
+					client_uuid: client_uuid,
+				},
+				callback: (r) => {
+					evntBus.emit('hide_loading');
+					this.isPrinting = false; // Re-enable print button
+
+					if (!r.message?.name) {
+						evntBus.emit('show_mesage', {
+							// Submit failed
+							text: 'فشل الإرسال',
+							color: 'error',
+						});
+						return;
+					}
+
+					this.pendingAsyncInvoices[client_uuid] = { name: r.message.name };
+					this.handleInvoiceSubmitStatus(r.message);
+					this.startAsyncInvoicePolling();
+
+					evntBus.emit('show_mesage', {
+						// Invoice accepted, submitting in background
+						text: `تم استلام الفاتورة ${r.message.name}، جاري الترحيل`,
+						color: 'info',
+					});
+
+					// Free the till: same steps as a synchronous submission
+					evntBus.emit('invoice_submitted');
+					this.reset_invoice_session();
+					evntBus.emit('show_payment', 'false');
+					evntBus.emit('clear_search_fields');
+				},
+				error: (err, textStatus) => {
+					// No response from the server: keep the invoice on the till (same client_uuid)
+					if (isNetworkFailure(err, textStatus) && this.pos_profile?.posa_allow_offline_invoices) {
+						this.captureOfflineInvoice(doc);
+						return;
+					}
+
 					evntBus.emit('hide_loading');
 					this.isPrinting = false; // Re-enable print button on error
 					evntBus.emit('show_mesage', {
@@ -2813,6 +2910,85 @@ export default {
 			});
 		},
 
+		// ===== OFFLINE INVOICES =====
+		captureOfflineInvoice(doc) {
+			queueOfflineInvoice(doc);
+
+			evntBus.emit('hide_loading');
+			this.isPrinting = false;
+			evntBus.emit('show_mesage', {
+				// No connection - invoice saved on this device, synced when the connection is back
+				text: 'لا يوجد اتصال - تم حفظ الفاتورة على الجهاز وسيتم ترحيلها عند عودة الاتصال',
+				color: 'warning',
+			});
+
+			// Free the till: same steps as a synchronous submission
+			evntBus.emit('invoice_submitted');
+			this.reset_invoice_session();
+			evntBus.emit('show_payment', 'false');
+			evntBus.emit('clear_search_fields');
+		},
+
+		async syncOfflineQueue() {
+			const { synced, failed } = await syncOfflineInvoices();
+			if (synced) {
+				evntBus.emit('show_mesage', {
+					// Offline invoices synced
+					text: `تم ترحيل ${synced} فاتورة محفوظة على الجهاز`,
+					color: 'success',
+				});
+			}
+			if (failed) {
+				evntBus.emit('show_mesage', {
+					// Offline invoices failed
+					text: `فشل ترحيل ${failed} فاتورة محفوظة على الجهاز`,
+					color: 'error',
+				});
+			}
+		},
+
+		// Realtime "posa_invoice_submit_status" / polling result
+		handleInvoiceSubmitStatus(data) {
+			if (!data?.client_uuid || !this.pendingAsyncInvoices[data.client_uuid]) {
+				return;
+			}
+
+			if (data.status === 'Submitted') {
+				delete this.pendingAsyncInvoices[data.client_uuid];
+				this.openInvoicePrint(data.name);
+			} else if (data.status === 'Failed') {
+				delete this.pendingAsyncInvoices[data.client_uuid];
+				evntBus.emit('show_mesage', {
+					// Background submission failed - invoice kept as draft
+					text: `فشل ترحيل الفاتورة ${data.name}: ${data.error || ''}`,
+					color: 'error',
+				});
+			}
+		},
+
+		startAsyncInvoicePolling() {
+			if (this.asyncPollTimer) {
+				return;
+			}
+			this.asyncPollTimer = setInterval(async () => {
+				const client_uuids = Object.keys(this.pendingAsyncInvoices);
+				if (!client_uuids.length) {
+					clearInterval(this.asyncPollTimer);
+					this.asyncPollTimer = null;
+					return;
+				}
+				try {
+					const r = await frappe.call({
+						method: API_MAP.SALES_INVOICE.GET_INVOICE_SUBMIT_STATUS,
+						args: { client_uuids: client_uuids },
+					});
+					(r.message || []).forEach((row) => this.handleInvoiceSubmitStatus(row));
+				} catch (error) {
+					// Keep polling - realtime may still deliver the status
+				}
+			}, 3000);
+		},
+
 		// Wait for QR code to be generated before printing (if enabled)
 		async waitForQrCode(invoiceName) {
 			const shouldWait = this.pos_profile?.posa_print_after_qr_ready;
@@ -3209,12 +3385,31 @@ export default {
 
 		this.scheduleScrollHeightUpdate();
 		window.addEventListener('resize', this.scheduleScrollHeightUpdate);
+
+		// Background submission status (sales_invoice.process_async_invoice)
+		if (frappe.realtime) {
+			frappe.realtime.on('posa_invoice_submit_status', this.handleInvoiceSubmitStatus);
+		}
+
+		// Offline invoices: sync what is left from a previous session and on reconnect
+		window.addEventListener('online', this.syncOfflineQueue);
+		this.syncOfflineQueue();
 	},
 	beforeUnmount() {
 		// Clean up ALL event listeners to prevent memory leaks
 
-		// Remove window listener
+		// Remove window listeners
 		window.removeEventListener('resize', this.scheduleScrollHeightUpdate);
+		window.removeEventListener('online', this.syncOfflineQueue);
+
+		// Background submission status listener and polling
+		if (frappe.realtime) {
+			frappe.realtime.off('posa_invoice_submit_status', this.handleInvoiceSubmitStatus);
+		}
+		if (this.asyncPollTimer) {
+			clearInterval(this.asyncPollTimer);
+			this.asyncPollTimer = null;
+		}
 		// Clean up document event listeners using stored bound functions
 		document.removeEventListener('keydown', this._boundShortOpenPayment);
 		document.removeEventListener('keydown', this._boundShortDeleteFirstItem);
@@ -19,7 +19,10 @@ export default {
 			settlementDialog: false,
 			selected: null,
 			dialog_data: [],
+			next_cursor: null,
+			total_count: 0,
 			isLoading: false,
+			isLoadingMore: false,
 			pos_profile: null,
 			pos_opening_shift: null,
 		};
@@ -49,33 +52,69 @@ export default {
 
 	// ===== METHODS =====
 	methods: {
+		settlementArgs() {
+			return {
+				pos_profile: this.pos_profile?.name || null,
+				pos_opening_shift: this.pos_opening_shift?.name || null,
+				user: frappe.session.user,
+			};
+		},
+
 		async fetchSettlementInvoices() {
 			try {
 				this.isLoading = true;
+				this.next_cursor = null;
+				this.total_count = 0;
+
+				const [response, countResponse] = await Promise.all([
+					frappe.call({
+						method: API_MAP.SALES_INVOICE.GET_SETTLEMENT_INVOICES,
+						args: this.settlementArgs(),
+					}),
+					frappe.call({
+						method: API_MAP.SALES_INVOICE.GET_SETTLEMENT_INVOICES_COUNT,
+						args: this.settlementArgs(),
+					}),
+				]);
+
+				this.dialog_data = response.message?.invoices || [];
+				this.next_cursor = response.message?.next_cursor || null;
+				this.total_count = countResponse.message || this.dialog_data.length;
+			} catch (error) {
+				console.error('[OutstandingPayments.js] fetch_settlement_invoices_failed');
+				evntBus.emit(EVENT_NAMES.SHOW_MESSAGE, {
+					text: 'فشل جلب الفواتير غير المسددة',
+					color: 'error',
+				});
+				this.dialog_data = [];
+			} finally {
+				this.isLoading = false;
+			}
+		},
+
+		// Next keyset page (cursor over creation, name)
+		async loadMoreSettlementInvoices() {
+			if (!this.next_cursor || this.isLoadingMore) {
+				return;
+			}
+			try {
+				this.isLoadingMore = true;
 
 				const response = await frappe.call({
 					method: API_MAP.SALES_INVOICE.GET_SETTLEMENT_INVOICES,
-					args: {
-						pos_profile: this.pos_profile?.name || null,
-						pos_opening_shift: this.pos_opening_shift?.name || null,
-						user: frappe.session.user,
-					},
+					args: { ...this.settlementArgs(), cursor: this.next_cursor },
 				});
 
-			if (response.message) {
-				this.dialog_data = response.message;
-			} else {
-				this.dialog_data = [];
-			}
-		} catch (error) {
-			console.error('[OutstandingPayments.js] fetch_settlement_invoices_failed');
-			evntBus.emit(EVENT_NAMES.SHOW_MESSAGE, {
-				text: 'فشل جلب الفواتير غير المسددة',
+				this.dialog_data = this.dialog_data.concat(response.message?.invoices || []);
+				this.next_cursor = response.message?.next_cursor || null;
+			} catch (error) {
+				console.error('[OutstandingPayments.js] load_more_settlement_invoices_failed');
+				evntBus.emit(EVENT_NAMES.SHOW_MESSAGE, {
+					text: 'فشل جلب الفواتير غير المسددة',
 					color: 'error',
 				});
-				this.dialog_data = [];
 			} finally {
-				this.isLoading = false;
+				this.isLoadingMore = false;
 			}
 		},
 
@@ -0,0 +1,115 @@
+// ===== OFFLINE INVOICES =====
+// Invoices captured while the branch link is down are kept in localStorage with a
+// client UUID and replayed in order by sales_invoice.sync_offline_invoices once the
+// browser is back online. The server dedupes on the UUID, so re-sending a chunk whose
+// response was lost never creates a duplicate.
+import { API_MAP } from './api_mapper.js';
+
+const STORAGE_KEY = 'posa_offline_invoices';
+// Same as MAX_OFFLINE_SYNC_BATCH in sales_invoice.py
+const SYNC_BATCH_SIZE = 100;
+
+let syncing = false;
+
+function readQueue() {
+	try {
+		return JSON.parse(localStorage.getItem(STORAGE_KEY) || '[]');
+	} catch (error) {
+		console.error('[offline_invoices.js] read_queue_failed');
+		return [];
+	}
+}
+
+function writeQueue(queue) {
+	localStorage.setItem(STORAGE_KEY, JSON.stringify(queue));
+}
+
+export function newClientUuid() {
+	return window.crypto?.randomUUID ? window.crypto.randomUUID() : frappe.utils.get_random(32);
+}
+
+// frappe.call error callback args of a request that never got a response
+// (link down, request aborted, timeout) - as opposed to a server-side error
+export function isNetworkFailure(xhr, textStatus) {
+	return !xhr || !xhr.status || textStatus === 'timeout';
+}
+
+// Keep an invoice for later sync, returns its client UUID
+export function queueOfflineInvoice(doc) {
+	const client_uuid = doc.posa_client_uuid || newClientUuid();
+	const queue = readQueue();
+	queue.push({
+		client_uuid: client_uuid,
+		invoice_doc: { ...doc, posa_client_uuid: client_uuid, __islocal: 1 },
+		failed: false,
+		error: null,
+	});
+	writeQueue(queue);
+	return client_uuid;
+}
+
+export function pendingOfflineInvoices() {
+	return readQueue().filter((entry) => !entry.failed).length;
+}
+
+// Replay the queue in chunks, oldest first. Submitted / duplicate invoices are
+// removed; failed ones stay flagged with their error (not retried automatically).
+// Returns { synced, failed }.
+export async function syncOfflineInvoices() {
+	if (syncing || !navigator.onLine) {
+		return { synced: 0, failed: 0 };
+	}
+
+	syncing = true;
+	let synced = 0;
+	let failed = 0;
+	try {
+		let pending = readQueue().filter((entry) => !entry.failed);
+		while (pending.length) {
+			const batch = pending.slice(0, SYNC_BATCH_SIZE);
+			const r = await frappe.call({
+				method: API_MAP.SALES_INVOICE.SYNC_OFFLINE_INVOICES,
+				args: {
+					invoices: batch.map((entry) => ({
+						client_uuid: entry.client_uuid,
+						invoice_doc: entry.invoice_doc,
+					})),
+				},
+			});
+
+			const results = {};
+			(r.message || []).forEach((result) => {
+				results[result.client_uuid] = result;
+			});
+
+			// Re-read: invoices may have been queued while the request was running
+			const queue = readQueue().filter((entry) => {
+				const result = results[entry.client_uuid];
+				if (!result) {
+					return true;
+				}
+				if (result.status === 'Failed') {
+					entry.failed = true;
+					entry.error = result.error;
+					failed += 1;
+					return true;
+				}
+				synced += 1;
+				return false;
+			});
+			writeQueue(queue);
+
+			if (!r.message?.length) {
+				break;
+			}
+			pending = queue.filter((entry) => !entry.failed);
+		}
+	} catch (error) {
+		// Link dropped again - the remaining invoices stay queued
+		console.error('[offline_invoices.js] sync_offline_invoices_failed');
+	} finally {
+		syncing = false;
+	}
+
+	return { synced, failed };
+}
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+from posawesome.api import item
+
+
+PROFILE = {
+    "name": "_Test POSA Barcode Profile",
+    # Scale: "21" + 5 digit item code + 5 digit value (13 digits)
+    "posa_enable_scale_barcode": 1,
+    "posa_scale_barcode_start": "21",
+    "posa_scale_barcode_lenth": 13,
+    "posa_scale_item_code_length": 5,
+    "posa_weight_length": 5,
+    # Private: "2" or "2100" + 6 digit item code (13 digits)
+    "posa_enable_private_barcode": 1,
+    "posa_private_barcode_prefixes": "2, 2100",
+    "posa_private_barcode_lenth": 13,
+    "posa_private_item_code_length": 6,
+}
+
+
+def _rule(table, barcode, rule_type):
+    return next(r for r in item.match_barcode_rules(table, barcode) if r["type"] == rule_type)
+
+
+class TestBarcodeRules(unittest.TestCase):
+    def setUp(self):
+        self.table = item._compile_barcode_rules(PROFILE)
+
+    def test_rules_dispatch_by_length_then_longest_prefix(self):
+        rules = item.match_barcode_rules(self.table, "2100012345678")
+        self.assertEqual([(r["type"], r["prefix"]) for r in rules],
+                         [("private", "2100"), ("scale", "21"), ("private", "2")])
+
+    def test_no_rule_for_other_lengths_or_prefixes(self):
+        self.assertEqual(item.match_barcode_rules(self.table, "210001234567"), [])
+        self.assertEqual(item.match_barcode_rules(self.table, "9900012345678"), [])
+
+    def test_incomplete_settings_are_ignored(self):
+        profile = dict(PROFILE, posa_weight_length=0, posa_enable_private_barcode=0)
+        self.assertEqual(item._compile_barcode_rules(profile), {})
+
+    def test_scale_weight(self):
+        rule = _rule(self.table, "2112345012505", "scale")
+        item_part, value_part = item._parse_barcode_rule(rule, "2112345012505")
+        self.assertEqual((item_part, value_part), ("12345", "01250"))
+        # 1250 g -> 1.25 kg
+        self.assertEqual(item._embedded_qty(rule, value_part, {"rate": 10}), 1.25)
+
+    def test_scale_price(self):
+        table = item._compile_barcode_rules(dict(PROFILE, posa_scale_embedded_value="Price"))
+        rule = _rule(table, "2112345012505", "scale")
+        _item_part, value_part = item._parse_barcode_rule(rule, "2112345012505")
+        # 1250 minor units -> 12.50, at 5.00 per unit -> 2.5
+        self.assertEqual(item._embedded_qty(rule, value_part, {"rate": 5}), 2.5)
+        # No rate to divide by
+        self.assertEqual(item._embedded_qty(rule, value_part, {"rate": 0}), 1)
+
+    def test_private_barcode(self):
+        rule = _rule(self.table, "2100012345678", "private")
+        self.assertEqual(item._parse_barcode_rule(rule, "2100012345678"), ("012345", ""))
+        self.assertEqual(item._embedded_qty(rule, "", {"rate": 10}), 1)
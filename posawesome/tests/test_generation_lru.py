@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+from frappe.tests.utils import FrappeTestCase
+from posawesome.api.generation_lru import GenerationLRU
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe
+
+
+GENERATION_KEY = "posa_test_generation_lru"
+
+# The "database": name -> value
+ROWS = {"ACME Corp": "acme-value", "Bob": "bob-value"}
+
+
+class TestGenerationLRU(FrappeTestCase):
+    def setUp(self):
+        self.lru = GenerationLRU(GENERATION_KEY, size=2)
+        self.loads = []
+
+    def tearDown(self):
+        _pipe().delete(_key(GENERATION_KEY)).execute()
+
+    def _load(self, keys):
+        self.loads.append(sorted(keys))
+        wanted = {key.lower() for key in keys}
+        return {name: value for name, value in ROWS.items() if name.lower() in wanted}
+
+    def test_loads_only_missing_keys(self):
+        self.assertEqual(self.lru.get_many(["ACME Corp", "", None], self._load), {"ACME Corp": "acme-value"})
+        self.assertEqual(self.lru.get_many(["ACME Corp", "Bob"], self._load),
+                         {"ACME Corp": "acme-value", "Bob": "bob-value"})
+        self.assertEqual(self.loads, [["ACME Corp"], ["Bob"]])
+
+    def test_keys_match_case_insensitively(self):
+        self.assertEqual(self.lru.get_many(["acme corp"], self._load), {"acme corp": "acme-value"})
+        # Cached under the row, whatever the casing of the request
+        self.assertEqual(self.lru.get_many(["ACME CORP"], self._load), {"ACME CORP": "acme-value"})
+        self.assertEqual(len(self.loads), 1)
+
+    def test_unknown_keys_are_not_cached(self):
+        self.assertEqual(self.lru.get_many(["Nobody"], self._load), {})
+        self.lru.get_many(["Nobody"], self._load)
+        self.assertEqual(len(self.loads), 2)
+
+    def test_least_recently_used_is_evicted(self):
+        self.lru.get_many(["ACME Corp"], self._load)
+        self.lru.get_many(["Bob"], self._load)
+        self.lru.get_many(["ACME Corp"], self._load)
+        ROWS["Carol"] = "carol-value"
+        self.addCleanup(ROWS.pop, "Carol")
+        self.lru.get_many(["Carol"], self._load)
+
+        self.lru.get_many(["ACME Corp", "Bob"], self._load)
+        self.assertEqual(self.loads[-1], ["Bob"])
+
+    def test_generation_bump_drops_the_lru(self):
+        self.lru.get_many(["Bob"], self._load)
+        # Another worker invalidated (GenerationLRU.invalidate after commit)
+        self.lru._bump_generation()
+        self.lru.get_many(["Bob"], self._load)
+        self.assertEqual(self.loads, [["Bob"], ["Bob"]])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from erpnext.accounts.doctype.pos_profile.test_pos_profile import make_pos_profile
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from posawesome.api import sales_invoice, shift_totals
+
+
+class TestInvoiceSubmission(FrappeTestCase):
+    def setUp(self):
+        self.pos_profile = make_pos_profile()
+        make_stock_entry(item_code="_Test Item", target="_Test Warehouse - _TC", qty=10, basic_rate=100)
+
+    def _invoice_doc(self):
+        invoice = create_sales_invoice(qty=1, rate=100, do_not_save=True)
+        invoice.pos_profile = self.pos_profile.name
+        invoice.append("payments", {"mode_of_payment": "Cash", "account": "Cash - _TC", "amount": 100})
+        return invoice.as_dict(convert_dates_to_str=True)
+
+    def _invoices(self, client_uuid):
+        return frappe.get_all("Sales Invoice", filters={"posa_client_uuid": client_uuid}, pluck="name")
+
+    def test_async_retry_returns_the_same_invoice(self):
+        client_uuid = frappe.generate_hash()
+        first = sales_invoice.submit_invoice_async(self._invoice_doc(), client_uuid)
+        retry = sales_invoice.submit_invoice_async(self._invoice_doc(), client_uuid)
+
+        self.assertEqual(first["status"], "Queued")
+        self.assertEqual(retry["name"], first["name"])
+        self.assertEqual(self._invoices(client_uuid), [first["name"]])
+
+    def test_async_retry_requeues_a_failed_invoice(self):
+        client_uuid = frappe.generate_hash()
+        first = sales_invoice.submit_invoice_async(self._invoice_doc(), client_uuid)
+        frappe.db.set_value("Sales Invoice", first["name"], {
+            "posa_submit_status": "Failed",
+            "posa_submit_error": "Insufficient stock",
+        })
+
+        retry = sales_invoice.submit_invoice_async(self._invoice_doc(), client_uuid)
+        self.assertEqual((retry["name"], retry["status"], retry["error"]), (first["name"], "Queued", None))
+        self.assertEqual(self._invoices(client_uuid), [first["name"]])
+
+    def test_async_retry_into_a_closed_shift_is_refused(self):
+        client_uuid = frappe.generate_hash()
+        first = sales_invoice.submit_invoice_async(self._invoice_doc(), client_uuid)
+        frappe.db.set_value("Sales Invoice", first["name"], {
+            "posa_submit_status": "Failed",
+            "posa_pos_opening_shift": "_Test POSA Closed Shift",
+        })
+
+        self.assertRaises(frappe.ValidationError,
+                          sales_invoice.submit_invoice_async, self._invoice_doc(), client_uuid)
+        self.assertEqual(
+            frappe.db.get_value("Sales Invoice", first["name"], "posa_submit_status"), "Failed")
+
+    def test_offline_sync_retry_is_a_duplicate(self):
+        client_uuid = frappe.generate_hash()
+        batch = [{"client_uuid": client_uuid, "invoice_doc": self._invoice_doc()}]
+
+        first = sales_invoice.sync_offline_invoices(batch)[0]
+        self.assertEqual(first["status"], "Submitted", first["error"])
+
+        # Response lost: the till sends the same batch again
+        retry = sales_invoice.sync_offline_invoices(batch)[0]
+        self.assertEqual((retry["status"], retry["name"]), ("Duplicate", first["name"]))
+        self.assertEqual(self._invoices(client_uuid), [first["name"]])
+
+    def test_offline_sync_same_key_twice_in_a_batch(self):
+        client_uuid = frappe.generate_hash()
+        entry = {"client_uuid": client_uuid, "invoice_doc": self._invoice_doc()}
+
+        results = sales_invoice.sync_offline_invoices([entry, entry])
+        self.assertEqual([r["status"] for r in results], ["Submitted", "Duplicate"], results)
+        self.assertEqual(results[1]["name"], results[0]["name"])
+        self.assertEqual(len(self._invoices(client_uuid)), 1)
+
+    def test_offline_sync_failure_discards_queued_deltas(self):
+        def submit(doc):
+            # on_submit hooks ran, then the submission failed
+            shift_totals._queue_deltas("_Test POSA Shift", {"Cash": 100})
+            frappe.throw("Submission failed")
+
+        client_uuid = frappe.generate_hash()
+        with patch.object(sales_invoice, "_submit_pos_invoice", side_effect=submit):
+            result = sales_invoice.sync_offline_invoices(
+                [{"client_uuid": client_uuid, "invoice_doc": self._invoice_doc()}])[0]
+
+        self.assertEqual(result["status"], "Failed")
+        self.assertIsNone(frappe.flags.get("posa_shift_totals_pending"))
+        self.assertEqual(self._invoices(client_uuid), [])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import json
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from posawesome.api import item_index
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe
+
+
+# Made-up trigrams no real item contains
+ITEMS = [
+    # Contains the search value
+    ("_Test POSA Index A", "Cable qzxwv", []),
+    # Has every trigram of the search value (qzx, zxw) without containing it
+    ("_Test POSA Index B", "Cable qzx zxw", []),
+    # Only found through its barcode
+    ("_Test POSA Index C", "Adapter", ["posa9qzxw1"]),
+]
+
+
+class TestItemIndex(FrappeTestCase):
+    def setUp(self):
+        self.created_meta = not item_index._index_exists()
+        if self.created_meta:
+            _pipe().set(_key(item_index.META_KEY), json.dumps({"built_at": "test"})).execute()
+
+        for name, item_name, barcodes in ITEMS:
+            item_index._add_item(frappe._dict(name=name, item_name=item_name, item_group="Products"), barcodes)
+
+    def tearDown(self):
+        for name, _item_name, _barcodes in ITEMS:
+            item_index._remove_item(name)
+        if self.created_meta:
+            _pipe().delete(_key(item_index.META_KEY)).execute()
+
+    def test_trigrams(self):
+        self.assertEqual(item_index._trigrams("abcd"), {"abc", "bcd"})
+        self.assertEqual(item_index._trigrams("ab"), set())
+
+    def test_candidates_are_a_superset(self):
+        item_codes, exact_barcode_item = item_index._candidate_codes("qzxw", "qzxw")
+        self.assertIn("_Test POSA Index A", item_codes)
+        self.assertIn("_Test POSA Index B", item_codes)
+        self.assertIsNone(exact_barcode_item)
+
+    def test_candidates_are_verified(self):
+        self.assertEqual(
+            item_index.match_codes("QZXW"),
+            ["_Test POSA Index A", "_Test POSA Index C"],
+        )
+
+    def test_exact_barcode(self):
+        self.assertEqual(item_index.match_codes("posa9qzxw1"), ["_Test POSA Index C"])
+        self.assertEqual(item_index.resolve_codes(["posa9qzxw1"]), {"posa9qzxw1": "_Test POSA Index C"})
+
+    def test_removed_item_is_not_matched(self):
+        item_index._remove_item("_Test POSA Index A")
+        self.assertEqual(item_index.match_codes("qzxwv"), [])
+
+    def test_too_broad_search_falls_back(self):
+        with patch.object(item_index, "CANDIDATE_LIMIT", 1):
+            self.assertIsNone(item_index.match_codes("qzxw"))
+            self.assertIsNone(item_index.search_items("qzxw", "Standard Selling", None))
+
+    def test_short_search_falls_back(self):
+        self.assertIsNone(item_index.match_codes("qz"))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from posawesome.api import item
+
+
+ITEM_GROUP = "_Test POSA Search Group"
+
+# item_code -> item_name (None is stored as NULL)
+ITEMS = {
+    "_Test POSA Search 1": "Same Name",
+    "_Test POSA Search 2": None,
+    "_Test POSA Search 3": "Same Name",
+    "_Test POSA Search 4": "Zeta",
+    "_Test POSA Search 5": None,
+    "_Test POSA Search 6": "Same Name",
+}
+
+# item_name ('' for NULL), then item_code
+EXPECTED_ORDER = [
+    "_Test POSA Search 2",
+    "_Test POSA Search 5",
+    "_Test POSA Search 1",
+    "_Test POSA Search 3",
+    "_Test POSA Search 6",
+    "_Test POSA Search 4",
+]
+
+PROFILE = {
+    "name": "_Test POSA Search Profile",
+    "selling_price_list": "Standard Selling",
+    "warehouse": "",
+    "posa_fetch_zero_qty": 1,
+}
+
+
+class TestItemSearch(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not frappe.db.exists("Item Group", ITEM_GROUP):
+            frappe.get_doc({
+                "doctype": "Item Group",
+                "item_group_name": ITEM_GROUP,
+                "parent_item_group": "All Item Groups",
+            }).insert()
+
+        for item_code, item_name in ITEMS.items():
+            if not frappe.db.exists("Item", item_code):
+                frappe.get_doc({
+                    "doctype": "Item",
+                    "item_code": item_code,
+                    "item_name": item_name or item_code,
+                    "item_group": ITEM_GROUP,
+                    "stock_uom": "Nos",
+                    "is_stock_item": 0,
+                }).insert()
+            frappe.db.set_value("Item", item_code, "item_name", item_name)
+
+    def _all_pages(self, page_length, search_value=""):
+        codes = []
+        cursor = None
+        while True:
+            page = item.search_items(PROFILE, search_value=search_value, item_group=ITEM_GROUP,
+                                     cursor=cursor, page_length=page_length)
+            self.assertLessEqual(len(page["items"]), page_length)
+            codes.extend(row.item_code for row in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return codes
+
+    def test_pages_with_ties_and_null_names(self):
+        for page_length in (1, 2, 4, 20):
+            self.assertEqual(self._all_pages(page_length), EXPECTED_ORDER)
+
+    def test_pages_of_a_search(self):
+        # Every item is a prefix match: same relevance, same order
+        self.assertEqual(self._all_pages(2, "_Test POSA Search"), EXPECTED_ORDER)
+
+    def test_exact_code_ranks_first(self):
+        page = item.search_items(PROFILE, search_value="_Test POSA Search 4", item_group=ITEM_GROUP)
+        self.assertEqual(page["items"][0].item_code, "_Test POSA Search 4")
+        self.assertNotIn("sort_name", page["items"][0])
+
+    def test_cursor_of_a_null_name(self):
+        cursor = item._encode_search_cursor(3, None, "_Test POSA Search 2")
+        self.assertEqual(tuple(item._decode_search_cursor(cursor)), (3, "", "_Test POSA Search 2"))
+        self.assertIsNone(item._decode_search_cursor("not a cursor"))
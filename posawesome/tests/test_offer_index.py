@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from posawesome.api import offer_index, offer_solver
+
+
+COMPANY = "_Test POSA Company"
+PROFILE = "_Test POSA Profile"
+WAREHOUSE = "_Test POSA Warehouse"
+SESSION = "_test_posa_cart"
+
+
+def _offer(name, percentage, stackable=0, offer_type=None, target=None):
+    offer = {
+        "name": name,
+        "title": name,
+        "offer_type": offer_type,
+        "discount_percentage": percentage,
+        "stackable": stackable,
+    }
+    if offer_type:
+        offer[offer_type] = target
+    return offer
+
+
+def _line(row_id, item_code, amount, item_group="Products"):
+    return {"posa_row_id": row_id, "item_code": item_code, "item_group": item_group,
+            "brand": None, "qty": 1, "rate": amount}
+
+
+class TestOfferCartSession(FrappeTestCase):
+    def setUp(self):
+        offer_solver._memo.clear()
+        self.offers = []
+        patcher = patch.object(offer_index, "get_offer_index",
+                               side_effect=lambda *args: offer_index.compile_offers(self.offers))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _delta(self, fingerprint=None, lines=None, removed=None, reset=False):
+        return offer_index.apply_cart_delta(
+            SESSION, COMPANY, PROFILE, WAREHOUSE,
+            fingerprint=fingerprint, lines=lines, removed=removed, reset=reset)
+
+    def _full_solution(self, lines):
+        # What get_offers() prices for the same cart
+        index = offer_index.compile_offers(self.offers)
+        return offer_solver.solve(lines, offer_index.match_offers(index, lines))
+
+    def test_delta_follows_the_cart_wide_transaction_rule(self):
+        self.offers = [
+            _offer("GT50", 50, offer_type="grand_total"),
+            _offer("A10", 10, offer_type="item_code", target="A"),
+        ]
+        lines = [_line("r1", "A", 100)]
+
+        result = self._delta(lines=lines, reset=True)
+        expected = self._full_solution(lines)
+
+        # The non stackable 50% transaction offer wins: no line discount on top
+        self.assertEqual(result["line_discounts"], {})
+        self.assertEqual(result["additional_discount_percentage"], 50)
+        self.assertEqual(result["additional_discount_percentage"],
+                         expected["additional_discount_percentage"])
+        self.assertEqual(result["transaction_offers"], expected["transaction_offers"])
+
+    def test_delta_line_discounts_change_with_the_transaction_choice(self):
+        self.offers = [
+            _offer("GT5", 5, offer_type="grand_total"),
+            _offer("A10", 10, offer_type="item_code", target="A"),
+        ]
+        result = self._delta(lines=[_line("r1", "A", 100)], reset=True)
+        self.assertEqual(result["line_discounts"], {"r1": 10})
+        self.assertEqual(result["additional_discount_percentage"], 0)
+
+        # A second line without item offer: 5% on the whole cart beats 10% on r1
+        result = self._delta(fingerprint=result["fingerprint"], lines=[_line("r2", "B", 1000)])
+        lines = [_line("r1", "A", 100), _line("r2", "B", 1000)]
+        expected = self._full_solution(lines)
+
+        self.assertEqual(result["line_discounts"], {"r1": 0})
+        self.assertEqual(result["additional_discount_percentage"], 5)
+        self.assertEqual(result["additional_discount_percentage"],
+                         expected["additional_discount_percentage"])
+
+    def test_offer_change_resyncs_sessions(self):
+        self.offers = [_offer("A10", 10, offer_type="item_code", target="A")]
+        result = self._delta(lines=[_line("r1", "A", 100)], reset=True)
+        self.assertEqual(result["line_discounts"], {"r1": 10})
+
+        # Edited offer, same name: neither added nor removed
+        self.offers = [_offer("A10", 20, offer_type="item_code", target="A")]
+        offer_index.invalidate()
+
+        result = self._delta(fingerprint=result["fingerprint"], lines=[_line("r2", "B", 50)])
+        self.assertEqual(result, {"resync": True})
+
+        result = self._delta(lines=[_line("r1", "A", 100), _line("r2", "B", 50)], reset=True)
+        self.assertEqual(result["line_discounts"], {"r1": 20})
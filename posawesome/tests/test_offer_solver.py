@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+from posawesome.api import offer_solver
+
+
+def _offer(name, percentage, stackable=0, offer_type=None, target=None):
+    offer = {
+        "name": name,
+        "offer_type": offer_type,
+        "discount_percentage": percentage,
+        "stackable": stackable,
+    }
+    if offer_type:
+        offer[offer_type] = target
+    return offer
+
+
+def _line(item_code, amount, item_group="Products", brand=None):
+    return {"item_code": item_code, "item_group": item_group, "brand": brand, "qty": 1, "rate": amount}
+
+
+class TestOfferSolver(unittest.TestCase):
+    def setUp(self):
+        offer_solver._memo.clear()
+
+    def test_best_single_offer_on_a_line(self):
+        solution = offer_solver.solve([_line("A", 100)], [
+            _offer("A10", 10, offer_type="item_code", target="A"),
+            _offer("G20", 20, offer_type="item_group", target="Products"),
+        ])
+        self.assertEqual(solution["lines"][0], {"discount_percentage": 20, "offers": ["G20"]})
+        self.assertEqual(solution["net_total"], 80)
+
+    def test_stackable_line_offers_compound(self):
+        solution = offer_solver.solve([_line("A", 100)], [
+            _offer("A10", 10, stackable=1, offer_type="item_code", target="A"),
+            _offer("G20", 20, stackable=1, offer_type="item_group", target="Products"),
+        ])
+        self.assertEqual(solution["lines"][0], {"discount_percentage": 28, "offers": ["A10", "G20"]})
+        self.assertEqual(solution["net_total"], 72)
+
+    def test_non_stackable_offer_beats_weaker_stack(self):
+        self.assertEqual(offer_solver.solve_offers([
+            _offer("S10", 10, stackable=1),
+            _offer("S10b", 10, stackable=1),
+            _offer("N25", 25),
+        ]), (25, ["N25"]))
+
+    def test_stackable_transaction_on_stackable_line_offers(self):
+        solution = offer_solver.solve([_line("A", 100)], [
+            _offer("A10", 10, stackable=1, offer_type="item_code", target="A"),
+            _offer("T10", 10, stackable=1, offer_type="grand_total"),
+        ])
+        self.assertEqual(solution["lines"][0]["offers"], ["A10"])
+        self.assertEqual(solution["transaction_offers"], ["T10"])
+        self.assertEqual(solution["net_total"], 81)
+
+    def test_non_stackable_transaction_excludes_line_offers(self):
+        solution = offer_solver.solve([_line("A", 100), _line("B", 100)], [
+            _offer("A10", 10, stackable=1, offer_type="item_code", target="A"),
+            _offer("T15", 15, offer_type="grand_total"),
+        ])
+        self.assertEqual(solution["transaction_offers"], ["T15"])
+        self.assertEqual([line["offers"] for line in solution["lines"]], [[], []])
+        self.assertEqual(solution["net_total"], 170)
+
+    def test_transaction_rule_is_cart_wide_item_offers_win(self):
+        # A line can't keep its non stackable offer while the others take the transaction discount:
+        # A at -50% alone (150) beats the transaction discount on the whole cart (160)
+        solution = offer_solver.solve([_line("A", 100), _line("B", 100)], [
+            _offer("A50", 50, offer_type="item_code", target="A"),
+            _offer("T20", 20, stackable=1, offer_type="grand_total"),
+        ])
+        self.assertEqual(solution["lines"][0]["offers"], ["A50"])
+        self.assertEqual(solution["additional_discount_percentage"], 0)
+        self.assertEqual(solution["net_total"], 150)
+
+    def test_transaction_rule_is_cart_wide_transaction_wins(self):
+        # The per line mix (A at -50%, B at -20% = 290) is not an option: the
+        # transaction discount (320) beats item offers alone (350) and drops A50
+        solution = offer_solver.solve([_line("A", 100), _line("B", 300)], [
+            _offer("A50", 50, offer_type="item_code", target="A"),
+            _offer("T20", 20, stackable=1, offer_type="grand_total"),
+        ])
+        self.assertEqual(solution["transaction_offers"], ["T20"])
+        self.assertEqual([line["offers"] for line in solution["lines"]], [[], []])
+        self.assertEqual(solution["net_total"], 320)
+
+    def test_tie_keeps_item_offers(self):
+        solution = offer_solver.solve([_line("A", 100)], [
+            _offer("A10", 10, offer_type="item_code", target="A"),
+            _offer("T10", 10, offer_type="grand_total"),
+        ])
+        self.assertEqual(solution["lines"][0]["offers"], ["A10"])
+        self.assertEqual(solution["transaction_offers"], [])
+
+    def test_memoized_solution_is_not_shared(self):
+        items = [_line("A", 100)]
+        offers = [_offer("A10", 10, offer_type="item_code", target="A")]
+        offer_solver.solve(items, offers)["lines"][0]["offers"].append("changed")
+        self.assertEqual(offer_solver.solve(items, offers)["lines"][0]["offers"], ["A10"])
+        self.assertEqual(len(offer_solver._memo), 1)
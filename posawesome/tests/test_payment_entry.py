@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from posawesome.api import payment_entry
+
+
+class TestPaymentEntries(FrappeTestCase):
+    def test_one_invoice_settled_with_two_modes_of_payment(self):
+        invoice = create_sales_invoice(qty=1, rate=100)
+
+        entries = payment_entry.create_payment_entries_for_invoices([{
+            "invoice_name": invoice.name,
+            "payments": [
+                {"mode_of_payment": "Cash", "account": "_Test Cash - _TC", "amount": 40},
+                {"mode_of_payment": "Wire Transfer", "account": "_Test Bank - _TC", "amount": 60},
+            ],
+        }])
+
+        self.assertEqual([flt(entry["paid_amount"]) for entry in entries], [40, 60])
+        # The second entry sees the outstanding amount left by the first one
+        self.assertEqual(
+            [flt(entry["references"][0]["outstanding_amount"]) for entry in entries], [100, 60])
+        self.assertEqual(flt(frappe.db.get_value("Sales Invoice", invoice.name, "outstanding_amount")), 0)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt
+from erpnext.accounts.doctype.sales_invoice.sales_invoice import make_sales_return
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+
+
+class TestReturnedBalances(FrappeTestCase):
+    def setUp(self):
+        # 5 x 100
+        self.invoice = create_sales_invoice(qty=5, rate=100)
+
+    def _make_return(self, qty, legacy=False):
+        return_doc = make_sales_return(self.invoice.name)
+        return_doc.items[0].qty = -qty
+        if legacy:
+            # Returns made before sales_invoice_item existed
+            return_doc.items[0].sales_invoice_item = None
+        return_doc.insert()
+        return_doc.submit()
+        return return_doc
+
+    def _balances(self):
+        return (
+            flt(frappe.db.get_value("Sales Invoice", self.invoice.name, "posa_returned_amount")),
+            flt(frappe.db.get_value("Sales Invoice Item", self.invoice.items[0].name, "posa_returned_qty")),
+        )
+
+    def test_submit_increments(self):
+        first = self._make_return(2)
+        self.assertEqual(self._balances(), (-first.grand_total, 2))
+
+        second = self._make_return(1)
+        self.assertEqual(self._balances(), (-first.grand_total - second.grand_total, 3))
+
+    def test_cancel_releases(self):
+        first = self._make_return(2)
+        second = self._make_return(1)
+
+        first.cancel()
+        self.assertEqual(self._balances(), (-second.grand_total, 1))
+
+        second.cancel()
+        self.assertEqual(self._balances(), (0, 0))
+
+    def test_legacy_return_row_books_on_the_first_row_of_the_item(self):
+        return_doc = self._make_return(2, legacy=True)
+        self.assertEqual(self._balances(), (-return_doc.grand_total, 2))
+
+        return_doc.cancel()
+        self.assertEqual(self._balances(), (0, 0))
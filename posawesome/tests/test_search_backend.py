@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from posawesome.api import search_backend
+from posawesome.api.redis_utils import BuildWriter
+
+
+class TestCustomerNgramIndex(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for customer_name in ("_Test POSA Qzxw Customer", "_Test POSA Other Customer"):
+            if not frappe.db.exists("Customer", customer_name):
+                frappe.get_doc({
+                    "doctype": "Customer",
+                    "customer_name": customer_name,
+                    "customer_group": "All Customer Groups",
+                    "territory": "All Territories",
+                }).insert()
+        search_backend.rebuild_ngram_index("Customer")
+
+    def test_substring_match(self):
+        self.assertEqual(search_backend.match_names("Customer", "qzxw"), ["_Test POSA Qzxw Customer"])
+        self.assertEqual(search_backend.match_names("Customer", "qzx qzxw"), [])
+
+    def test_too_broad_search_falls_back(self):
+        with patch.object(search_backend, "NGRAM_CANDIDATE_LIMIT", 1):
+            self.assertIsNone(search_backend.match_names("Customer", "_test posa"))
+
+    def test_change_during_rebuild_is_replayed(self):
+        flush = BuildWriter.flush
+
+        def flush_then_rename(writer):
+            # Saved while the rebuild runs: the rebuild read the old name
+            frappe.db.set_value("Customer", "_Test POSA Other Customer", "customer_name", "Posa Wqzyx")
+            search_backend.on_customer_change(frappe.get_doc("Customer", "_Test POSA Other Customer"), "on_update")
+            flush(writer)
+
+        with patch.object(BuildWriter, "flush", flush_then_rename):
+            search_backend.rebuild_ngram_index("Customer")
+
+        self.assertEqual(search_backend.match_names("Customer", "wqzyx"), ["_Test POSA Other Customer"])
+        self.assertTrue(search_backend._ngram_exists("Customer"))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, Youssef Restom and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from posawesome.api import shift_totals
+from posawesome.api.redis_utils import make_key as _key, pipeline as _pipe
+
+
+SHIFT = "_Test POSA Shift Totals"
+PROFILE = "_Test POSA Profile"
+
+
+class TestShiftTotals(FrappeTestCase):
+    def setUp(self):
+        self._clear()
+        # Totals of _calculate_payment_totals(), changed by the tests as invoices "post"
+        self.sql_totals = {"Cash": 100.0, "Card": 50.0}
+        patchers = [
+            patch.object(shift_totals, "_recompute", side_effect=lambda *args: dict(self.sql_totals)),
+            patch.object(shift_totals, "_get_cash_mode_of_payment", return_value="Cash"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._clear()
+
+    def _clear(self):
+        for flag in shift_totals.SHIFT_TOTALS_FLAGS:
+            frappe.flags.pop(flag, None)
+        _pipe().delete(_key(shift_totals.TOTALS_KEY.format(SHIFT)),
+                       _key(shift_totals.GENERATION_KEY.format(SHIFT))).execute()
+
+    def _submit_invoice(self, payments, change_amount=0, method="on_submit"):
+        # Hook of the invoice transaction (deltas queued until commit)
+        shift_totals.on_sales_invoice_change(frappe._dict(
+            posa_pos_opening_shift=SHIFT,
+            change_amount=change_amount,
+            payments=[frappe._dict(mode_of_payment=mode, amount=amount) for mode, amount in payments.items()],
+        ), method)
+
+    def _post_invoice(self, payments, change_amount=0, method="on_submit"):
+        self._submit_invoice(payments, change_amount, method)
+        shift_totals._flush_deltas()
+
+    def _reconcile(self):
+        with patch.object(frappe, "get_all", return_value=[frappe._dict(name=SHIFT, pos_profile=PROFILE)]):
+            shift_totals.reconcile_open_shifts()
+
+    def test_cold_ledger_is_seeded(self):
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), self.sql_totals)
+        self.sql_totals["Cash"] = 999
+        # Keyed read of the ledger, not a recompute
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), {"Cash": 100.0, "Card": 50.0})
+
+    def test_deltas_follow_submit_and_cancel(self):
+        shift_totals.get_shift_totals(SHIFT, PROFILE)
+
+        # 30 paid in cash with 5 change, 20 by card
+        self._post_invoice({"Cash": 30, "Card": 20}, change_amount=5)
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), {"Cash": 125.0, "Card": 70.0})
+
+        self._post_invoice({"Cash": 30, "Card": 20}, change_amount=5, method="on_cancel")
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), {"Cash": 100.0, "Card": 50.0})
+
+    def test_matching_ledger_is_kept_by_reconcile(self):
+        shift_totals.get_shift_totals(SHIFT, PROFILE)
+        self._post_invoice({"Card": 20})
+        self.sql_totals["Card"] = 70.0
+
+        with patch.object(frappe, "log_error") as log_error:
+            self._reconcile()
+        log_error.assert_not_called()
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), self.sql_totals)
+
+    def test_drifted_ledger_is_reseeded_by_reconcile(self):
+        shift_totals.get_shift_totals(SHIFT, PROFILE)
+        # Posted without going through the hooks (e.g. a direct database fix)
+        self.sql_totals.update({"Cash": 80.0, "Bank Transfer": 15.0})
+
+        with patch.object(frappe, "log_error") as log_error:
+            self._reconcile()
+        log_error.assert_called_once()
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), self.sql_totals)
+
+    def test_delta_during_seed_discards_the_seed(self):
+        def recompute(*args):
+            # An invoice of the shift is submitted while the shift is recomputed
+            self._post_invoice({"Cash": 10})
+            return dict(self.sql_totals)
+
+        with patch.object(shift_totals, "_recompute", side_effect=recompute):
+            shift_totals.seed_shift_totals(SHIFT, PROFILE)
+
+        self.sql_totals["Cash"] = 110.0
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), self.sql_totals)
+
+    def test_seed_between_commit_and_flush_drops_the_ledger(self):
+        shift_totals.get_shift_totals(SHIFT, PROFILE)
+        self._submit_invoice({"Cash": 10})
+
+        # The invoice is committed; another worker seeds before its after-commit flush
+        self.sql_totals["Cash"] = 110.0
+        shift_totals.seed_shift_totals(SHIFT, PROFILE)
+        shift_totals._flush_deltas()
+
+        # Counted once
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), {"Cash": 110.0, "Card": 50.0})
+
+    def test_rolled_back_deltas_are_discarded(self):
+        shift_totals.get_shift_totals(SHIFT, PROFILE)
+        self._submit_invoice({"Cash": 10})
+        frappe.db.rollback()
+
+        # Later transaction of the same request
+        self._post_invoice({"Card": 20})
+        self.assertEqual(shift_totals.get_shift_totals(SHIFT, PROFILE), {"Cash": 100.0, "Card": 70.0})